@@ -1,19 +1,23 @@
 import os
 import re
 import json
-import base64
-from io import BytesIO
-from typing import Dict, List
-from pdf2image import convert_from_path
-from groq import Groq
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Tuple
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from PIL import Image
 from bson.objectid import ObjectId
 from datetime import datetime
 import time
 from dotenv import load_dotenv
-from groq import Groq
+
+import answer_segmenter
+import image_prep
+import llm_gateway
+import metrics
 
 
 
@@ -28,8 +32,44 @@ DATABASE_NAME = os.getenv("MONGO_DB_NAME", "smart")
 COLLECTION_NAME = "studentuploads"
 GROQ_API_KEY_OCR  = os.getenv("GROQ_API_KEY_OCR")
 GROQ_API_KEY_ROLL = os.getenv("GROQ_API_KEY_ROLL")
+# Pages rendered and OCR'd before the roll number has to be verified (the header page is
+# normally page 1); the rest of the script is only rendered and OCR'd after a match.
+ROLL_HEADER_SCAN_PAGES = int(os.getenv("ROLL_HEADER_SCAN_PAGES", "2"))
+# "separate" = OCR call + dedicated roll-number call per header page; "combined" = one JSON-mode
+# vision call returns page text, header flag and roll number (the roll call only runs when that
+# roll number fails validation).
+HEADER_EXTRACTION_MODE = os.getenv("HEADER_EXTRACTION_MODE", "separate").strip().lower()
+# "single-pass" = one scan for question headings (answer_segmenter.segment); "regex-chain" = the
+# original five re.sub passes. Both return the same answers.
+SEGMENTER = os.getenv("SEGMENTER", "single-pass").strip().lower()
+# Batch mode (process_student_uploads, POST /process-student-uploads): scripts processed at once
+# (each reads its own header pages), concurrent OCR calls for the pages after the header (one
+# executor shared by all scripts), and extractedAnswer updates per bulk write.
+STUDENT_BATCH_WORKERS = int(os.getenv("STUDENT_BATCH_WORKERS", "4"))
+STUDENT_BATCH_OCR_WORKERS = int(os.getenv("STUDENT_BATCH_OCR_WORKERS", "8"))
+STUDENT_BATCH_WRITE_SIZE = int(os.getenv("STUDENT_BATCH_WRITE_SIZE", "50"))
 # ────────────────────────────────────────────────────────────────── #
 
+# One MongoClient (thread-safe, pooled) for every Student in the process.
+mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+
+def get_mongo_client() -> MongoClient:
+    global mongo_client
+    with _mongo_client_lock:
+        if mongo_client is None:
+            client = MongoClient(
+                MONGO_CONNECTION_STRING,
+                serverSelectionTimeoutMS=5_000,
+                connectTimeoutMS=30_000,
+                socketTimeoutMS=30_000,
+            )
+            client.admin.command("ping")
+            mongo_client = client
+        return mongo_client
+
+
 class Student:
     """
     Process a student-uploaded answer-script PDF:
@@ -38,7 +78,10 @@ class Student:
       • update the Mongo record only on a match
     """
 
-    def __init__(self, student_upload_id: str | None = None):
+    def __init__(self, student_upload_id: str | None = None, upload_doc: Dict | None = None,
+                 ocr_pool: ThreadPoolExecutor | None = None):
+        # upload_doc: the studentuploads document when the caller already fetched it (batch mode).
+        # ocr_pool: executor shared by several scripts for the pages after the header.
         self.student_upload_id = student_upload_id
         self.mongo_client  = None
         self.db            = None
@@ -53,36 +96,34 @@ class Student:
         self.pdf_path      = None
 
         self.expected_roll_no = None     
+        self._ocr_pool = ocr_pool
 
         self.initialize_clients()
-        self.load_exam_metadata()
+        self.load_exam_metadata(upload_doc)
 
     # ───────────────────────── Initialisation ───────────────────────── #
 
     def initialize_clients(self):
         try:
-            self.mongo_client = MongoClient(
-                MONGO_CONNECTION_STRING,
-                serverSelectionTimeoutMS=5_000,
-                connectTimeoutMS=30_000,
-                socketTimeoutMS=30_000,
-            )
-            self.mongo_client.admin.command("ping")
+            self.mongo_client = get_mongo_client()
             self.db         = self.mongo_client[DATABASE_NAME]
             self.collection = self.db[COLLECTION_NAME]
             print("✔ Connected to MongoDB.")
 
-            self.ocr_client  = Groq(api_key=GROQ_API_KEY_OCR)
-            self.roll_client = Groq(api_key=GROQ_API_KEY_ROLL)
+            # Pooled clients shared by every Student in the process (see llm_gateway.py)
+            self.ocr_client  = llm_gateway.get_client(GROQ_API_KEY_OCR)
+            self.roll_client = llm_gateway.get_client(GROQ_API_KEY_ROLL)
             print("✔ Connected to Groq API.")
         except PyMongoError as e:
             raise ConnectionError(f"MongoDB connection failed: {e}")
         except Exception as e:
             raise RuntimeError(f"Client initialization failed: {e}")
 
-    def load_exam_metadata(self):
+    def load_exam_metadata(self, doc: Dict | None = None):
         try:
-            if self.student_upload_id:
+            if doc is not None:
+                print(f"Using fetched document ID: {doc.get('_id')}")
+            elif self.student_upload_id:
                 print(f"Fetching document ID: {self.student_upload_id}")
                 doc = self.collection.find_one({"_id": ObjectId(self.student_upload_id)})
             else:
@@ -134,14 +175,6 @@ class Student:
 
     # ───────────────────────── Utility helpers ───────────────────────── #
 
-    @staticmethod
-    def encode_image(img: Image.Image) -> str:
-        buf = BytesIO()
-        img.save(buf, format="JPEG")
-        b64 = base64.b64encode(buf.getvalue()).decode()
-        buf.close()
-        return b64
-
     @staticmethod
     def correct_roll_number(raw: str) -> str:
         if not raw:
@@ -151,47 +184,146 @@ class Student:
         remaining = re.sub(r"\D", "", raw[1:])
         return (corrected_first + remaining)[:9]
 
+    @staticmethod
+    def valid_roll_number(raw: str) -> str:
+        """Corrected roll number if it has the expected 9-digit form, else ""."""
+        roll_no = Student.correct_roll_number(raw)
+        return roll_no if re.fullmatch(r"[1-4]\d{8}", roll_no) else ""
+
+    @staticmethod
+    def parse_header_reply(raw_reply: str) -> Dict | None:
+        """{page_text, is_first_page, roll_number} from a header-extraction JSON reply, or None."""
+        try:
+            data = json.loads(raw_reply)
+        except (TypeError, json.JSONDecodeError):
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("page_text"), str):
+            return None
+        flag = data.get("is_first_page")
+        return {
+            "page_text":     data["page_text"].strip(),
+            "is_first_page": flag is True or str(flag).strip().lower() == "true",
+            "roll_number":   str(data.get("roll_number") or "").strip(),
+        }
+
     # ───────────────────────── OCR wrappers ───────────────────────── #
 
-    def extract_text_from_image(self, img: Image.Image) -> str:
-        b64 = self.encode_image(img)
-        rsp = self.ocr_client.chat.completions.create(
+    @staticmethod
+    def ocr_image_url(image_url: str) -> str:
+        """Raw page text from the vision model for a prepared image (image_prep.data_url)."""
+        return llm_gateway.chat_completion(
+            GROQ_API_KEY_OCR,
             model="meta-llama/llama-4-scout-17b-16e-instruct",
             messages=[
                 {"role":"user","content":[
                     {"type":"text","text":"Extract the exact text from this image without changing formatting."},
-                    {"type":"image_url","image_url":{"url":f"data:image/jpeg;base64,{b64}"}}
+                    {"type":"image_url","image_url":{"url":image_url}}
                 ]},
                 {"role":"user","content":"Don't analyze or summarize. Just output the raw text as it appears."}
             ],
             temperature=0.2,
             max_tokens=2048,
         )
-        if not rsp.choices:
-            raise RuntimeError("Groq OCR returned no choices.")
-        return rsp.choices[0].message.content.strip()
 
-    def extract_roll_number(self, img: Image.Image) -> str:
-        b64 = self.encode_image(img)
-        rsp = self.roll_client.chat.completions.create(
+    @staticmethod
+    def read_roll_number(image_url: str) -> str:
+        """Raw (uncorrected) roll-number reply of the vision model for a prepared image."""
+        return llm_gateway.chat_completion(
+            GROQ_API_KEY_ROLL,
             model="meta-llama/llama-4-scout-17b-16e-instruct",
             messages=[
                 {"role":"user","content":[
                     {"type":"text","text":"Extract only the 9-digit roll number from this image."},
-                    {"type":"image_url","image_url":{"url":f"data:image/jpeg;base64,{b64}"}}
+                    {"type":"image_url","image_url":{"url":image_url}}
                 ]},
                 {"role":"user","content":"Return only the digits with no extra text."}
             ],
             temperature=0.1,
             max_tokens=100,
         )
-        if not rsp.choices:
-            raise RuntimeError("Groq roll-number OCR returned no choices.")
-        raw = rsp.choices[0].message.content.strip()
-        roll_no = self.correct_roll_number(raw)
-        if not re.fullmatch(r"[1-4]\d{8}", roll_no):
-            raise ValueError(f"OCR roll number invalid: '{raw}' → '{roll_no}'")
-        return roll_no
+
+    def extract_text_from_image(self, img: Image.Image) -> str:
+        with metrics.timer("ocr", engine="groq_vision"):
+            return self.ocr_image_url(image_prep.data_url(img))
+
+    def extract_roll_number(self, img: Image.Image) -> str:
+        with metrics.timer("roll_extraction"):
+            cropped = image_prep.header_crop_enabled()
+            raw = self.read_roll_number(image_prep.data_url(img, header_only=cropped))
+            roll_no = self.valid_roll_number(raw)
+            if not roll_no and cropped:
+                # The roll-number box may sit lower on some cover pages.
+                print(f"⚠ No valid roll number in the header crop ('{raw}'); retrying with the full page.")
+                metrics.increment("roll_crop_fallbacks")
+                raw = self.read_roll_number(image_prep.data_url(img))
+                roll_no = self.valid_roll_number(raw)
+            if not roll_no:
+                raise ValueError(f"OCR roll number invalid: '{raw}' → '{self.correct_roll_number(raw)}'")
+            return roll_no
+
+    def extract_header(self, img: Image.Image) -> Dict | None:
+        """
+        Page text, header-page flag and roll number from one JSON-mode vision call.
+        None when the call fails or the reply does not parse (caller OCRs the page as usual).
+        """
+        with metrics.timer("header_extraction"):
+            image_url = image_prep.data_url(img)
+            try:
+                raw = llm_gateway.chat_completion(
+                    GROQ_API_KEY_OCR,
+                    model="meta-llama/llama-4-scout-17b-16e-instruct",
+                    messages=[
+                        {"role":"user","content":[
+                            {"type":"text","text":(
+                                "Extract the exact text from this image without changing formatting, and return "
+                                "a JSON object with exactly these keys:\n"
+                                '"page_text": the raw text as it appears (don\'t analyze or summarize),\n'
+                                '"is_first_page": true if this is an answer-script cover page (roll number, degree, '
+                                "department, semester, course code, date of examination), else false,\n"
+                                '"roll_number": only the digits of the 9-digit roll number, or "" if there is none.'
+                            )},
+                            {"type":"image_url","image_url":{"url":image_url}}
+                        ]},
+                    ],
+                    temperature=0.1,
+                    max_tokens=2048,
+                    response_format={"type": "json_object"},
+                )
+            except Exception as e:
+                print(f"⚠ Header extraction call failed ({e}); using separate OCR.")
+                metrics.increment("header_extraction_fallbacks", reason="error")
+                return None
+        header = self.parse_header_reply(raw)
+        if header is None:
+            print("⚠ Header extraction reply did not parse; using separate OCR.")
+            metrics.increment("header_extraction_fallbacks", reason="invalid")
+        return header
+
+    def read_page(self, img: Image.Image, want_header: bool) -> Tuple[str, Dict | None]:
+        """
+        (page text, header) for one page. With want_header in combined mode the text comes
+        from extract_header; otherwise (or if that fails) from plain OCR and header is None.
+        """
+        header = self.extract_header(img) if want_header and HEADER_EXTRACTION_MODE == "combined" else None
+        if header is not None:
+            return header["page_text"], header
+        return self.extract_text_from_image(img), None
+
+    def is_header_page(self, text: str, header: Dict | None) -> bool:
+        # Keyword check as before; the model's flag counts only with a valid roll number.
+        if self.is_first_page(text):
+            return True
+        return bool(header and header["is_first_page"] and self.valid_roll_number(header["roll_number"]))
+
+    def roll_number_for_page(self, img: Image.Image, header: Dict | None) -> str:
+        """Roll number from the combined header reply if it validates, else the dedicated roll call."""
+        if header is not None:
+            roll_no = self.valid_roll_number(header["roll_number"])
+            if roll_no:
+                return roll_no
+            print(f"⚠ Header roll number '{header['roll_number']}' invalid; using dedicated roll call.")
+            metrics.increment("header_roll_fallbacks")
+        return self.extract_roll_number(img)
 
     # ───────────────────────── Page helpers ───────────────────────── #
 
@@ -203,90 +335,115 @@ class Student:
     @staticmethod
     def segment_answers(text: str) -> List[Dict]:
         """
-        Normalize various answer/question heading formats into 'Answer <id>\n' and extract answers.
+        Split the script text into answers at question headings.
         Supports formats like: Q2, Answer-3a, 4b), 5. and even bare 6 headings.
         """
-        # Normalize full labels like "Answer 1", "Q-3", etc.
-        text = re.sub(
-            r"(?i)\b(?:answer|ans|question|ques|q|solution)[\s\-]*([0-9]+[a-z]?)\b[\.\):]?",
-            r"Answer \1\n", text
-        )
-
-        # Normalize sub-question formats like "2a)", "4f)"
-        text = re.sub(
-            r"\b([0-9]+[a-z])\)", r"Answer \1\n", text, flags=re.IGNORECASE
-        )
-
-        # Normalize "1." or "3a." style
-        text = re.sub(r"\b([0-9]+[a-z]?)\.\s", r"Answer \1\n", text)
-        text = re.sub(r"\b([0-9]+[a-z]?)\)\s", r"Answer \1\n", text)
-
-        # ✅ New: Normalize bare numbers at start of line like "3 Context..."
-        text = re.sub(r"(?m)^\s*([0-9]+[a-z]?)\s", r"Answer \1\n", text)
+        with metrics.timer("segmentation"):
+            if SEGMENTER == "regex-chain":
+                return answer_segmenter.segment_regex_chain(text)
+            return answer_segmenter.segment(text)
 
-        # Segment answers
-        pattern = re.compile(r"Answer\s+([0-9]+[a-z]?)\s*\n", flags=re.IGNORECASE)
-        matches = list(pattern.finditer(text))
-        if not matches:
-            raise ValueError("No answer markers found after normalization.")
+    @staticmethod
+    def new_segmenter():
+        """Page-by-page segmenter: feed(page_text) → answers completed so far, close() → the rest."""
+        if SEGMENTER == "regex-chain":
+            return answer_segmenter.BufferedSegmenter(answer_segmenter.segment_regex_chain)
+        return answer_segmenter.IncrementalSegmenter()
 
+    @staticmethod
+    def segment_pages(pages: Iterable[str]) -> List[Dict]:
+        """
+        segment_answers of the pages joined by newlines. Each page is segmented as it arrives, so
+        with a lazy iterable (pages OCR'd on demand) segmentation overlaps OCR and the page texts
+        are not all held.
+        """
+        segmenter = Student.new_segmenter()
         answers = []
-        for i, m in enumerate(matches):
-            q_id = m.group(1)
-            start = m.end()
-            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-            answer_text = text[start:end].strip()
-            if answer_text:
-                answers.append({"question_id": q_id, "answer_text": answer_text})
-
-        return answers
+        for text in pages:
+            with metrics.timer("segmentation"):
+                answers += segmenter.feed(text)
+        with metrics.timer("segmentation"):
+            return answers + segmenter.close()
 
     # ───────────────────────── Core pipeline ───────────────────────── #
 
-    def convert_pdf_to_images(self) -> List[Image.Image]:
+    def count_pages(self) -> int:
         try:
-            pages = convert_from_path(self.pdf_path)
-            if not pages:
-                raise RuntimeError("PDF→image conversion produced no pages.")
-            print(f"✔ Converted PDF to {len(pages)} images.")
+            return int(pdfinfo_from_path(self.pdf_path)["Pages"])
+        except Exception as e:
+            raise RuntimeError(f"pdfinfo_from_path failed: {e}")
+
+    def render_pages(self, first_page: int, last_page: int) -> List[Image.Image]:
+        """Renders pages first_page..last_page (1-based, inclusive)."""
+        try:
+            with metrics.timer("pdf_render"):
+                pages = convert_from_path(self.pdf_path, first_page=first_page, last_page=last_page)
+            metrics.increment("pages_rendered", len(pages))
             return pages
         except Exception as e:
             raise RuntimeError(f"convert_from_path failed: {e}")
-        
 
+    def verify_roll_number(self, roll_no: str):
+        if roll_no != self.expected_roll_no:
+            raise ValueError(
+                f"Roll-number mismatch: OCR='{roll_no}' vs username='{self.expected_roll_no}'. "
+                "Aborting further processing."
+            )
 
     def process_pdf(self) -> Dict:
-        pages = self.convert_pdf_to_images()
+        total_pages = self.count_pages()
+        if not total_pages:
+            raise RuntimeError("PDF→image conversion produced no pages.")
         roll_no = ""
-        answer_pages_text = []
-
-        for i, img in enumerate(pages):
-            print(f"▸ OCR page {i+1}/{len(pages)}")
-            text = self.extract_text_from_image(img)
-
-            if self.is_first_page(text) and not roll_no:
-                try:
-                    roll_no = self.extract_roll_number(img)
-                    print(f"✔ Detected roll number on page {i+1}: {roll_no}")
-                except Exception as e:
-                    print(f"⚠ Roll extraction failed on page {i+1}: {e}")
-                    answer_pages_text.append(text)
-            else:
-                answer_pages_text.append(text)
+        segmenter = self.new_segmenter()
+        answers, answer_pages = [], 0
+
+        def add_answer_page(text: str) -> None:
+            nonlocal answer_pages
+            answer_pages += 1
+            with metrics.timer("segmentation"):
+                answers.extend(segmenter.feed(text))
+
+        # Header first: the roll number is verified as soon as it is read, so a wrong
+        # script costs one OCR + one roll call instead of an OCR call per page.
+        header_pages = min(max(ROLL_HEADER_SCAN_PAGES, 1), total_pages)
+        batches = [(1, header_pages)]
+        if total_pages > header_pages:
+            batches.append((header_pages + 1, total_pages))
+
+        for first_page, last_page in batches:
+            images = self.render_pages(first_page, last_page)
+            if roll_no and self._ocr_pool is not None:
+                # Roll number verified: the rest is plain OCR on the shared executor, segmented in page order.
+                futures = [self._ocr_pool.submit(contextvars.copy_context().run, self.extract_text_from_image, img)
+                           for img in images]
+                for i, future in enumerate(futures, start=first_page):
+                    add_answer_page(future.result())
+                    print(f"▸ OCR page {i}/{total_pages}")
+                continue
+            for i, img in enumerate(images, start=first_page - 1):
+                print(f"▸ OCR page {i+1}/{total_pages}")
+                text, header = self.read_page(img, want_header=not roll_no)
+
+                if not roll_no and self.is_header_page(text, header):
+                    try:
+                        roll_no = self.roll_number_for_page(img, header)
+                        print(f"✔ Detected roll number on page {i+1}: {roll_no}")
+                    except Exception as e:
+                        print(f"⚠ Roll extraction failed on page {i+1}: {e}")
+                        add_answer_page(text)
+                        continue
+                    self.verify_roll_number(roll_no)
+                else:
+                    add_answer_page(text)
 
         if not roll_no:
             raise ValueError("Roll number was not detected in any page.")
-        if not answer_pages_text:
+        if not answer_pages:
             raise ValueError("No answer pages detected.")
 
-        # >>> NEW – verify against username
-        if roll_no != self.expected_roll_no:
-            raise ValueError(
-                f"Roll-number mismatch: OCR='{roll_no}' vs username='{self.expected_roll_no}'. "
-                "Aborting further processing."
-            )
-
-        answers = self.segment_answers("\n".join(answer_pages_text))
+        with metrics.timer("segmentation"):
+            answers += segmenter.close()
         return {
             "course_code": self.course_code,
             "course_name": self.course_name,
@@ -334,6 +491,14 @@ class Student:
     # ───────────────────────── Public entry point ───────────────────────── #
 
     def process(self) -> bool:
+        with metrics.job("studentExtraction") as job_metrics:
+            success = self._process()
+        # None = answers were already extracted; keep the summary of the run that did it.
+        if success is not None and self.student_upload_id and self.collection is not None:
+            metrics.save_job_summary(self.collection, {"_id": ObjectId(self.student_upload_id)}, job_metrics)
+        return success
+
+    def _process(self) -> bool:
         try:
             print("\n=== Answer-extraction run started ===")
             print(f"Target Mongo document: {self.student_upload_id or 'latest'}")
@@ -354,4 +519,107 @@ class Student:
             print(f"⛔ Extraction aborted: {e}")
             import traceback
             traceback.print_exc()
-            return False
\ No newline at end of file
+            return False
+
+# ───────────────────────── Batch processing ───────────────────────── #
+
+def _extract_upload(doc: Dict, ocr_pool: ThreadPoolExecutor) -> Tuple[Dict | None, Dict, str | None]:
+    """(roll_no/answers or None on failure, metrics summary, error message or None) for one studentuploads document."""
+    upload_id = str(doc["_id"])
+    error = None
+    with metrics.job("studentExtraction") as job_metrics:
+        try:
+            student = Student(student_upload_id=upload_id, upload_doc=doc, ocr_pool=ocr_pool)
+            student_data = student.process_pdf()   # may raise on mismatch
+        except Exception as e:
+            print(f"⛔ Extraction aborted for {upload_id}: {e}")
+            student_data, error = None, str(e)
+    return student_data, job_metrics.summary(), error
+
+
+def _write_results(collection, ops: List[UpdateOne], op_ids: List[str], results: Dict[str, str]) -> None:
+    """Bulk-writes the queued updates; a failed answers write marks that upload failed, as update_student_record_in_db does."""
+    if not ops:
+        return
+    failed = set()
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        failed = {op_ids[err["index"]] for err in e.details.get("writeErrors", [])}
+        print(f"⛔ MongoDB bulk update failed for {len(failed)} upload(s): {e}")
+    except PyMongoError as e:
+        failed = set(op_ids)
+        print(f"⛔ MongoDB bulk update failed: {e}")
+    failed &= {i for i in op_ids if results[i] == "completed"}
+    if failed:
+        results.update((i, "failed") for i in failed)
+        try:
+            collection.update_many({"_id": {"$in": [ObjectId(i) for i in failed]}},
+                                   {"$set": {"extraction_status": "failed"}})
+        except PyMongoError as e:
+            print(f"⛔ MongoDB update failed: {e}")
+    print(f"✔ MongoDB: {len(ops) - len(failed)} upload record(s) updated")
+    ops.clear()
+    op_ids.clear()
+
+
+def process_student_uploads(student_upload_ids: List[str]) -> Dict[str, str]:
+    """
+    Processes many student uploads in one run: one metadata find ($in), STUDENT_BATCH_WORKERS scripts
+    at a time sharing the Mongo/Groq clients and one OCR executor, and extractedAnswer updates
+    bulk-written STUDENT_BATCH_WRITE_SIZE at a time (each with its processingMetrics summary).
+    Returns {id: "completed" | "failed" | "already_extracted" | "not_found" | "invalid_id"}.
+    """
+    results: Dict[str, str] = {}
+    object_ids = []
+    for upload_id in dict.fromkeys(student_upload_ids):
+        if ObjectId.is_valid(upload_id):
+            object_ids.append(ObjectId(upload_id))
+        else:
+            results[upload_id] = "invalid_id"
+    collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    docs = {str(d["_id"]): d for d in collection.find(
+        {"_id": {"$in": object_ids}},
+        {"subjectCode": 1, "subject": 1, "examType": 1, "year": 1, "username": 1, "filePath": 1, "extraction_status": 1},
+    )}
+    pending = []
+    for oid in object_ids:
+        doc = docs.get(str(oid))
+        if doc is None:
+            results[str(oid)] = "not_found"
+        elif doc.get("extraction_status") == "completed":
+            results[str(oid)] = "already_extracted"
+        else:
+            pending.append(doc)
+    print(f"\n=== Batch answer extraction: {len(pending)} of {len(results) + len(pending)} upload(s) to process ===")
+
+    ops: List[UpdateOne] = []
+    op_ids: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, STUDENT_BATCH_OCR_WORKERS)) as ocr_pool, \
+            ThreadPoolExecutor(max_workers=max(1, STUDENT_BATCH_WORKERS)) as script_pool:
+        futures = {script_pool.submit(contextvars.copy_context().run, _extract_upload, doc, ocr_pool): str(doc["_id"])
+                   for doc in pending}
+        for future in as_completed(futures):
+            upload_id = futures[future]
+            student_data, summary, error = future.result()
+            update = {"processingMetrics.studentExtraction": summary}
+            if student_data is not None:
+                update.update({"extraction_status": "completed",
+                               "extractedAnswer": {"answers": student_data["answers"]}})
+                results[upload_id] = "completed"
+            else:
+                update.update({"extraction_status": "failed",
+                               "extractedAnswer.error": error,
+                               "extractedAnswer.timestamp": datetime.utcnow()})
+                results[upload_id] = "failed"
+            ops.append(UpdateOne({"_id": ObjectId(upload_id)}, {"$set": update}))
+            op_ids.append(upload_id)
+            if len(ops) >= STUDENT_BATCH_WRITE_SIZE:
+                _write_results(collection, ops, op_ids, results)
+        _write_results(collection, ops, op_ids, results)
+
+    counts: Dict[str, int] = {}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"=== Batch answer extraction finished: {counts} ===")
+    return results
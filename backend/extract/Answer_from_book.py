@@ -1,5 +1,5 @@
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
 import sys
 import json
@@ -9,7 +9,6 @@ import pickle
 from typing import List, Dict, Union, Tuple, Any
 import subprocess # For calling question_parser.py
 
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 
@@ -18,7 +17,11 @@ import fitz # PyMuPDF for PDF processing (used for RAG book processing)
 # as that's handled by question_parser.py. They are still needed if the RAG book PDF
 # itself requires OCR, though extract_and_group_paragraphs uses fitz's text extraction.
 from dotenv import load_dotenv
-from groq import Groq
+import llm_gateway
+import metrics
+import embedding_service
+import book_chunker
+import rag_context
 
 from pymongo import MongoClient, UpdateOne
 from pymongo.errors import PyMongoError
@@ -41,6 +44,9 @@ PROFESSOR_COLLECTION_NAME = "professoruploads"
 QUESTION_PARSER_SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "question_parser.py")
 
 # --- RAG Configuration ---
+# "blocks": token-aware chunks over PyMuPDF blocks (book_chunker.py, RAG_CHUNK_* settings).
+# "lines": the original overlapping line windows (WINDOW_SIZE / STEP_SIZE).
+RAG_CHUNKER = os.getenv("RAG_CHUNKER", "blocks").strip().lower()
 WINDOW_SIZE = 15
 STEP_SIZE = 5
 MIN_PARAGRAPH_WORDS = 40
@@ -48,12 +54,23 @@ MODEL_NAME = 'all-MiniLM-L6-v2'
 EMBEDDING_BATCH_SIZE = 256
 SIMILARITY_THRESHOLD = 0.40 # For retrieving relevant paragraphs
 MAX_CONTEXT_PARAGRAPHS = 5 # Max paragraphs to use as context for LLM
+# Estimated LLM tokens of (deduplicated) book context per prompt. The balanced prompt treats
+# context as optional, so it gets only the best-ranked part of it.
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1200"))
+RAG_CONTEXT_TOKEN_BUDGET_BALANCED = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET_BALANCED", "600"))
 
 # --- LLM Configuration (Groq) ---
 GROQ_MODEL = "llama3-70b-8192"
 TEMP_FACTUAL = 0.1
 TEMP_BALANCED = 0.4
 TEMP_CREATIVE = 0.7
+# "separate": one completion per answer style (factual / balanced / creative).
+# "multi": all three styles from one JSON-mode completion, falling back to "separate"
+# for a question whose reply does not validate. Compare with benchmark_answer_modes.py.
+ANSWER_GENERATION_MODE = os.getenv("ANSWER_GENERATION_MODE", "separate").strip().lower()
+TEMP_MULTI = TEMP_BALANCED
+MULTI_ANSWER_KEYS = ("factual", "balanced", "creative")
+MULTI_ANSWER_MAX_TOKENS = 3072
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -77,8 +94,8 @@ def initialize_globals():
         print("Python Error (Answer_from_book): GROQ_API_KEY not set. Groq client will not be initialized.", file=sys.stderr)
     elif groq_client is None:
         try:
-            groq_client = Groq(api_key=GROQ_API_KEY)
-            print("Python (Answer_from_book): Groq client initialized.", file=sys.stderr)
+            groq_client = llm_gateway.get_client(GROQ_API_KEY)
+            print("Python (Answer_from_book): Groq client initialized (shared llm_gateway pool).", file=sys.stderr)
         except Exception as e:
             print(f"Python Error (Answer_from_book): Failed to initialize Groq client: {e}", file=sys.stderr)
             groq_client = None
@@ -98,9 +115,9 @@ def initialize_globals():
 
     if embedding_model_instance is None:
         try:
-            print(f"Python (Answer_from_book): Loading Sentence Transformer model '{MODEL_NAME}'...", file=sys.stderr)
-            embedding_model_instance = SentenceTransformer(MODEL_NAME)
-            print("Python (Answer_from_book): Sentence Transformer model loaded.", file=sys.stderr)
+            print(f"Python (Answer_from_book): Getting Sentence Transformer model '{MODEL_NAME}' (shared service or in-process)...", file=sys.stderr)
+            embedding_model_instance = embedding_service.get_encoder(MODEL_NAME)
+            print("Python (Answer_from_book): Sentence Transformer model ready.", file=sys.stderr)
         except Exception as e:
             print(f"Python Error (Answer_from_book): Failed to load Sentence Transformer model '{MODEL_NAME}': {e}", file=sys.stderr)
             embedding_model_instance = None
@@ -130,8 +147,12 @@ def sanitize_filename(filename_base: str, max_length: int = 100) -> str:
     return s[:max_length] if s else "untitled"
 
 def get_book_rag_cache_filenames(pdf_content_hash: str, window_size: int, step_size: int, min_words: int) -> Tuple[str, str]:
-    model_name_sanitized = MODEL_NAME.replace('/', '-')
-    cache_prefix = f"content_{pdf_content_hash}_w{window_size}_s{step_size}_m{min_words}_{model_name_sanitized}"
+    model_name_sanitized = embedding_service.encoder_tag(MODEL_NAME).replace('/', '-')
+    if RAG_CHUNKER == "lines":
+        cache_prefix = f"content_{pdf_content_hash}_w{window_size}_s{step_size}_m{min_words}_{model_name_sanitized}"
+    else:
+        cache_prefix = (f"content_{pdf_content_hash}_{book_chunker.CHUNKER_VERSION}_t{book_chunker.RAG_CHUNK_MAX_TOKENS}"
+                        f"_o{book_chunker.RAG_CHUNK_OVERLAP_TOKENS}_m{min_words}_{model_name_sanitized}")
     pickle_filename = f"{cache_prefix}_paras.pkl"
     faiss_filename = f"{cache_prefix}_index.faiss"
     return os.path.join(CACHE_DIR_BOOK_RAG, pickle_filename), os.path.join(CACHE_DIR_BOOK_RAG, faiss_filename)
@@ -141,16 +162,18 @@ def extract_and_group_paragraphs(pdf_path: str, window_size: int, step_size: int
     if not os.path.exists(pdf_path):
         print(f"Python Error (Answer_from_book): RAG book PDF not found at {pdf_path}", file=sys.stderr)
         return []
-    doc = fitz.open(pdf_path)
     cleaned_lines = []
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        lines_on_page = page.get_text("text").split('\n')
-        for line in lines_on_page:
-            line = line.strip()
-            if line and len(line.split()) > 1 and not line.isnumeric():
-                cleaned_lines.append(line)
-    doc.close()
+    with metrics.timer("pdf_text_extract"):
+        doc = fitz.open(pdf_path)
+        for page_num in range(len(doc)):
+            page = doc.load_page(page_num)
+            lines_on_page = page.get_text("text").split('\n')
+            for line in lines_on_page:
+                line = line.strip()
+                if line and len(line.split()) > 1 and not line.isnumeric():
+                    cleaned_lines.append(line)
+        metrics.increment("pages_rendered", len(doc))
+        doc.close()
 
     if not cleaned_lines: return []
     paragraphs = []
@@ -162,6 +185,19 @@ def extract_and_group_paragraphs(pdf_path: str, window_size: int, step_size: int
     print(f"Python (Answer_from_book): Generated {len(paragraphs)} RAG paragraphs for {os.path.basename(pdf_path)}.", file=sys.stderr)
     return paragraphs
 
+def build_rag_paragraphs(pdf_path: str, window_size: int, step_size: int, min_paragraph_words: int) -> List[str]:
+    """RAG paragraphs of the book with the configured chunker."""
+    if RAG_CHUNKER == "lines":
+        return extract_and_group_paragraphs(pdf_path, window_size, step_size, min_paragraph_words)
+    print(f"Python (Answer_from_book): Chunking RAG book PDF ({book_chunker.CHUNKER_VERSION}): {pdf_path}", file=sys.stderr)
+    if not os.path.exists(pdf_path):
+        print(f"Python Error (Answer_from_book): RAG book PDF not found at {pdf_path}", file=sys.stderr)
+        return []
+    count_tokens = book_chunker.get_token_counter(embedding_model_instance, MODEL_NAME)
+    paragraphs = book_chunker.chunk_pdf(pdf_path, count_tokens, min_words=min_paragraph_words)
+    print(f"Python (Answer_from_book): Generated {len(paragraphs)} RAG chunks for {os.path.basename(pdf_path)}.", file=sys.stderr)
+    return paragraphs
+
 def get_paragraphs_and_faiss_index(rag_pdf_path: str, window_size: int, step_size: int, min_paragraph_words: int, force_regenerate: bool = False) -> Tuple[List[str], Union[faiss.Index, None]]:
     if embedding_model_instance is None:
         print("Python Error (Answer_from_book): Embedding model not initialized. Cannot create FAISS index for RAG book.", file=sys.stderr)
@@ -188,7 +224,7 @@ def get_paragraphs_and_faiss_index(rag_pdf_path: str, window_size: int, step_siz
             print(f"Python (Answer_from_book): Error loading RAG Book cache ({e}). Regenerating...", file=sys.stderr)
 
     print(f"Python (Answer_from_book): Regenerating RAG context for book (hash: {pdf_content_hash[:10]}...)...", file=sys.stderr)
-    paragraphs = extract_and_group_paragraphs(rag_pdf_path, window_size, step_size, min_paragraph_words)
+    paragraphs = build_rag_paragraphs(rag_pdf_path, window_size, step_size, min_paragraph_words)
     if not paragraphs: return [], None
 
     embedding_dimension = embedding_model_instance.get_sentence_embedding_dimension()
@@ -198,7 +234,8 @@ def get_paragraphs_and_faiss_index(rag_pdf_path: str, window_size: int, step_siz
     for i in range(0, len(paragraphs), EMBEDDING_BATCH_SIZE):
         batch_paragraphs = paragraphs[i:i + EMBEDDING_BATCH_SIZE]
         try:
-            batch_vectors = embedding_model_instance.encode(batch_paragraphs, convert_to_numpy=True, show_progress_bar=False)
+            with metrics.timer("embedding", source="book"):
+                batch_vectors = embedding_model_instance.encode(batch_paragraphs, convert_to_numpy=True, show_progress_bar=False)
             if batch_vectors is not None and len(batch_vectors) > 0:
                 faiss.normalize_L2(batch_vectors)
                 faiss_index.add(batch_vectors.astype(np.float32))
@@ -219,21 +256,82 @@ def get_paragraphs_and_faiss_index(rag_pdf_path: str, window_size: int, step_siz
     return paragraphs, faiss_index
 
 # --- LLM Answer Generation ---
-def get_groq_llm_response(full_prompt: str, temperature: float) -> str:
+def get_groq_llm_response(full_prompt: str, temperature: float, usage_out: Union[Dict[str, Any], None] = None) -> str:
     if groq_client is None: return "Error: Groq client not initialized."
     try:
-        chat_completion = groq_client.chat.completions.create(
+        return llm_gateway.chat_completion(
+            GROQ_API_KEY,
             messages=[
                 {"role": "system", "content": "You are an AI assistant. Answer the user's question based on the provided information and instructions. Be concise and accurate."},
                 {"role": "user", "content": full_prompt}
             ],
-            model=GROQ_MODEL, temperature=temperature, max_tokens=1024,
+            model=GROQ_MODEL, temperature=temperature, max_tokens=1024, usage_out=usage_out,
+            use_cache=True,  # cached for the factual style only: the gateway skips it above LLM_CACHE_MAX_TEMPERATURE
         )
-        return chat_completion.choices[0].message.content.strip()
     except Exception as e:
         print(f"Python Error (Answer_from_book): Groq LLM communication error: {e}", file=sys.stderr)
         return f"Error: Groq LLM communication error: {str(e)}"
 
+def format_usage(usage: Dict[str, Any]) -> str:
+    return f"{usage.get('prompt_tokens', 0)}+{usage.get('completion_tokens', 0)}{' (cached)' if usage.get('cached') else ''}"
+
+def parse_multi_answers(raw_reply: str) -> Union[List[str], None]:
+    """[factual, balanced, creative] from a multi-answer JSON reply, or None if it does not validate."""
+    try:
+        data = json.loads(raw_reply)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    answers = [data.get(key) for key in MULTI_ANSWER_KEYS]
+    if not all(isinstance(a, str) and a.strip() for a in answers):
+        return None
+    return [a.strip() for a in answers]
+
+def generate_answers_single_call(question_text: str, context_text: str) -> Union[List[str], None]:
+    """All three answer styles from one JSON-mode completion; None (caller falls back) on any failure."""
+    if groq_client is None: return None
+    prompt = (
+        f"Context: {context_text or 'None available.'}\nQuestion: {question_text}\n\n"
+        "Write three answers to the question and return them as a JSON object with exactly these string keys:\n"
+        '"factual": answer factually based ONLY on the provided context. If context is \'None available\' or insufficient, state that.\n'
+        '"balanced": answer comprehensively, using the context if helpful and general knowledge if it is insufficient or not provided.\n'
+        '"creative": answer creatively using general knowledge.\n'
+        "Return only the JSON object."
+    )
+    usage: Dict[str, Any] = {}
+    try:
+        raw_reply = llm_gateway.chat_completion(
+            GROQ_API_KEY,
+            messages=[
+                {"role": "system", "content": "You are an AI assistant. Answer the user's question based on the provided information and instructions. Be concise and accurate. Reply with a single JSON object."},
+                {"role": "user", "content": prompt}
+            ],
+            model=GROQ_MODEL, temperature=TEMP_MULTI, max_tokens=MULTI_ANSWER_MAX_TOKENS,
+            response_format={"type": "json_object"}, usage_out=usage, use_cache=True,
+        )
+    except Exception as e:
+        print(f"Python Warning (Answer_from_book): Multi-answer call failed for '{question_text[:30]}...' ({e}); using separate calls.", file=sys.stderr)
+        metrics.increment("answer_multi_fallbacks", reason="error")
+        return None
+    answers = parse_multi_answers(raw_reply)
+    if answers is None:
+        print(f"Python Warning (Answer_from_book): Multi-answer reply for '{question_text[:30]}...' did not validate; using separate calls.", file=sys.stderr)
+        metrics.increment("answer_multi_fallbacks", reason="invalid")
+        return None
+    print(f"Python (Answer_from_book): Tokens for '{question_text[:30]}...' (multi): {format_usage(usage)}", file=sys.stderr)
+    return answers
+
+def generate_answers_separately(question_text: str, factual_context: str, balanced_context: str) -> List[str]:
+    """The three answer styles from three completions, each at its own temperature."""
+    usages = [{}, {}, {}]
+    ans_factual_rag = get_groq_llm_response(f"Context: {factual_context or 'None available.'}\nQuestion: {question_text}\nAnswer factually based ONLY on the provided context. If context is 'None available' or insufficient, state that.", TEMP_FACTUAL, usages[0])
+    ans_combined = get_groq_llm_response(f"Context (optional, use if helpful): {balanced_context or 'No specific context provided.'}\nQuestion: {question_text}\nAnswer comprehensively, using general knowledge if context is insufficient or not provided.", TEMP_BALANCED, usages[1])
+    ans_creative = get_groq_llm_response(f"Question: {question_text}\nAnswer creatively using general knowledge:", TEMP_CREATIVE, usages[2])
+    print(f"Python (Answer_from_book): Tokens for '{question_text[:30]}...' (factual/balanced/creative): "
+          + ", ".join(format_usage(u) for u in usages), file=sys.stderr)
+    return [ans_factual_rag, ans_combined, ans_creative]
+
 def process_single_question_item(question_item_data: Dict[str, Any], all_paragraphs: List[str], faiss_idx: Union[faiss.Index, None]):
     """
     Processes a single question item, generates three answers, and adds them to the item.
@@ -255,8 +353,10 @@ def process_single_question_item(question_item_data: Dict[str, Any], all_paragra
         question_item_data["Answers"] = answers_list
         return
 
-    query_vector = embedding_model_instance.encode([question_text], convert_to_numpy=True)
+    with metrics.timer("embedding", source="question"):
+        query_vector = embedding_model_instance.encode([question_text], convert_to_numpy=True)
     combined_context_for_llm = ""
+    balanced_context_for_llm = ""
     context_found_for_rag = False
 
     if faiss_idx and faiss_idx.ntotal > 0 and query_vector.ndim > 1:
@@ -264,21 +364,31 @@ def process_single_question_item(question_item_data: Dict[str, Any], all_paragra
         query_vector_float32 = query_vector.astype(np.float32)
         k_search = min(MAX_CONTEXT_PARAGRAPHS * 2, faiss_idx.ntotal)
         try:
-            scores, indices = faiss_idx.search(query_vector_float32, k=k_search)
-            relevant_paras_indices = [i for i, s_val in zip(indices[0], scores[0]) if i < len(all_paragraphs) and s_val >= SIMILARITY_THRESHOLD]
-            if relevant_paras_indices:
-                relevant_paras = [all_paragraphs[i] for i in relevant_paras_indices]
-                combined_context_for_llm = "\n\n---\n\n".join(relevant_paras[:MAX_CONTEXT_PARAGRAPHS])
-                context_found_for_rag = True
+            with metrics.timer("faiss_search"):
+                scores, indices = faiss_idx.search(query_vector_float32, k=k_search)
+            relevant_hits = [(int(i), float(s_val)) for i, s_val in zip(indices[0], scores[0]) if 0 <= i < len(all_paragraphs) and s_val >= SIMILARITY_THRESHOLD]
+            if relevant_hits:
+                context = rag_context.assemble_context(relevant_hits, all_paragraphs, RAG_CONTEXT_TOKEN_BUDGET, MAX_CONTEXT_PARAGRAPHS)
+                combined_context_for_llm = context["text"]
+                balanced_context_for_llm = rag_context.assemble_context(
+                    relevant_hits, all_paragraphs, RAG_CONTEXT_TOKEN_BUDGET_BALANCED, MAX_CONTEXT_PARAGRAPHS
+                )["text"]
+                context_found_for_rag = bool(combined_context_for_llm)
+                print(f"Python (Answer_from_book): Context for '{question_text[:30]}...': {context['chunks']} chunks -> "
+                      f"{context['spans']} spans, ~{context['tokens']} tokens (~{context['rawTokens']} before merging).", file=sys.stderr)
         except Exception as e:
             print(f"Python Error (Answer_from_book): FAISS search failed for '{question_text[:30]}...': {e}", file=sys.stderr)
     
     # Generate the three types of answers
-    ans_factual_rag = get_groq_llm_response(f"Context: {combined_context_for_llm if context_found_for_rag else 'None available.'}\nQuestion: {question_text}\nAnswer factually based ONLY on the provided context. If context is 'None available' or insufficient, state that.", TEMP_FACTUAL)
-    ans_combined = get_groq_llm_response(f"Context (optional, use if helpful): {combined_context_for_llm if context_found_for_rag else 'No specific context provided.'}\nQuestion: {question_text}\nAnswer comprehensively, using general knowledge if context is insufficient or not provided.", TEMP_BALANCED)
-    ans_creative = get_groq_llm_response(f"Question: {question_text}\nAnswer creatively using general knowledge:", TEMP_CREATIVE)
+    if not context_found_for_rag:
+        combined_context_for_llm = balanced_context_for_llm = ""
+    answers = None
+    if ANSWER_GENERATION_MODE == "multi":
+        answers = generate_answers_single_call(question_text, combined_context_for_llm)
+    if answers is None:
+        answers = generate_answers_separately(question_text, combined_context_for_llm, balanced_context_for_llm)
     
-    question_item_data["Answers"] = [ans_factual_rag, ans_combined, ans_creative]
+    question_item_data["Answers"] = answers
     # The original "marks" field from question_parser.py remains untouched.
     # No new "marks" are awarded or calculated here.
 
@@ -373,6 +483,18 @@ def get_parsed_questions_from_parser(question_paper_pdf_abs_path: str) -> Union[
 # --- Main Flask Endpoint ---
 @app.route('/process-professor-data', methods=['POST'])
 def process_professor_data_endpoint():
+    with metrics.job("answerGeneration") as job_metrics:
+        response = _process_professor_data()
+    professor_upload_id = (request.get_json(silent=True) or {}).get("professorUploadId")
+    if professor_collection_instance is not None and professor_upload_id and ObjectId.is_valid(professor_upload_id):
+        metrics.save_job_summary(professor_collection_instance, {"_id": ObjectId(professor_upload_id)}, job_metrics)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+def _process_professor_data():
     print("Python (Answer_from_book): Received request for /process-professor-data", file=sys.stderr)
     
     if (groq_client is None or 
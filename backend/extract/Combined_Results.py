@@ -6,25 +6,26 @@ generates individual marksheets for each, saves them to the Results collection,
 and then generates a combined class marksheet.
 Updates the professoruploads document with the status and combined report ID.
 """
+# Annotations stay unevaluated, so pd/np/Document types in signatures don't force the heavy imports.
+from __future__ import annotations
+
 import os
 # THIS MUST BE AT THE VERY TOP, BEFORE ANY OTHER IMPORTS
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 import json
+import hashlib
 import re
 import sys
 import traceback  # For printing full tracebacks
-from typing import Dict, List, Union, Any, Tuple
-import pandas as pd
-import numpy as np
+import csv
+from io import BytesIO, StringIO
+from typing import Dict, List, Union, Any, Tuple, Iterator
 from pymongo import MongoClient, UpdateOne, errors as PyMongoErrors
 from bson.objectid import ObjectId
 import gridfs
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT # Corrected import
+import metrics
+import embedding_service  # shared model process if running, else loads in-process
 import subprocess
 import argparse
 from datetime import datetime, timezone
@@ -44,52 +45,125 @@ except NameError:
 
 LOGO_IMAGE_PATH = os.path.join(PROJECT_ROOT_DIR, "backend", "logo", LOGO_IMAGE_FILENAME)
 
-OUTPUT_DIR_COMBINED = os.path.join(PROJECT_ROOT_DIR, "backend", "uploads", "generated_combined_marksheets_temp")
-os.makedirs(OUTPUT_DIR_COMBINED, exist_ok=True)
-
 INDIVIDUAL_RESULTS_BUCKET_NAME = "results_marksheets"
 CLASS_AGGREGATE_BUCKET_NAME = "class_aggregate_reports"
+# Marksheets are rendered in memory and streamed into GridFS; 1 MiB chunks keep
+# a typical marksheet in a single chunk document.
+GRIDFS_CHUNK_SIZE_BYTES = int(os.getenv("GRIDFS_CHUNK_SIZE_BYTES", str(1024 * 1024)))
 
 PROFESSOR_UPLOADS_COLLECTION_NAME = "professoruploads"
 RESULTS_COLLECTION_NAME = "Results"
+STUDENT_ANSWERS_COLLECTION_NAME = "professorstudentanswers" # Written per student by studentScripts.py
+STUDENT_ANSWERS_CURSOR_BATCH_SIZE = 50
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Bump whenever similarity aggregation or the embedding model changes: every stored
+# Results document is then treated as stale and re-scored. (SCORE_BANDS are hashed too.)
+SCORING_RULE_VERSION = "1"
 
 # ---------------------------------------------------------------------------
-# DATABASE CONNECTIONS
+# LAZY RESOURCES
+# Nothing heavy happens at import time (so `--help` starts instantly). Mongo is
+# connected by init_mongo(), pandas / numpy / scikit-learn / python-docx are
+# imported by load_scoring_modules(), and the embedding model is loaded by
+# get_embedding_model() -- each once, on first use. An unchanged class therefore
+# never loads the model at all.
 # ---------------------------------------------------------------------------
+client = None
+db = None
+professoruploads_collection = None
+results_collection = None
+student_answers_collection = None
+fs_individual_results_bucket = None
+fs_class_aggregate_bucket = None
+
+pd = np = cosine_similarity = None
+grade_dataframe = percentage_column = SCORE_BANDS = None
+Document = Inches = Pt = WD_PARAGRAPH_ALIGNMENT = None
+
+embedding_model = None
+
+
+def init_mongo() -> None:
+    global client, db, professoruploads_collection, results_collection, student_answers_collection
+    global fs_individual_results_bucket, fs_class_aggregate_bucket
+    if client is not None:
+        return
+    try:
+        print(f"INFO (CombinedResults): Connecting to MongoDB at {MONGO_CONNECTION_STRING}...", file=sys.stderr)
+        mongo_client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
+        mongo_client.admin.command('ping')
+        db = mongo_client[DATABASE_NAME]
+        professoruploads_collection = db[PROFESSOR_UPLOADS_COLLECTION_NAME]
+        results_collection = db[RESULTS_COLLECTION_NAME]
+        student_answers_collection = db[STUDENT_ANSWERS_COLLECTION_NAME]
+        fs_individual_results_bucket = gridfs.GridFSBucket(db, bucket_name=INDIVIDUAL_RESULTS_BUCKET_NAME, chunk_size_bytes=GRIDFS_CHUNK_SIZE_BYTES)
+        fs_class_aggregate_bucket = gridfs.GridFSBucket(db, bucket_name=CLASS_AGGREGATE_BUCKET_NAME, chunk_size_bytes=GRIDFS_CHUNK_SIZE_BYTES)
+        client = mongo_client
+        print(f"INFO (CombinedResults): Connected to MongoDB: db='{DATABASE_NAME}'", file=sys.stderr)
+    except PyMongoErrors.ServerSelectionTimeoutError as e: # More specific error
+        print(f"FATAL (CombinedResults): Could not connect to MongoDB (Timeout). Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except PyMongoErrors.ConnectionFailure as e:
+        print(f"FATAL (CombinedResults): Could not connect to MongoDB. Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"FATAL (CombinedResults): An unexpected error occurred during MongoDB setup. Error: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+
+
+def load_scoring_modules() -> None:
+    """Imports the scoring / rendering stack into this module's globals."""
+    global pd, np, cosine_similarity, grade_dataframe, percentage_column, SCORE_BANDS
+    global Document, Inches, Pt, WD_PARAGRAPH_ALIGNMENT
+    if pd is not None:
+        return
+    import numpy as np
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
+    from grading import grade_dataframe, percentage_column, SCORE_BANDS
+    from docx import Document
+    from docx.shared import Inches, Pt
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT # Corrected import
+
+
+def get_embedding_model():
+    global embedding_model
+    if embedding_model is not None:
+        return embedding_model
+    try:
+        embedding_model = embedding_service.get_encoder(EMBEDDING_MODEL_NAME)
+        print("INFO (CombinedResults): Sentence embedding model ready.", file=sys.stderr)
+    except Exception as e:
+        print(f"FATAL (CombinedResults): Could not get sentence embedding model. Error: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+    return embedding_model
 
 
-try:
-    print(f"INFO (CombinedResults): Connecting to MongoDB at {MONGO_CONNECTION_STRING}...", file=sys.stderr)
-    client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-    client.admin.command('ping')
-    db = client[DATABASE_NAME]
-    professoruploads_collection = db[PROFESSOR_UPLOADS_COLLECTION_NAME]
-    results_collection = db[RESULTS_COLLECTION_NAME]
-    fs_individual_results_bucket = gridfs.GridFS(db, collection=INDIVIDUAL_RESULTS_BUCKET_NAME)
-    fs_class_aggregate_bucket = gridfs.GridFS(db, collection=CLASS_AGGREGATE_BUCKET_NAME)
-    print(f"INFO (CombinedResults): Connected to MongoDB: db='{DATABASE_NAME}'", file=sys.stderr)
-except PyMongoErrors.ServerSelectionTimeoutError as e: # More specific error
-    print(f"FATAL (CombinedResults): Could not connect to MongoDB (Timeout). Error: {e}", file=sys.stderr)
-    sys.exit(1)
-except PyMongoErrors.ConnectionFailure as e:
-    print(f"FATAL (CombinedResults): Could not connect to MongoDB. Error: {e}", file=sys.stderr)
-    sys.exit(1)
-except Exception as e:
-    print(f"FATAL (CombinedResults): An unexpected error occurred during MongoDB setup. Error: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
+def compute_fingerprint(payload: Any) -> str:
+    """Stable SHA-256 of a JSON-serialisable payload (keys sorted)."""
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def student_answers_fingerprint(student_data: Dict[str, Any]) -> str:
+    answers = student_data.get("answers", [])
+    if not isinstance(answers, list):
+        answers = []
+    return compute_fingerprint([
+        [str(a.get("question_no", "")), str(a.get("answer_text", ""))] for a in answers if isinstance(a, dict)
+    ])
 
-# ---------------------------------------------------------------------------
-# EMBEDDING MODEL & HELPERS
-# ---------------------------------------------------------------------------
-try:
-    print("INFO (CombinedResults): Loading sentence embedding model 'all-MiniLM-L6-v2'...", file=sys.stderr)
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    print("INFO (CombinedResults): Sentence embedding model loaded.", file=sys.stderr)
-except Exception as e:
-    print(f"FATAL (CombinedResults): Could not load SentenceTransformer model. Error: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
+
+def answer_key_fingerprint(parsed_ref_answers: Dict[str, Any]) -> str:
+    return compute_fingerprint({
+        "questions": parsed_ref_answers.get("questions", []),
+        "scoringRuleVersion": SCORING_RULE_VERSION,
+        "scoreBands": SCORE_BANDS,
+        "embeddingModel": embedding_service.encoder_tag(EMBEDDING_MODEL_NAME),
+    })
 
 
 def normalize_qid(qid: Any) -> str:
@@ -116,7 +190,11 @@ def preprocess(text: str) -> str:
 
 def embed(text_to_embed: str) -> Union[np.ndarray, None]:
     processed_text = preprocess(text_to_embed)
-    return embedding_model.encode(processed_text, convert_to_numpy=True) if processed_text else None
+    if not processed_text:
+        return None
+    model = get_embedding_model()
+    with metrics.timer("embedding"):
+        return model.encode(processed_text, convert_to_numpy=True)
 
 
 def cos_sim(v1: Union[np.ndarray, None], v2: Union[np.ndarray, None]) -> float:
@@ -174,6 +252,43 @@ def build_reference_vectors(parsed_ref_answers: Dict[str, Any]) -> Dict[str, Lis
         ]
     return vector_cache
 
+def iter_students_for_upload(professor_upload_id: ObjectId) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the students of a professor upload one at a time.
+    Reads the per-student answers collection with a cursor; falls back to the
+    legacy `students` array embedded in the professoruploads document.
+    """
+    query = {"professorUploadId": professor_upload_id}
+    if student_answers_collection.count_documents(query, limit=1):
+        cursor = student_answers_collection.find(
+            query, {"roll_no": 1, "answers": 1, "studentMongoId": 1}
+        ).sort("roll_no", 1).batch_size(STUDENT_ANSWERS_CURSOR_BATCH_SIZE)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+        return
+
+    legacy_doc = professoruploads_collection.find_one({"_id": professor_upload_id}, {"students": 1})
+    legacy_students = (legacy_doc or {}).get("students", [])
+    if isinstance(legacy_students, list):
+        print(f"INFO (CombinedResults): Using legacy embedded 'students' array for {professor_upload_id}.", file=sys.stderr)
+        yield from legacy_students
+
+def find_ungraded_duplicates(professor_upload_id: ObjectId) -> List[Dict[str, Any]]:
+    """
+    Scripts stored under another student's roll number (studentScripts keeps them in `duplicates`
+    on a roll collision). They are not graded; returned so the run can report them.
+    """
+    duplicates = []
+    for doc in student_answers_collection.find(
+        {"professorUploadId": professor_upload_id, "rollCollision": True}, {"roll_no": 1, "duplicates.source": 1}
+    ):
+        for dup in doc.get("duplicates", []):
+            source = dup.get("source") or {}
+            duplicates.append({"rollNo": doc.get("roll_no"), "script": source.get("script"), "firstPage": source.get("firstPage")})
+    return duplicates
+
 # ---------------------------------------------------------------------------
 # SIMILARITY CALCULATION
 # ---------------------------------------------------------------------------
@@ -212,9 +327,6 @@ def calculate_similarity_for_student(
                     student_answers_by_primary_qid.setdefault(primary_qid, []).append(answer_text)
 
     # 3. Iterate through the PROFESSOR's questions, which is the source of truth.
-    def natural_sort_key(s: str) -> List[Union[int, str]]:
-        return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
-    
     sorted_prof_qids = sorted(normalized_max_marks_map.keys(), key=natural_sort_key)
 
     for prof_qid_normalized in sorted_prof_qids:
@@ -260,67 +372,152 @@ def calculate_similarity_for_student(
 
     df = pd.DataFrame(rows)
 
-    def score_rule(sim: float, max_m: int) -> int:
-        sim = float(sim) if sim is not None else 0.0
-        max_m = int(max_m) if max_m is not None else 0
-        if sim >= 0.90: pct = 1.00
-        elif sim >= 0.80: pct = 0.90
-        elif sim >= 0.70: pct = 0.75
-        elif sim >= 0.60: pct = 0.65
-        elif sim >= 0.50: pct = 0.60
-        elif sim >= 0.45: pct = 0.50
-        else: pct = 0.0
-        return int(round(pct * max_m))
-
-    df["score"] = df.apply(lambda r: score_rule(r["similarity"], r["max_marks"]), axis=1)
+    grade_dataframe(df)
     return df
 
+def natural_sort_key(s: str) -> List[Union[int, str]]:
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+# ---------------------------------------------------------------------------
+# CLASS SCORE MATRIX
+# ---------------------------------------------------------------------------
+class ClassScoreMatrix:
+    """
+    Students × questions integer score matrix for the combined class sheet.
+    Rows are preallocated (and grown by doubling) so adding a student is one
+    row assignment instead of a per-student DataFrame + concat + pivot.
+    """
+
+    def __init__(self, max_marks_map: Dict[str, int], expected_students: int = 64):
+        normalized = {normalize_qid(k): int(v or 0) for k, v in max_marks_map.items()}
+        # Same question set calculate_similarity_for_student scores (needs a leading number).
+        self.question_ids = np.array(
+            sorted((q for q in normalized if re.match(r'\d+', q)), key=natural_sort_key), dtype=object
+        )
+        self.max_marks = np.array([normalized[q] for q in self.question_ids], dtype=np.int64)
+        self._qid_to_col = {q: i for i, q in enumerate(self.question_ids)}
+        capacity = max(int(expected_students or 0), 1)
+        self.roll_nos = np.empty(capacity, dtype=object)
+        self.scores = np.zeros((capacity, len(self.question_ids)), dtype=np.int64)
+        self.count = 0
+        self._seen_rolls = set()
+
+    def add_student(self, roll_no: str, question_ids, scores) -> None:
+        """Adds one row; unknown question ids are ignored and missing ones stay 0. First entry per roll wins."""
+        if roll_no in self._seen_rolls:
+            print(f"WARN (CR): Duplicate roll_no {roll_no} in class sheet. Keeping first entry.", file=sys.stderr)
+            return
+        if self.count == len(self.roll_nos):
+            self.roll_nos = np.concatenate([self.roll_nos, np.empty(len(self.roll_nos), dtype=object)])
+            self.scores = np.vstack([self.scores, np.zeros_like(self.scores)])
+        row = self.scores[self.count]
+        for qid, score in zip(question_ids, scores):
+            col = self._qid_to_col.get(qid)
+            if col is not None:
+                row[col] = int(score or 0)
+        self.roll_nos[self.count] = roll_no
+        self._seen_rolls.add(roll_no)
+        self.count += 1
+
+    def table(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns (column headers, roll_nos, scores, totals, percentages) sorted by roll number."""
+        order = np.argsort(self.roll_nos[:self.count].astype(str), kind="stable")
+        roll_nos = self.roll_nos[:self.count][order]
+        scores = self.scores[:self.count][order]
+        totals = scores.sum(axis=1)
+        total_max_class = int(self.max_marks.sum())
+        percentages = percentage_column(totals, np.full(len(totals), total_max_class))
+        headers = ['roll no'] + [f"{qid}({marks})" for qid, marks in zip(self.question_ids, self.max_marks)] + ['Total', 'Percentage']
+        return headers, roll_nos, scores, totals, percentages
+
 # ---------------------------------------------------------------------------
 # PDF BUILDERS
 # ---------------------------------------------------------------------------
-def convert_docx_to_pdf_pandoc(docx_path: str, pdf_path: str) -> bool:
+def convert_docx_to_pdf_pandoc(doc: Document, label: str) -> Union[BytesIO, None]:
+    """Renders `doc` to PDF entirely in memory: DOCX bytes go to Pandoc's stdin, PDF bytes come back on stdout."""
     try:
-        pandoc_command = ['pandoc', docx_path, '-o', pdf_path]
-        process = subprocess.run(pandoc_command, capture_output=True, text=True, check=False)
+        docx_buffer = BytesIO()
+        with metrics.timer("docx_render"):
+            doc.save(docx_buffer)
+        pandoc_command = ['pandoc', '-f', 'docx', '-t', 'pdf', '-o', '-']
+        with metrics.timer("pandoc_render"):
+            process = subprocess.run(pandoc_command, input=docx_buffer.getvalue(), capture_output=True, check=False)
 
         if process.returncode == 0:
-            if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-                print(f"INFO (CombinedResults): PDF '{pdf_path}' created successfully via Pandoc.", file=sys.stderr)
-                return True
+            if process.stdout:
+                print(f"INFO (CombinedResults): PDF for '{label}' created successfully via Pandoc ({len(process.stdout)} bytes).", file=sys.stderr)
+                return BytesIO(process.stdout)
             else:
-                print(f"ERROR (CombinedResults): Pandoc for '{docx_path}' succeeded (code 0) but PDF '{pdf_path}' not created or is empty.", file=sys.stderr)
-                print(f"Pandoc stdout:\n{process.stdout}", file=sys.stderr)
-                print(f"Pandoc stderr:\n{process.stderr}", file=sys.stderr)
-                return False
+                print(f"ERROR (CombinedResults): Pandoc for '{label}' succeeded (code 0) but produced no PDF bytes.", file=sys.stderr)
+                print(f"Pandoc stderr:\n{process.stderr.decode('utf-8', errors='replace')}", file=sys.stderr)
+                return None
         else:
-            print(f"ERROR (CombinedResults): Pandoc conversion failed for '{docx_path}'. Code: {process.returncode}", file=sys.stderr)
-            print(f"Pandoc stdout:\n{process.stdout}", file=sys.stderr)
-            print(f"Pandoc stderr:\n{process.stderr}", file=sys.stderr)
-            return False
+            print(f"ERROR (CombinedResults): Pandoc conversion failed for '{label}'. Code: {process.returncode}", file=sys.stderr)
+            print(f"Pandoc stderr:\n{process.stderr.decode('utf-8', errors='replace')}", file=sys.stderr)
+            return None
     except FileNotFoundError:
         print("ERROR (CombinedResults): Pandoc not found. Ensure it's installed and in PATH.", file=sys.stderr)
-        return False
+        return None
     except Exception as e:
-        print(f"ERROR (CombinedResults): Pandoc conversion exception for '{docx_path}'. {e}", file=sys.stderr)
-        return False
+        print(f"ERROR (CombinedResults): Pandoc conversion exception for '{label}'. {e}", file=sys.stderr)
+        return None
+
+def dataframe_to_csv_buffer(df: pd.DataFrame) -> BytesIO:
+    return BytesIO(df.to_csv(index=False).encode("utf-8"))
+
+def gridfs_file_exists(bucket: gridfs.GridFSBucket, file_id: ObjectId) -> bool:
+    return next(iter(bucket.find({"_id": file_id}).limit(1)), None) is not None
+
+def upload_buffer_to_gridfs(
+    bucket: gridfs.GridFSBucket,
+    buffer: BytesIO,
+    filename: str,
+    content_type: str,
+    metadata: Dict[str, Any],
+    replace_query: Dict[str, Any]
+) -> str:
+    """Deletes files matching `replace_query`, then streams `buffer` into `bucket`. Returns the new file id."""
+    for old_file in bucket.find(replace_query):
+        bucket.delete(old_file._id)
+    buffer.seek(0)
+    # contentType is kept in metadata; GridFSBucket does not write the deprecated top-level field.
+    with metrics.timer("gridfs_put"):
+        file_id = bucket.upload_from_stream(filename, buffer, metadata={**metadata, "contentType": content_type})
+    metrics.increment("gridfs_bytes_written", buffer.getbuffer().nbytes)
+    return str(file_id)
+
+def delete_stale_results(professor_upload_id: ObjectId, existing_results_by_roll: Dict[str, Dict[str, Any]], current_rolls: set) -> int:
+    """Deletes the Results (and their individual marksheet files) of students no longer in the upload."""
+    stale = [r for roll, r in existing_results_by_roll.items() if roll not in current_rolls]
+    for result in stale:
+        for file_id in (result.get("gridFsPdfId"), result.get("gridFsCsvId")):
+            if not file_id:
+                continue
+            try:
+                fs_individual_results_bucket.delete(ObjectId(str(file_id)))
+            except gridfs.errors.NoFile:
+                pass
+    if stale:
+        results_collection.delete_many({"_id": {"$in": [r["_id"] for r in stale]}})
+        print(f"INFO (CombinedResults): Removed {len(stale)} result(s) of students no longer in upload {professor_upload_id}: "
+              f"{', '.join(str(r.get('rollNo')) for r in stale)}", file=sys.stderr)
+    return len(stale)
 
 def build_student_pdf(
     df_student_scores: pd.DataFrame,
     roll_no: str,
     logo_image_path_param: str,
     exam_details_for_pdf: Dict[str, Any]
-) -> Tuple[Union[str, None], str]:
+) -> Tuple[Union[BytesIO, None], BytesIO, str]:
+    """Returns (pdf_buffer or None, csv_buffer, base_filename) for one student's marksheet."""
     if df_student_scores.empty:
         print(f"WARNING (CombinedResults): No graded answers df for student {roll_no} to build PDF. CSV may be empty.", file=sys.stderr)
-        csv_name = os.path.join(OUTPUT_DIR_COMBINED, f"{roll_no}_individual_marksheet.csv")
-        pd.DataFrame(columns=["question_id", "max_marks", "score", "percentage"]).to_csv(csv_name, index=False)
-        return None, csv_name
+        csv_buffer = dataframe_to_csv_buffer(pd.DataFrame(columns=["question_id", "max_marks", "score", "percentage"]))
+        return None, csv_buffer, f"{roll_no}_individual_marksheet"
 
     df_student_scores['max_marks'] = pd.to_numeric(df_student_scores['max_marks'], errors='coerce').fillna(0).astype(int)
     df_student_scores['score'] = pd.to_numeric(df_student_scores['score'], errors='coerce').fillna(0).astype(int)
-    df_student_scores["percentage"] = df_student_scores.apply(
-        lambda r: round((r["score"] / r["max_marks"]) * 100, 2) if r["max_marks"] > 0 else 0.0, axis=1
-    )
+    df_student_scores["percentage"] = percentage_column(df_student_scores["score"], df_student_scores["max_marks"])
 
     total_score = df_student_scores["score"].sum()
     total_max_for_percentage = exam_details_for_pdf.get("total_max_marks_from_prof", df_student_scores["max_marks"].sum())
@@ -344,14 +541,7 @@ def build_student_pdf(
     section_short = str(exam_details_for_pdf.get("sectionType", "All"))
     base_filename = f"{roll_no}_{course_short}_{subject_code_short}_{exam_type_short}_{section_short}_individual_marksheet"
 
-    csv_name = os.path.join(OUTPUT_DIR_COMBINED, f"{base_filename}.csv")
-    pdf_name = os.path.join(OUTPUT_DIR_COMBINED, f"{base_filename}.pdf")
-    tmp_docx = os.path.join(OUTPUT_DIR_COMBINED, f"tmp_{base_filename}.docx")
-
-    try:
-        sheet_for_csv.to_csv(csv_name, index=False)
-    except Exception as e:
-        print(f"ERROR (CR): Could not save individual CSV for {roll_no}. {e}", file=sys.stderr)
+    csv_buffer = dataframe_to_csv_buffer(sheet_for_csv)
 
     doc = Document()
     sections = doc.sections # Apply margins
@@ -455,31 +645,16 @@ def build_student_pdf(
     else:
         doc.add_paragraph("No scores to display.")
 
-    pdf_generated_successfully = False
-    try:
-        doc.save(tmp_docx)
-        pdf_generated_successfully = convert_docx_to_pdf_pandoc(tmp_docx, pdf_name)
-    except Exception as e_conv:
-        print(f"ERROR (CR): DOCX to PDF failed for student {roll_no}. {e_conv}", file=sys.stderr)
-    finally:
-        if os.path.exists(tmp_docx):
-            if pdf_generated_successfully:
-                try: os.remove(tmp_docx)
-                except OSError as e_del: print(f"WARN (CR): Could not remove temp DOCX {tmp_docx}. {e_del}", file=sys.stderr)
-            else:
-                print(f"INFO (CR): Temp DOCX {tmp_docx} for {roll_no} KEPT for debugging.", file=sys.stderr)
-
-    return (pdf_name, csv_name) if pdf_generated_successfully else (None, csv_name)
+    pdf_buffer = convert_docx_to_pdf_pandoc(doc, f"student {roll_no}")
+    return pdf_buffer, csv_buffer, base_filename
 
 
-def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, Any]) -> Tuple[Union[str, None], str]:
-    if df.empty:
-        print("WARNING (CR): DataFrame for combined class PDF empty. CSV empty, PDF not generated.", file=sys.stderr)
-        csv_name = os.path.join(OUTPUT_DIR_COMBINED, "class_marksheet_combined_empty.csv")
-        pd.DataFrame().to_csv(csv_name, index=False)
-        return None, csv_name
+def build_class_pdf(matrix: ClassScoreMatrix, image_path: str, exam_details: Dict[str, Any]) -> Tuple[Union[BytesIO, None], BytesIO, str]:
+    """Returns (pdf_buffer or None, csv_buffer, base_filename) for the combined class marksheet."""
+    if matrix.count == 0:
+        print("WARNING (CR): Score matrix for combined class PDF empty. CSV empty, PDF not generated.", file=sys.stderr)
+        return None, BytesIO(b""), "class_marksheet_combined_empty"
 
-    # --- Start of existing logic (no changes here) ---
     course_arg = exam_details.get("course_arg", "COURSE") 
     subject_code_arg = exam_details.get("subject_code_arg", "SUBJECT_CODE")
     exam_type_arg = exam_details.get("exam_type_arg", "EXAM_TYPE")
@@ -489,37 +664,18 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
     semester_arg_str = exam_details.get("semester", "N/A_Semester")
 
     base_filename = f"CLASS_COMBINED_{course_arg}_{subject_code_arg}_{exam_type_arg}_{section_type_arg}_marksheet"
-    csv_name = os.path.join(OUTPUT_DIR_COMBINED, f"{base_filename}.csv")
-    tmp_docx = os.path.join(OUTPUT_DIR_COMBINED, f"tmp_{base_filename}.docx")
-    pdf_name = os.path.join(OUTPUT_DIR_COMBINED, f"{base_filename}.pdf")
 
-    df['max_marks'] = pd.to_numeric(df['max_marks'], errors='coerce').fillna(0).astype(int)
-    df['score'] = pd.to_numeric(df['score'], errors='coerce').fillna(0).astype(int)
-    
-    max_marks_series = df[df['question_id'] != 'N/A'].groupby('question_id')['max_marks'].first().fillna(0).astype(int)
-    score_pivot = df.pivot_table(index="roll_no", columns="question_id", values="score", aggfunc="first").fillna(0).astype(int)
-
-    if 'N/A' in score_pivot.columns:
-        score_pivot = score_pivot.drop(columns=['N/A'], errors='ignore')
+    table_columns, roll_nos, scores, totals, percentages = matrix.table()
+    table_rows = [
+        [str(roll_nos[i]), *scores[i].tolist(), int(totals[i]), float(percentages[i])]
+        for i in range(len(roll_nos))
+    ]
 
-    total_max_class = max_marks_series.sum() if not max_marks_series.empty else 0
-    
-    qids_for_total_sum = [col for col in score_pivot.columns if col in max_marks_series.index]
-    score_pivot["Total"] = score_pivot[qids_for_total_sum].sum(axis=1)
-    score_pivot["Percentage"] = ((score_pivot["Total"] / total_max_class) * 100).round(2) if total_max_class > 0 else 0.0
-
-    renamed_cols = {qid: f"{qid}({int(marks)})" for qid, marks in max_marks_series.items() if qid in score_pivot.columns}
-    score_pivot_renamed = score_pivot.rename(columns=renamed_cols)
-
-    df_for_csv = score_pivot_renamed.copy()
-    if df_for_csv.index.name == "roll_no":
-         df_for_csv = df_for_csv.reset_index()
-    df_for_csv.rename(columns={'roll_no': 'roll no'}, inplace=True)
-    cols_order_csv = [col for col in df_for_csv.columns if col not in ['Total', 'Percentage']]
-    if 'Total' in df_for_csv.columns: cols_order_csv.append('Total')
-    if 'Percentage' in df_for_csv.columns: cols_order_csv.append('Percentage')
-    df_for_csv = df_for_csv[cols_order_csv]
-    df_for_csv.to_csv(csv_name, index=False)
+    csv_text = StringIO()
+    csv_writer = csv.writer(csv_text, lineterminator="\n")
+    csv_writer.writerow(table_columns)
+    csv_writer.writerows(table_rows)
+    csv_buffer = BytesIO(csv_text.getvalue().encode("utf-8"))
 
     doc = Document()
     sections_doc = doc.sections
@@ -597,16 +753,9 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
     doc.add_paragraph() 
     # --- End of Header and Details Table Generation ---
 
-    tbl_data_docx = score_pivot_renamed.reset_index()
-    tbl_data_docx.rename(columns={'roll_no': 'roll no'}, inplace=True)
-    cols_order_docx = ['roll no'] + [col for col in score_pivot_renamed.columns if col not in ['Total', 'Percentage']]
-    if 'Total' in score_pivot_renamed.columns: cols_order_docx.append('Total')
-    if 'Percentage' in score_pivot_renamed.columns: cols_order_docx.append('Percentage')
-    tbl_data_docx = tbl_data_docx[cols_order_docx]
-
-    if not tbl_data_docx.empty:
-        num_cols = len(tbl_data_docx.columns)
-        ct = doc.add_table(rows=1, cols=num_cols)
+    if table_rows:
+        num_cols = len(table_columns)
+        ct = doc.add_table(rows=1 + len(table_rows), cols=num_cols) # all rows allocated up front
         ct.style = 'Table Grid'
         ct.allow_autofit = False # Important for manual width setting
 
@@ -621,11 +770,11 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
             percentage_width = Inches(0.8)
             
             used_width = 0
-            has_total = 'Total' in tbl_data_docx.columns
-            has_percentage = 'Percentage' in tbl_data_docx.columns
+            has_total = 'Total' in table_columns
+            has_percentage = 'Percentage' in table_columns
             
             # Account for the width of fixed columns
-            if 'roll no' in tbl_data_docx.columns:
+            if 'roll no' in table_columns:
                 used_width += roll_no_width
             if has_total:
                 used_width += total_width
@@ -639,7 +788,7 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
 
             # Apply calculated widths to the table
             col_idx = 0
-            if 'roll no' in tbl_data_docx.columns:
+            if 'roll no' in table_columns:
                 ct.columns[col_idx].width = roll_no_width
                 col_idx += 1
             
@@ -662,7 +811,7 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
         # ▲▲▲ END OF NEW DYNAMIC COLUMN WIDTH LOGIC ▲▲▲
 
         hdr_cells = ct.rows[0].cells
-        for i, column_name in enumerate(tbl_data_docx.columns):
+        for i, column_name in enumerate(table_columns):
             cell_p_hdr = hdr_cells[i].paragraphs[0]
             cell_p_hdr.text = ''
             run_hdr = cell_p_hdr.add_run(str(column_name))
@@ -671,9 +820,9 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
             run_hdr.font.size = Pt(8) # Reduced font size for more space
             cell_p_hdr.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-        for _, data_row_series in tbl_data_docx.iterrows():
-            row_cells = ct.add_row().cells
-            for i, cell_value in enumerate(data_row_series):
+        for row_idx, data_row in enumerate(table_rows, start=1):
+            row_cells = ct.rows[row_idx].cells
+            for i, cell_value in enumerate(data_row):
                 cell_p_data = row_cells[i].paragraphs[0]
                 cell_p_data.text = ''
                 run_data = cell_p_data.add_run(str(cell_value))
@@ -683,19 +832,9 @@ def build_class_pdf(df: pd.DataFrame, image_path: str, exam_details: Dict[str, A
     else:
         doc.add_paragraph("No class scores to display.")
 
-    # --- PDF Conversion and Cleanup (no changes here) ---
-    pdf_generated_successfully = False
-    try:
-        doc.save(tmp_docx)
-        pdf_generated_successfully = convert_docx_to_pdf_pandoc(tmp_docx, pdf_name)
-    finally:
-        if os.path.exists(tmp_docx):
-            if pdf_generated_successfully:
-                try: os.remove(tmp_docx)
-                except OSError as e: print(f"WARN (CR Class): Could not remove temp DOCX {tmp_docx}. {e}", file=sys.stderr)
-            else:
-                print(f"INFO (CR Class): Temp DOCX {tmp_docx} KEPT for debugging.", file=sys.stderr)
-    return (pdf_name, csv_name) if pdf_generated_successfully else (None, csv_name)
+    # --- In-memory PDF Conversion ---
+    pdf_buffer = convert_docx_to_pdf_pandoc(doc, base_filename)
+    return pdf_buffer, csv_buffer, base_filename
 # ---------------------------------------------------------------------------
 # MAIN PROCESSING FUNCTION
 # ---------------------------------------------------------------------------
@@ -707,6 +846,32 @@ def process_combined_exam_results(
     semester_arg: int,
     section_type_arg: str,
     logo_img_path_param: str = LOGO_IMAGE_PATH
+) -> Dict[str, Any]:
+    """Runs the combined-results job and stores its stage timings on the professoruploads document."""
+    init_mongo()
+    load_scoring_modules()
+    with metrics.job("combinedResults") as job_metrics:
+        result = _process_combined_exam_results(
+            course_arg, subject_code_arg, exam_type_arg, year_arg, semester_arg, section_type_arg, logo_img_path_param
+        )
+    if result.get("status") != "error_professor_data_missing":
+        metrics.save_job_summary(
+            professoruploads_collection,
+            {"course": course_arg, "subjectCode": subject_code_arg, "examType": exam_type_arg,
+             "year": year_arg, "semester": semester_arg, "sectionType": section_type_arg},
+            job_metrics,
+        )
+    return result
+
+
+def _process_combined_exam_results(
+    course_arg: str,
+    subject_code_arg: str,
+    exam_type_arg: str,
+    year_arg: int,
+    semester_arg: int,
+    section_type_arg: str,
+    logo_img_path_param: str
 ) -> Dict[str, Any]:
     print(
         f"INFO (CombinedResults): Processing: C:{course_arg}, SubCode:{subject_code_arg}, "
@@ -722,7 +887,8 @@ def process_combined_exam_results(
         "semester": semester_arg,
         "sectionType": section_type_arg
     }
-    professor_doc_main = professoruploads_collection.find_one(prof_criteria_query)
+    # The legacy embedded 'students' array can be large; it is streamed separately if needed.
+    professor_doc_main = professoruploads_collection.find_one(prof_criteria_query, {"students": 0})
 
     if not professor_doc_main:
         msg = f"ProfessorUpload document not found for criteria: {prof_criteria_query}"
@@ -733,19 +899,15 @@ def process_combined_exam_results(
     professor_subject_name = str(professor_doc_main.get("subject", "N/A_SubjectName"))
 
 
+    # A previous successful run is only reused as-is if no student (or the answer key) changed;
+    # that is decided after fingerprinting every student below.
+    previous_combined_available = False
     if (professor_doc_main.get("combinedResultGenerationStatus") == "completed_success" and
             professor_doc_main.get("combinedClassResultPdfGridFsId")):
         try:
-            if fs_class_aggregate_bucket.exists(ObjectId(professor_doc_main["combinedClassResultPdfGridFsId"])):
-                msg = "Combined results previously generated and available."
-                print(f"INFO (CombinedResults): {msg} GridFS ID: {professor_doc_main['combinedClassResultPdfGridFsId']}", file=sys.stderr)
-                return {
-                    "status": "success_already_processed",
-                    "message": msg,
-                    "combinedClassPdfGridFsId": str(professor_doc_main["combinedClassResultPdfGridFsId"]),
-                    "combinedClassCsvGridFsId": str(professor_doc_main.get("combinedClassResultCsvGridFsId")),
-                    "data": {"professorUploadId": str(professor_upload_id)}
-                }
+            previous_combined_available = gridfs_file_exists(
+                fs_class_aggregate_bucket, ObjectId(professor_doc_main["combinedClassResultPdfGridFsId"])
+            )
         except Exception as e_fs_check:
             print(f"WARN (CR): Error checking existing GridFS combined file: {e_fs_check}. Regenerating.", file=sys.stderr)
 
@@ -769,7 +931,8 @@ def process_combined_exam_results(
         return {"status": "error_prof_data_incomplete", "message": msg}
 
     reference_data_parsed = parse_reference_answers_from_processed_json(professor_questions_list)
-    reference_vectors = build_reference_vectors(reference_data_parsed)
+    current_answer_key_fingerprint = answer_key_fingerprint(reference_data_parsed)
+    reference_vectors = None # Embedded lazily: not needed if every student is unchanged
     max_marks_map = {q["question_id"]: q["max_marks"] for q in reference_data_parsed.get("questions", [])}
     total_max_marks_from_prof_for_individual = sum(
         int(q.get("marks", 0)) for q in professor_questions_list if isinstance(q, dict) and q.get("marks") is not None
@@ -787,86 +950,92 @@ def process_combined_exam_results(
         "examDetails": professor_doc_main.get("examDetails", {}) 
     }
 
-    all_individual_scored_dfs_for_class_pdf = []
+    class_matrix = ClassScoreMatrix(max_marks_map, expected_students=professor_doc_main.get("studentAnswersCount") or 64)
     processed_students_count = 0
     failed_students_processing_count = 0
+    reused_students_count = 0
 
-    student_array_from_prof_doc = professor_doc_main.get("students", [])
-    if not isinstance(student_array_from_prof_doc, list) or not student_array_from_prof_doc:
-        msg = f"No 'students' array or empty in ProfessorUpload ID: {professor_upload_id}."
-        print(f"WARNING (CombinedResults): {msg}", file=sys.stderr)
-        professoruploads_collection.update_one(
-            {"_id": professor_upload_id},
-            {"$set": {"combinedResultGenerationStatus": "error_no_students_in_prof_doc", "combinedResultErrorMessage": msg}}
+    existing_results_by_roll = {
+        r.get("rollNo"): r for r in results_collection.find(
+            {"professorMongoId": professor_upload_id},
+            {"rollNo": 1, "answersFingerprint": 1, "answerKeyFingerprint": 1, "scoresPerQuestion": 1, "gridFsPdfId": 1, "gridFsCsvId": 1}
         )
-        return {"status": "error_no_students_in_prof_doc", "message": msg}
-
+    }
 
-    for student_data in student_array_from_prof_doc:
+    seen_any_student = False
+    current_rolls = set()
+    for student_data in iter_students_for_upload(professor_upload_id):
+        seen_any_student = True
         roll_no = student_data.get("roll_no")
         if not roll_no:
             print(f"WARN (CR): Student entry in {professor_upload_id} missing 'roll_no'. Skipping.", file=sys.stderr)
             failed_students_processing_count += 1
             continue
+        current_rolls.add(roll_no)
+
+        current_answers_fingerprint = student_answers_fingerprint(student_data)
+        previous_result = existing_results_by_roll.get(roll_no)
+        if (previous_result
+                and previous_result.get("answersFingerprint") == current_answers_fingerprint
+                and previous_result.get("answerKeyFingerprint") == current_answer_key_fingerprint
+                and (previous_result.get("gridFsPdfId") or not previous_result.get("scoresPerQuestion"))):
+            print(f"INFO (CombinedResults): Student {roll_no} unchanged since last run. Reusing stored scores.", file=sys.stderr)
+            stored_scores = previous_result.get("scoresPerQuestion") or []
+            class_matrix.add_student(
+                roll_no, [r.get("question_id") for r in stored_scores], [r.get("score") for r in stored_scores]
+            )
+            reused_students_count += 1
+            processed_students_count += 1
+            continue
+
+        if reference_vectors is None:
+            reference_vectors = build_reference_vectors(reference_data_parsed)
 
         print(f"INFO (CombinedResults): Processing student: {roll_no}", file=sys.stderr)
         scored_df_single_student = calculate_similarity_for_student(student_data, reference_vectors, max_marks_map)
         individual_pdf_gridfs_id = None
-        individual_csv_abs_path = None
+        individual_csv_gridfs_id = None
         notes_for_result_doc = "Processed successfully."
         total_obtained = 0
         scores_for_db = []
 
         if scored_df_single_student.empty:
-            print(f"INFO (CR): No scorable answers for {roll_no}. Minimal record being created. Adding placeholders for class PDF.", file=sys.stderr)
-            placeholder_rows = []
-            qids_for_exam = list(max_marks_map.keys()) if max_marks_map else ["N/A"]
-            if not qids_for_exam or (len(qids_for_exam)==1 and qids_for_exam[0]=='N/A' and not max_marks_map) : 
-                 print(f"WARN (CR): No questions defined in max_marks_map for student {roll_no} placeholder generation. Using single N/A.", file=sys.stderr)
-                 qids_for_exam = ["N/A"]
-
-
-            for qid in qids_for_exam:
-                placeholder_rows.append({
-                    "roll_no": roll_no, "question_id": qid,
-                    "max_marks": max_marks_map.get(qid, 0),
-                    "similarity": 0.0, "score": 0, 
-                    "student_answer_summary": "No answer/Not scorable"
-                })
-            
-            df_for_this_student_class_pdf = pd.DataFrame(placeholder_rows)
-            all_individual_scored_dfs_for_class_pdf.append(df_for_this_student_class_pdf)
+            print(f"INFO (CR): No scorable answers for {roll_no}. Minimal record being created. Adding zero row for class PDF.", file=sys.stderr)
+            class_matrix.add_student(roll_no, [], [])
             notes_for_result_doc = "No scorable answers found. Placeholder added to class sheet."
         else:
-            individual_pdf_path, individual_csv_path_temp = build_student_pdf(
+            individual_pdf_buffer, individual_csv_buffer, base_fn_indiv = build_student_pdf(
                 scored_df_single_student, roll_no, logo_img_path_param, exam_details_for_individual_pdfs
             )
-            if individual_csv_path_temp and os.path.exists(individual_csv_path_temp):
-                individual_csv_abs_path = os.path.abspath(individual_csv_path_temp)
-
-            if individual_pdf_path and os.path.exists(individual_pdf_path):
-                pdf_fn_indiv = os.path.basename(individual_pdf_path)
-                meta_indiv = {
-                    "rollNo": roll_no, "courseName": course_arg, "subjectCode": subject_code_arg,
-                    "examType": exam_type_arg, "year": year_arg, "semester": semester_arg,
-                    "sectionType": section_type_arg, "type": "student_marksheet_individual_from_combined",
-                    "professorUploadIdContext": str(professor_upload_id), "generatedAt": datetime.now(timezone.utc)
-                }
+            meta_indiv = {
+                "rollNo": roll_no, "courseName": course_arg, "subjectCode": subject_code_arg,
+                "examType": exam_type_arg, "year": year_arg, "semester": semester_arg,
+                "sectionType": section_type_arg, "type": "student_marksheet_individual_from_combined",
+                "professorUploadIdContext": str(professor_upload_id), "generatedAt": datetime.now(timezone.utc)
+            }
+
+            if individual_pdf_buffer is not None:
+                pdf_fn_indiv = f"{base_fn_indiv}.pdf"
                 del_q_indiv = {"filename": pdf_fn_indiv, "metadata.rollNo": roll_no, "metadata.subjectCode": subject_code_arg, "metadata.examType": exam_type_arg, "metadata.type": meta_indiv["type"]}
-                for old_file in fs_individual_results_bucket.find(del_q_indiv): fs_individual_results_bucket.delete(old_file._id)
-                with open(individual_pdf_path, "rb") as f_in:
-                    individual_pdf_gridfs_id = str(fs_individual_results_bucket.put(f_in, filename=pdf_fn_indiv, contentType='application/pdf', metadata=meta_indiv))
-                try:
-                    os.remove(individual_pdf_path)
-                    if individual_csv_path_temp and os.path.exists(individual_csv_path_temp): os.remove(individual_csv_path_temp) # remove csv only if pdf was made and removed
-                except OSError as e: print(f"WARN (CR): Could not remove temp indiv file(s) for {roll_no}. {e}", file=sys.stderr)
+                individual_pdf_gridfs_id = upload_buffer_to_gridfs(
+                    fs_individual_results_bucket, individual_pdf_buffer, pdf_fn_indiv, 'application/pdf', meta_indiv, del_q_indiv
+                )
             else:
                 print(f"WARN (CR): Individual PDF not generated for {roll_no}.", file=sys.stderr)
                 notes_for_result_doc = "Individual PDF generation failed."
 
+            csv_fn_indiv = f"{base_fn_indiv}.csv"
+            meta_indiv_csv = {**meta_indiv, "type": "student_marksheet_individual_csv_from_combined"}
+            del_q_indiv_csv = {"filename": csv_fn_indiv, "metadata.rollNo": roll_no, "metadata.subjectCode": subject_code_arg, "metadata.examType": exam_type_arg, "metadata.type": meta_indiv_csv["type"]}
+            individual_csv_gridfs_id = upload_buffer_to_gridfs(
+                fs_individual_results_bucket, individual_csv_buffer, csv_fn_indiv, 'text/csv', meta_indiv_csv, del_q_indiv_csv
+            )
+
             total_obtained = int(scored_df_single_student["score"].sum())
             scores_for_db = scored_df_single_student.to_dict(orient="records")
-            all_individual_scored_dfs_for_class_pdf.append(scored_df_single_student)
+            class_matrix.add_student(
+                roll_no, scored_df_single_student["question_id"].tolist(), scored_df_single_student["score"].tolist()
+            )
 
         percentage = round((total_obtained / total_max_marks_from_prof_for_individual) * 100, 2) if total_max_marks_from_prof_for_individual > 0 else 0.0
         student_mongo_id_val = student_data.get("studentMongoId") or student_data.get("_id")
@@ -884,18 +1053,61 @@ def process_combined_exam_results(
             "criteria": criteria_for_results_doc, "scoresPerQuestion": scores_for_db,
             "totalObtainedMarks": total_obtained, "totalMaximumMarks": total_max_marks_from_prof_for_individual,
             "overallPercentage": percentage, "generatedAt": datetime.now(timezone.utc),
-            "gridFsPdfId": individual_pdf_gridfs_id, "localCsvPath": individual_csv_abs_path
+            "gridFsPdfId": individual_pdf_gridfs_id, "gridFsCsvId": individual_csv_gridfs_id,
+            "answersFingerprint": current_answers_fingerprint, "answerKeyFingerprint": current_answer_key_fingerprint,
+            "scoringRuleVersion": SCORING_RULE_VERSION
         }
         if notes_for_result_doc != "Processed successfully.": individual_result_payload["notes"] = notes_for_result_doc
         
         query_criteria_for_results = {"rollNo": roll_no, "professorMongoId": professor_upload_id}
         for k, v in criteria_for_results_doc.items():
             if k != "examTitleFromProf": query_criteria_for_results[f"criteria.{k}"] = v
-        results_collection.update_one(query_criteria_for_results, {"$set": individual_result_payload}, upsert=True)
+        results_collection.update_one(query_criteria_for_results, {"$set": individual_result_payload, "$unset": {"localCsvPath": ""}}, upsert=True)
         processed_students_count += 1
 
-    if not all_individual_scored_dfs_for_class_pdf: 
-        msg = "No student data (neither scored nor placeholder) available to generate combined class PDF."
+    if not seen_any_student:
+        msg = f"No extracted students found for ProfessorUpload ID: {professor_upload_id}."
+        print(f"WARNING (CombinedResults): {msg}", file=sys.stderr)
+        professoruploads_collection.update_one(
+            {"_id": professor_upload_id},
+            {"$set": {"combinedResultGenerationStatus": "error_no_students_in_prof_doc", "combinedResultErrorMessage": msg}}
+        )
+        return {"status": "error_no_students_in_prof_doc", "message": msg}
+
+    removed_students_count = delete_stale_results(professor_upload_id, existing_results_by_roll, current_rolls)
+    ungraded_duplicates = find_ungraded_duplicates(professor_upload_id)
+    ungraded_duplicate_rolls = sorted({d["rollNo"] for d in ungraded_duplicates if d["rollNo"]})
+    duplicates_report = {
+        "combinedResultUngradedDuplicateCount": len(ungraded_duplicates),
+        "combinedResultUngradedDuplicateRollNos": ungraded_duplicate_rolls,
+    }
+    duplicates_note = ""
+    if ungraded_duplicates:
+        duplicates_note = (f" {len(ungraded_duplicates)} script(s) not graded: their roll number was already taken by another "
+                           f"script ({', '.join(ungraded_duplicate_rolls)}); check them manually.")
+        print(f"WARN (CombinedResults): {duplicates_note.strip()} Scripts: "
+              + ", ".join(f"{os.path.basename(str(d['script']))} p.{d['firstPage']} -> {d['rollNo']}" for d in ungraded_duplicates), file=sys.stderr)
+    recomputed_students_count = processed_students_count - reused_students_count
+    if (previous_combined_available and recomputed_students_count == 0 and removed_students_count == 0
+            and processed_students_count == professor_doc_main.get("combinedResultStudentProcessedCount")):
+        msg = "Combined results previously generated and available. No student changed since the last run."
+        print(f"INFO (CombinedResults): {msg} GridFS ID: {professor_doc_main['combinedClassResultPdfGridFsId']}", file=sys.stderr)
+        professoruploads_collection.update_one(
+            {"_id": professor_upload_id},
+            {"$set": {"combinedResultGenerationStatus": "completed_success", **duplicates_report}}
+        )
+        return {
+            "status": "success_already_processed",
+            "message": msg + duplicates_note,
+            "ungradedDuplicateCount": len(ungraded_duplicates),
+            "ungradedDuplicateRollNos": ungraded_duplicate_rolls,
+            "combinedClassPdfGridFsId": str(professor_doc_main["combinedClassResultPdfGridFsId"]),
+            "combinedClassCsvGridFsId": str(professor_doc_main.get("combinedClassResultCsvGridFsId")),
+            "data": {"professorUploadId": str(professor_upload_id)}
+        }
+
+    if class_matrix.count == 0: 
+        msg = "No student rows available to generate combined class PDF."
         print(f"ERROR (CombinedResults): {msg}", file=sys.stderr)
         professoruploads_collection.update_one(
             {"_id": professor_upload_id},
@@ -903,8 +1115,6 @@ def process_combined_exam_results(
         )
         return {"status": "error_no_data_for_class_pdf", "message": msg}
 
-    class_df_final = pd.concat(all_individual_scored_dfs_for_class_pdf, ignore_index=True)
-    
     exam_details_for_class_pdf = {
         "course_arg": course_arg,           
         "subject_code_arg": subject_code_arg, 
@@ -915,36 +1125,29 @@ def process_combined_exam_results(
         "semester": str(semester_arg),      
     }
 
-    combined_pdf_path, combined_csv_path = build_class_pdf(class_df_final, logo_img_path_param, exam_details_for_class_pdf)
+    combined_pdf_buffer, combined_csv_buffer, base_fn_class = build_class_pdf(class_matrix, logo_img_path_param, exam_details_for_class_pdf)
     combined_pdf_gridfs_id = None
     combined_csv_gridfs_id = None
 
-    if combined_pdf_path and os.path.exists(combined_pdf_path):
-        pdf_fn_class = os.path.basename(combined_pdf_path)
+    if combined_pdf_buffer is not None:
+        pdf_fn_class = f"{base_fn_class}.pdf"
         meta_class_pdf = {"professorUploadId": str(professor_upload_id), **prof_criteria_query, "type": "class_marksheet_combined_aggregate_pdf", "generatedByScript": "Combined_Results.py", "generatedAt": datetime.now(timezone.utc)}
         del_q_class_pdf = {"filename": pdf_fn_class, "metadata.professorUploadId": str(professor_upload_id), "metadata.type": meta_class_pdf["type"]}
-        for old_file in fs_class_aggregate_bucket.find(del_q_class_pdf): fs_class_aggregate_bucket.delete(old_file._id)
-        with open(combined_pdf_path, "rb") as f_class_pdf:
-            combined_pdf_gridfs_id = str(fs_class_aggregate_bucket.put(f_class_pdf, filename=pdf_fn_class, contentType='application/pdf', metadata=meta_class_pdf))
-        try: os.remove(combined_pdf_path)
-        except OSError as e: print(f"WARN (CR): Could not remove temp combined PDF {combined_pdf_path}. {e}", file=sys.stderr)
+        combined_pdf_gridfs_id = upload_buffer_to_gridfs(
+            fs_class_aggregate_bucket, combined_pdf_buffer, pdf_fn_class, 'application/pdf', meta_class_pdf, del_q_class_pdf
+        )
     else:
-        msg = f"Combined Class PDF path not generated or file does not exist: {combined_pdf_path}"
+        msg = f"Combined Class PDF not generated for {base_fn_class}."
         print(f"ERROR (CombinedResults): {msg}", file=sys.stderr)
         professoruploads_collection.update_one({"_id": professor_upload_id}, {"$set": {"combinedResultGenerationStatus": "error_combined_pdf_generation", "combinedResultErrorMessage": msg}})
         return {"status": "error_combined_pdf_generation", "message": msg}
 
-    if combined_csv_path and os.path.exists(combined_csv_path) and combined_pdf_gridfs_id:
-        csv_fn_class = os.path.basename(combined_csv_path)
-        meta_class_csv = {"professorUploadId": str(professor_upload_id), **prof_criteria_query, "type": "class_marksheet_combined_aggregate_csv", "generatedByScript": "Combined_Results.py", "generatedAt": datetime.now(timezone.utc), "pdfPairId": combined_pdf_gridfs_id}
-        del_q_class_csv = {"filename": csv_fn_class, "metadata.professorUploadId": str(professor_upload_id), "metadata.type": meta_class_csv["type"]}
-        for old_file in fs_class_aggregate_bucket.find(del_q_class_csv): fs_class_aggregate_bucket.delete(old_file._id)
-        with open(combined_csv_path, "rb") as f_class_csv:
-            combined_csv_gridfs_id = str(fs_class_aggregate_bucket.put(f_class_csv, filename=csv_fn_class, contentType='text/csv', metadata=meta_class_csv))
-        try: os.remove(combined_csv_path)
-        except OSError as e: print(f"WARN (CR): Could not remove temp combined CSV {combined_csv_path}. {e}", file=sys.stderr)
-    elif combined_pdf_gridfs_id:
-        print(f"WARN (CR): Combined Class CSV not found or not uploaded ({combined_csv_path}), but PDF was successful.", file=sys.stderr)
+    csv_fn_class = f"{base_fn_class}.csv"
+    meta_class_csv = {"professorUploadId": str(professor_upload_id), **prof_criteria_query, "type": "class_marksheet_combined_aggregate_csv", "generatedByScript": "Combined_Results.py", "generatedAt": datetime.now(timezone.utc), "pdfPairId": combined_pdf_gridfs_id}
+    del_q_class_csv = {"filename": csv_fn_class, "metadata.professorUploadId": str(professor_upload_id), "metadata.type": meta_class_csv["type"]}
+    combined_csv_gridfs_id = upload_buffer_to_gridfs(
+        fs_class_aggregate_bucket, combined_csv_buffer, csv_fn_class, 'text/csv', meta_class_csv, del_q_class_csv
+    )
 
     final_update_payload = {
         "combinedResultGenerationStatus": "completed_success",
@@ -953,6 +1156,10 @@ def process_combined_exam_results(
         "combinedResultProcessedAt": datetime.now(timezone.utc),
         "combinedResultStudentProcessedCount": processed_students_count,
         "combinedResultStudentFailedOrSkippedCount": failed_students_processing_count,
+        "combinedResultStudentRecomputedCount": recomputed_students_count,
+        "combinedResultStudentReusedCount": reused_students_count,
+        "combinedResultStudentRemovedCount": removed_students_count,
+        **duplicates_report,
         "combinedResultErrorMessage": None
     }
     professoruploads_collection.update_one({"_id": professor_upload_id}, {"$set": final_update_payload})
@@ -960,10 +1167,15 @@ def process_combined_exam_results(
 
     return {
         "status": "success_combined_generated",
-        "message": f"Combined class result processing complete. Processed {processed_students_count} students. Combined PDF and CSV generated.",
+        "message": f"Combined class result processing complete. Processed {processed_students_count} students ({recomputed_students_count} re-scored, {reused_students_count} unchanged). Combined PDF and CSV generated." + duplicates_note,
         "combinedClassPdfGridFsId": combined_pdf_gridfs_id,
         "combinedClassCsvGridFsId": combined_csv_gridfs_id,
-        "processedStudentCount": processed_students_count
+        "processedStudentCount": processed_students_count,
+        "recomputedStudentCount": recomputed_students_count,
+        "reusedStudentCount": reused_students_count,
+        "removedStudentCount": removed_students_count,
+        "ungradedDuplicateCount": len(ungraded_duplicates),
+        "ungradedDuplicateRollNos": ungraded_duplicate_rolls
     }
 # ---------------------------------------------------------------------------
 # CLI ENTRY POINT
@@ -1,6 +1,9 @@
 
 
 
+# Annotations stay unevaluated, so pd/np types in signatures don't force the heavy imports.
+from __future__ import annotations
+
 # Set TOKENIZERS_PARALLELISM to false before importing sentence_transformers
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -10,24 +13,18 @@ import re
 import sys
 import traceback
 import time # For adding small delays
+from io import BytesIO
 from typing import Dict, List, Union, Any, Tuple
-import pandas as pd
-import numpy as np
 from pymongo import MongoClient, errors as PyMongoErrors
 from bson.objectid import ObjectId
 import gridfs
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from docx import Document # For creating DOCX
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+import metrics
+import embedding_service  # shared model process if running, else loads in-process
 # from docx2pdf import convert # We are removing this
 import subprocess # <--- ADDED for Pandoc
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import argparse
-from docx.shared import Inches
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 
 # ... (All your existing CONFIGURATION, DATABASE, EMBEDDING, DATA PARSING, SIMILARITY logic remains IDENTICAL) ...
 # ... (parse_professor_questions, build_reference_vectors, similarity_dataframe remain IDENTICAL)
@@ -63,43 +60,87 @@ LOGO_IMAGE_PATH = os.path.join(PROJECT_ROOT_DIR, "backend", "logo", LOGO_IMAGE_F
 if not os.path.exists(LOGO_IMAGE_PATH):
     print(f"WARNING (MarksheetGen): Logo image not found at '{LOGO_IMAGE_PATH}'. Marksheets may not include the logo.", file=sys.stderr)
 
-OUTPUT_DIR_MARKETSHEETS = os.path.join(PROJECT_ROOT_DIR, "backend", "uploads", "generated_marksheets")
 GRIDFS_RESULTS_BUCKET_NAME = "results_marksheets"
+# Marksheets are rendered in memory and streamed into GridFS; 1 MiB chunks keep
+# a typical marksheet in a single chunk document.
+GRIDFS_CHUNK_SIZE_BYTES = int(os.getenv("GRIDFS_CHUNK_SIZE_BYTES", str(1024 * 1024)))
 RESULTS_COLLECTION_NAME = "Results"
 
 # ---------------------------------------------------------------------------
-# DATABASE CONNECTIONS (Assuming this section is correct)
+# LAZY RESOURCES
+# Nothing heavy happens at import time (so `--help` and the cached-result path
+# stay fast). Mongo is connected by init_mongo(), pandas / numpy / scikit-learn /
+# python-docx are imported by load_scoring_modules(), and the embedding model is
+# loaded by get_embedding_model() -- each once, on first use.
 # ---------------------------------------------------------------------------
-try:
-    print(f"INFO (MarksheetGen): Connecting to MongoDB at {MONGO_CONNECTION_STRING}...", file=sys.stderr)
-    client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-    client.admin.command('ping')
-    db = client[DATABASE_NAME]
-    professoruploads_collection = db["professoruploads"]
-    studentuploads_collection = db["studentuploads"]
-    results_collection = db[RESULTS_COLLECTION_NAME]
-    fs_results_bucket = gridfs.GridFS(db, collection=GRIDFS_RESULTS_BUCKET_NAME)
-    print(f"INFO (MarksheetGen): Connected to MongoDB: db='{DATABASE_NAME}'", file=sys.stderr)
-except PyMongoErrors.ConnectionFailure as e:
-    print(f"FATAL (MarksheetGen): Could not connect to MongoDB. Error: {e}", file=sys.stderr)
-    sys.exit(1)
-except Exception as e:
-    print(f"FATAL (MarksheetGen): An unexpected error occurred during MongoDB setup. Error: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
+client = None
+db = None
+professoruploads_collection = None
+studentuploads_collection = None
+results_collection = None
+fs_results_bucket = None
+
+pd = np = cosine_similarity = None
+grade_dataframe = percentage_column = None
+Document = Inches = Pt = WD_PARAGRAPH_ALIGNMENT = None
+
+embedding_model = None
+
+
+def init_mongo() -> None:
+    global client, db, professoruploads_collection, studentuploads_collection, results_collection, fs_results_bucket
+    if client is not None:
+        return
+    try:
+        print(f"INFO (MarksheetGen): Connecting to MongoDB at {MONGO_CONNECTION_STRING}...", file=sys.stderr)
+        mongo_client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
+        mongo_client.admin.command('ping')
+        db = mongo_client[DATABASE_NAME]
+        professoruploads_collection = db["professoruploads"]
+        studentuploads_collection = db["studentuploads"]
+        results_collection = db[RESULTS_COLLECTION_NAME]
+        fs_results_bucket = gridfs.GridFSBucket(db, bucket_name=GRIDFS_RESULTS_BUCKET_NAME, chunk_size_bytes=GRIDFS_CHUNK_SIZE_BYTES)
+        client = mongo_client
+        print(f"INFO (MarksheetGen): Connected to MongoDB: db='{DATABASE_NAME}'", file=sys.stderr)
+    except PyMongoErrors.ConnectionFailure as e:
+        print(f"FATAL (MarksheetGen): Could not connect to MongoDB. Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"FATAL (MarksheetGen): An unexpected error occurred during MongoDB setup. Error: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+
+
+def load_scoring_modules() -> None:
+    """Imports the scoring / rendering stack into this module's globals."""
+    global pd, np, cosine_similarity, grade_dataframe, percentage_column, Document, Inches, Pt, WD_PARAGRAPH_ALIGNMENT
+    if pd is not None:
+        return
+    import numpy as np
+    import pandas as pd
+    from sklearn.metrics.pairwise import cosine_similarity
+    from grading import grade_dataframe, percentage_column
+    from docx import Document # For creating DOCX
+    from docx.shared import Inches, Pt
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
+
+def get_embedding_model():
+    global embedding_model
+    if embedding_model is not None:
+        return embedding_model
+    try:
+        embedding_model = embedding_service.get_encoder("all-MiniLM-L6-v2")
+        print("INFO (MarksheetGen): Sentence embedding model ready.", file=sys.stderr)
+    except Exception as e:
+        print(f"FATAL (MarksheetGen): Could not get sentence embedding model. Error: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+    return embedding_model
 
 # ---------------------------------------------------------------------------
-# EMBEDDING MODEL & HELPERS (Assuming this section is correct)
+# EMBEDDING HELPERS
 # ---------------------------------------------------------------------------
-try:
-    print("INFO (MarksheetGen): Loading sentence embedding model 'all-MiniLM-L6-v2'...", file=sys.stderr)
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    print("INFO (MarksheetGen): Sentence embedding model loaded.", file=sys.stderr)
-except Exception as e:
-    print(f"FATAL (MarksheetGen): Could not load SentenceTransformer model. Error: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
-
 def normalize_qid(qid: Any) -> str:
     """
     Robustly normalizes a question ID to a consistent format.
@@ -121,7 +162,11 @@ def preprocess(text: str) -> str:
 
 def embed(text_to_embed: str) -> Union[np.ndarray, None]:
     processed_text = preprocess(text_to_embed)
-    return embedding_model.encode(processed_text, convert_to_numpy=True) if processed_text else None
+    if not processed_text:
+        return None
+    model = get_embedding_model()
+    with metrics.timer("embedding"):
+        return model.encode(processed_text, convert_to_numpy=True)
 
 def cos_sim(v1: Union[np.ndarray, None], v2: Union[np.ndarray, None]) -> float:
     if v1 is None or v2 is None or v1.size == 0 or v2.size == 0 : return 0.0
@@ -244,43 +289,25 @@ def similarity_dataframe(
 
     df = pd.DataFrame(rows)
 
-    def score_rule(sim: float, max_m: int) -> int:
-        sim = float(sim) if sim is not None else 0.0
-        max_m = int(max_m) if max_m is not None else 0
-        if sim >= 0.90: pct = 1.00
-        elif sim >= 0.80: pct = 0.90
-        elif sim >= 0.70: pct = 0.75
-        elif sim >= 0.60: pct = 0.65
-        elif sim >= 0.50: pct = 0.60
-        elif sim >= 0.45: pct = 0.50
-        else: pct = 0.0
-        return int(round(pct * max_m))
-
-    df["score"] = df.apply(lambda r: score_rule(r["similarity"], r["max_marks"]), axis=1)
+    grade_dataframe(df)
     return df
 
 # ---------------------------------------------------------------------------
 # DOCX / PDF BUILDERS
 # ---------------------------------------------------------------------------
-def build_student_pdf_with_pandoc(df_student_scores: pd.DataFrame, roll_no: str, logo_image_path_param: str, exam_details_for_pdf_gen: Dict[str, Any]) -> Tuple[Union[str,None], Union[str,None]]:
-    os.makedirs(OUTPUT_DIR_MARKETSHEETS, exist_ok=True)
+def build_student_pdf_with_pandoc(df_student_scores: pd.DataFrame, roll_no: str, logo_image_path_param: str, exam_details_for_pdf_gen: Dict[str, Any]) -> Tuple[Union[BytesIO,None], Union[BytesIO,None], str]:
+    """Renders the marksheet in memory. Returns (pdf_buffer or None, csv_buffer or None, base_filename)."""
     exam_type_short = str(exam_details_for_pdf_gen.get("examType", "Exam")).replace(" ", "_")[:20]
     subject_code_short = str(exam_details_for_pdf_gen.get("subjectCode", "UnknownSub"))
     course_short = str(exam_details_for_pdf_gen.get("course", "UnknownCourse")).replace(" ","_")[:15]
     section_short = str(exam_details_for_pdf_gen.get("sectionType", "AllSections"))
     base_filename = f"{roll_no}_{course_short}_{subject_code_short}_{exam_type_short}_{section_short}_marksheet"
     
-    csv_name = os.path.join(OUTPUT_DIR_MARKETSHEETS, f"{base_filename}.csv")
-    pdf_name = os.path.join(OUTPUT_DIR_MARKETSHEETS, f"{base_filename}.pdf")
-    tmp_docx = os.path.join(OUTPUT_DIR_MARKETSHEETS, f"tmp_{base_filename}.docx")
-
  
     df_student_scores['max_marks'] = pd.to_numeric(df_student_scores['max_marks'], errors='coerce').fillna(0).astype(int)
     df_student_scores['score'] = pd.to_numeric(df_student_scores['score'], errors='coerce').fillna(0).astype(int)
     
-    df_student_scores["percentage"] = df_student_scores.apply(
-        lambda row: round((row["score"] / row["max_marks"]) * 100, 2) if row["max_marks"] > 0 else 0.0, axis=1
-    )
+    df_student_scores["percentage"] = percentage_column(df_student_scores["score"], df_student_scores["max_marks"])
     
     total_score = df_student_scores["score"].sum() if not df_student_scores.empty else 0
 
@@ -310,13 +337,14 @@ def build_student_pdf_with_pandoc(df_student_scores: pd.DataFrame, roll_no: str,
         sheet = summary_df[cols_for_sheet].astype(str)
 
 
+    csv_buffer = None
     try:
 
         logical_sheet_for_csv = pd.concat([df_student_scores[cols_for_sheet], summary_df[cols_for_sheet]], ignore_index=True) if not df_student_scores.empty else summary_df[cols_for_sheet]
-        logical_sheet_for_csv.to_csv(csv_name, index=False)
-        print(f"INFO (MarksheetGen): Student scores CSV saved to {csv_name}", file=sys.stderr)
+        csv_buffer = BytesIO(logical_sheet_for_csv.to_csv(index=False).encode("utf-8"))
+        print(f"INFO (MarksheetGen): Student scores CSV rendered for {roll_no}", file=sys.stderr)
     except Exception as e:
-        print(f"ERROR (MarksheetGen): Could not save CSV {csv_name}. Error: {e}", file=sys.stderr)
+        print(f"ERROR (MarksheetGen): Could not render CSV for {roll_no}. Error: {e}", file=sys.stderr)
 
 
     doc = Document()
@@ -388,32 +416,31 @@ def build_student_pdf_with_pandoc(df_student_scores: pd.DataFrame, roll_no: str,
         doc.add_paragraph("No scores to display.")
     
 
-    pdf_generated_successfully = False
+    pdf_buffer = None
     try:
-        doc.save(tmp_docx)
-        print(f"INFO (MarksheetGen): Temporary DOCX saved to {tmp_docx}", file=sys.stderr)
-        
-        # --- PANDOC CONVERSION ---
-        print(f"INFO (MarksheetGen): Attempting to convert DOCX '{tmp_docx}' to PDF '{pdf_name}' using Pandoc...", file=sys.stderr)
+        docx_buffer = BytesIO()
+        with metrics.timer("docx_render"):
+            doc.save(docx_buffer)
+
+        # --- PANDOC CONVERSION (DOCX on stdin, PDF on stdout; nothing touches the disk) ---
+        print(f"INFO (MarksheetGen): Attempting to convert DOCX to PDF for student {roll_no} using Pandoc...", file=sys.stderr)
         pandoc_command = [
-            'pandoc', tmp_docx,
-            '-o', pdf_name,
+            'pandoc', '-f', 'docx', '-t', 'pdf',
+            '-o', '-',
         ]
-        process = subprocess.run(pandoc_command, capture_output=True, text=True, check=False)
+        with metrics.timer("pandoc_render"):
+            process = subprocess.run(pandoc_command, input=docx_buffer.getvalue(), capture_output=True, check=False)
 
         if process.returncode == 0:
-            if os.path.exists(pdf_name) and os.path.getsize(pdf_name) > 0:
-                pdf_generated_successfully = True
-                print(f"INFO (MarksheetGen): PDF for student {roll_no} created successfully using Pandoc at {pdf_name}", file=sys.stderr)
+            if process.stdout:
+                pdf_buffer = BytesIO(process.stdout)
+                print(f"INFO (MarksheetGen): PDF for student {roll_no} created successfully using Pandoc ({len(process.stdout)} bytes)", file=sys.stderr)
             else:
-                print(f"ERROR (MarksheetGen): Pandoc command succeeded (return code 0) but PDF '{pdf_name}' was not created or is empty.", file=sys.stderr)
-                print(f"Pandoc stdout:\n{process.stdout}", file=sys.stderr)
-                print(f"Pandoc stderr:\n{process.stderr}", file=sys.stderr)
+                print(f"ERROR (MarksheetGen): Pandoc command succeeded (return code 0) but produced no PDF bytes.", file=sys.stderr)
+                print(f"Pandoc stderr:\n{process.stderr.decode('utf-8', errors='replace')}", file=sys.stderr)
         else:
             print(f"ERROR (MarksheetGen): Pandoc conversion failed for student {roll_no}. Return code: {process.returncode}", file=sys.stderr)
-            print(f"Pandoc stdout:\n{process.stdout}", file=sys.stderr)
-            print(f"Pandoc stderr:\n{process.stderr}", file=sys.stderr)
-            
+            print(f"Pandoc stderr:\n{process.stderr.decode('utf-8', errors='replace')}", file=sys.stderr)
 
     except FileNotFoundError:
         print(f"ERROR (MarksheetGen): Pandoc command not found. Please ensure Pandoc is installed and in your system's PATH.", file=sys.stderr)
@@ -421,25 +448,10 @@ def build_student_pdf_with_pandoc(df_student_scores: pd.DataFrame, roll_no: str,
     except Exception as e_conv:
         print(f"ERROR (MarksheetGen): DOCX to PDF conversion using Pandoc failed for student {roll_no}. Error: {e_conv}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
-    finally:
-       
-        if os.path.exists(tmp_docx):
-            if pdf_generated_successfully :
-                try:
-                    os.remove(tmp_docx)
-                    print(f"INFO (MarksheetGen): Temp DOCX file {tmp_docx} removed.", file=sys.stderr)
-                except OSError as e_del:
-                    print(f"WARNING (MarksheetGen): Could not remove temp file {tmp_docx}. Error: {e_del}", file=sys.stderr)
-            else:
-                print(f"INFO (MarksheetGen): Temp DOCX file {tmp_docx} was KEPT for debugging due to Pandoc failure.", file=sys.stderr)
-
 
-    if pdf_generated_successfully:
-        return pdf_name, csv_name
-    else:
-        print(f"WARNING (MarksheetGen): PDF generation ultimately failed or file not confirmed for {roll_no}. Returning None for PDF path.", file=sys.stderr)
-        
-        return None, csv_name 
+    if pdf_buffer is None:
+        print(f"WARNING (MarksheetGen): PDF generation ultimately failed for {roll_no}. Returning None for PDF buffer.", file=sys.stderr)
+    return pdf_buffer, csv_buffer, base_filename
 
 build_student_pdf = build_student_pdf_with_pandoc
 
@@ -459,6 +471,36 @@ def generate_student_result_service(
     semester_arg: int,
     section_type_arg: str,
     logo_img_path_param: str = LOGO_IMAGE_PATH # Default to global LOGO_IMAGE_PATH
+) -> Dict[str, Any]:
+    """Runs the marksheet job and stores its stage timings on the Results document it wrote."""
+    init_mongo()
+    with metrics.job("marksheet") as job_metrics:
+        result = _generate_student_result_service(
+            student_roll_no_arg, course_arg, subject_code_arg, exam_type_arg,
+            year_arg, semester_arg, section_type_arg, logo_img_path_param
+        )
+    # Cached and error returns did no work worth recording (and may have no Results document).
+    status = str(result.get("status", ""))
+    if status.startswith("success") and status != "success_cached":
+        metrics.save_job_summary(
+            results_collection,
+            {"rollNo": student_roll_no_arg, "criteria.courseName": course_arg, "criteria.subjectCode": subject_code_arg,
+             "criteria.examType": exam_type_arg, "criteria.year": year_arg, "criteria.semester": semester_arg,
+             "criteria.sectionType": section_type_arg},
+            job_metrics,
+        )
+    return result
+
+
+def _generate_student_result_service(
+    student_roll_no_arg: str,
+    course_arg: str,
+    subject_code_arg: str,
+    exam_type_arg: str,
+    year_arg: int,
+    semester_arg: int,
+    section_type_arg: str,
+    logo_img_path_param: str
 ) -> Dict[str, Any]:
     print(f"INFO (MarksheetGen): Service call - RollNo: {student_roll_no_arg}, Course: {course_arg}, SubjectCode: {subject_code_arg}, ExamType: {exam_type_arg}, Year: {year_arg}, Sem: {semester_arg}, Section: {section_type_arg}", file=sys.stderr)
 
@@ -509,7 +551,7 @@ def generate_student_result_service(
 
     if existing_result and existing_result.get("gridFsPdfId"):
         try:
-            if fs_results_bucket.exists(ObjectId(existing_result["gridFsPdfId"])):
+            if next(iter(fs_results_bucket.find({"_id": ObjectId(existing_result["gridFsPdfId"])}).limit(1)), None) is not None:
                  print(f"INFO (MarksheetGen): Cached result for {student_roll_no_arg} found. GridFS ID: {existing_result['gridFsPdfId']}", file=sys.stderr)
                  return {"status": "success_cached", "message": "Result previously generated and found.", "data": existing_result}
             else: # Record exists but GridFS file is missing
@@ -517,6 +559,9 @@ def generate_student_result_service(
         except Exception as e_gridfs_check: # Invalid ObjectId or other GridFS error
              print(f"WARNING (MarksheetGen): Error checking GridFS for {existing_result.get('gridFsPdfId', 'N/A')}: {e_gridfs_check}. Regenerating result for {student_roll_no_arg}.", file=sys.stderr)
 
+    # Past the cache check: this run scores and renders, so it needs the full stack.
+    load_scoring_modules()
+
     # 2. Fetch Student Data
     print(f"DEBUG (MarksheetGen): Querying 'studentuploads' with: {student_query_criteria}", file=sys.stderr)
     student_doc = studentuploads_collection.find_one(student_query_criteria)
@@ -584,24 +629,31 @@ def generate_student_result_service(
 
     # 5. Generate PDF using the new Pandoc function (aliased to build_student_pdf)
     print(f"INFO (MarksheetGen): Building PDF for student {student_roll_no_arg} using Pandoc...", file=sys.stderr)
-    pdf_file_path, csv_file_path = build_student_pdf(scored_df, student_roll_no_arg, logo_img_path_param, exam_details_for_pdf_generation)
+    pdf_buffer, csv_buffer, base_filename = build_student_pdf(scored_df, student_roll_no_arg, logo_img_path_param, exam_details_for_pdf_generation)
 
-    # 6. Upload to GridFS
+    # 6. Stream to GridFS
     gridfs_file_id_str = None
-    # Check if pdf_file_path is not None and points to an actual PDF file
-    if pdf_file_path and pdf_file_path.lower().endswith(".pdf") and os.path.exists(pdf_file_path) and os.path.getsize(pdf_file_path) > 0:
-        pdf_filename_on_disk = os.path.basename(pdf_file_path)
-        # Define metadata for GridFS to make search/delete more specific
-        gridfs_metadata = {
-            "rollNo": student_roll_no_arg, "courseName": course_arg,
-            "subjectCode": subject_code_arg, "examType": exam_type_arg,
-            "year": year_arg, "semester": semester_arg,
-            "sectionType": exam_details_for_pdf_generation["sectionType"], # Use section from prof doc for consistency
-            "type": "student_marksheet",
-            "generatedAt": datetime.now(timezone.utc) # Use timezone-aware datetime
-        }
+    gridfs_csv_id_str = None
+    # Define metadata for GridFS to make search/delete more specific
+    gridfs_metadata = {
+        "rollNo": student_roll_no_arg, "courseName": course_arg,
+        "subjectCode": subject_code_arg, "examType": exam_type_arg,
+        "year": year_arg, "semester": semester_arg,
+        "sectionType": exam_details_for_pdf_generation["sectionType"], # Use section from prof doc for consistency
+        "type": "student_marksheet",
+        "generatedAt": datetime.now(timezone.utc) # Use timezone-aware datetime
+    }
+    uploads = []
+    if pdf_buffer is not None:
+        uploads.append((f"{base_filename}.pdf", pdf_buffer, 'application/pdf', "student_marksheet"))
+    else:
+        print(f"INFO (MarksheetGen): No PDF generated for {student_roll_no_arg}. Nothing to upload to GridFS.", file=sys.stderr)
+    if csv_buffer is not None:
+        uploads.append((f"{base_filename}.csv", csv_buffer, 'text/csv', "student_marksheet_csv"))
+
+    for gridfs_filename, buffer, content_type, file_type in uploads:
         # Delete existing GridFS files matching this specific metadata to prevent duplicates from reruns
-        delete_query_fs = {"filename": pdf_filename_on_disk, "metadata.rollNo": student_roll_no_arg, "metadata.subjectCode": subject_code_arg, "metadata.examType": exam_type_arg} # Simplified delete query
+        delete_query_fs = {"filename": gridfs_filename, "metadata.rollNo": student_roll_no_arg, "metadata.subjectCode": subject_code_arg, "metadata.examType": exam_type_arg} # Simplified delete query
         for old_file in fs_results_bucket.find(delete_query_fs):
             try:
                 fs_results_bucket.delete(old_file._id)
@@ -609,17 +661,19 @@ def generate_student_result_service(
             except Exception as e_del_fs:
                 print(f"WARNING (MarksheetGen): Could not delete old GridFS file {old_file.filename}. Error: {e_del_fs}", file=sys.stderr)
 
-        with open(pdf_file_path, "rb") as f_pdf:
-            gridfs_id = fs_results_bucket.put(
-                f_pdf, filename=pdf_filename_on_disk, contentType='application/pdf',
-                metadata=gridfs_metadata
+        buffer.seek(0)
+        # contentType is kept in metadata; GridFSBucket does not write the deprecated top-level field.
+        with metrics.timer("gridfs_put"):
+            gridfs_id = fs_results_bucket.upload_from_stream(
+                gridfs_filename, buffer,
+                metadata={**gridfs_metadata, "type": file_type, "contentType": content_type}
             )
+        metrics.increment("gridfs_bytes_written", buffer.getbuffer().nbytes)
+        if file_type == "student_marksheet":
             gridfs_file_id_str = str(gridfs_id)
-        print(f"INFO (MarksheetGen): Marksheet '{pdf_filename_on_disk}' uploaded to GridFS. ID: {gridfs_file_id_str}", file=sys.stderr)
-    elif pdf_file_path and not (pdf_file_path.lower().endswith(".pdf") and os.path.exists(pdf_file_path) and os.path.getsize(pdf_file_path) > 0) :
-        print(f"ERROR (MarksheetGen): PDF path '{pdf_file_path}' was returned, but it's not a valid PDF file or is empty. Not uploaded.", file=sys.stderr)
-    elif not pdf_file_path: # pdf_file_path is None
-         print(f"INFO (MarksheetGen): No PDF generated (path is None) for {student_roll_no_arg}. Nothing to upload to GridFS.", file=sys.stderr)
+        else:
+            gridfs_csv_id_str = str(gridfs_id)
+        print(f"INFO (MarksheetGen): '{gridfs_filename}' uploaded to GridFS. ID: {gridfs_id}", file=sys.stderr)
 
 
     # 7. Save result summary to 'results' collection
@@ -660,12 +714,12 @@ def generate_student_result_service(
         "overallPercentage": percentage, 
         "generatedAt": datetime.now(timezone.utc), # Use timezone-aware UTC datetime
         "gridFsPdfId": gridfs_file_id_str, # This will be None if PDF upload failed
-        "localCsvPath": os.path.abspath(csv_file_path) if csv_file_path and os.path.exists(csv_file_path) else None
+        "gridFsCsvId": gridfs_csv_id_str
     }
 
     try:
         # Use the same result_query_criteria for update_one to ensure consistency
-        results_collection.update_one(result_query_criteria, {"$set": result_document_payload}, upsert=True)
+        results_collection.update_one(result_query_criteria, {"$set": result_document_payload, "$unset": {"localCsvPath": ""}}, upsert=True)
         print(f"INFO (MarksheetGen): Result for {student_roll_no_arg} saved/updated in '{RESULTS_COLLECTION_NAME}'.", file=sys.stderr)
     except Exception as e_db_res:
         print(f"ERROR (MarksheetGen): Failed to save result to DB for {student_roll_no_arg}. Error: {e_db_res}", file=sys.stderr)
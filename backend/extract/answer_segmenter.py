@@ -0,0 +1,207 @@
+"""
+answer_segmenter.py
+
+Splits the OCR text of an answer script into {question_id, answer_text} entries
+at question headings (Q2, Answer-3a, 4b), 5., a bare 6 at the start of a line...).
+
+`segment_regex_chain` is the original implementation: five re.sub passes
+rewrite every heading to "Answer <id>\\n" and a final finditer cuts the text at
+those markers. `segment` produces the same entries in one scan: a single
+precompiled alternation finds the headings in text order and the answers are
+sliced straight out of the input. The alternatives mirror the passes:
+
+  p1  keyword headings          "Answer 1", "Q-3", "ques 2a:"   (re.sub pass 1)
+  p2  sub-question with ")"     "2a)"                           (pass 2)
+  p3  number + "." + space      "1. ", "3a. "                   (pass 3)
+  p4  number + ")" + space      "4) "                           (pass 4)
+  p5  bare number at line start "6 "                            (pass 5)
+  p6  "...answer 7\\n" glued to a preceding word, which only the final
+      finditer of the chain picks up
+
+Each rewrite of the chain ends in a newline, so a bare number right after a
+p1-p4 heading counts as being at the start of a line; `segment` checks for one
+there. SEGMENTER=regex-chain switches Student back to the original.
+
+`IncrementalSegmenter` runs the same scan page by page, so a script can be
+segmented while its later pages are still being OCR'd; `BufferedSegmenter`
+gives a whole-text segmenter (the regex chain) the same feed/close interface.
+benchmark_segmenter.py compares them on OCR corpora and times them.
+"""
+import re
+from typing import Dict, List, Tuple
+
+# Headings (p1-p4 after a word boundary) and p6 start with a digit or a/q/s: the lookahead turns
+# every other position away before any alternative is tried. No two alternatives can match at the
+# same position, so their order does not change the result.
+_MARKER = re.compile(
+    r"(?=[0-9aAqQsS\u017f])(?:"  # U+017F (long s) matches "s" under (?i)
+    r"\b(?:(?i:(?:answer|ans|question|ques|q|solution)[\s\-]*(?P<p1>[0-9]+[a-z]?)\b[\.\):]?)"
+    r"|(?i:(?P<p2>[0-9]+[a-z])\))"
+    r"|(?P<p3>[0-9]+[a-z]?)\.\s"
+    r"|(?P<p4>[0-9]+[a-z]?)\)\s)"
+    r"|(?i:(?<=\w)answer(?=[^\S\n]+[0-9]|\s+[0-9]+(?-i:(?![a-z]))[a-z]\s*\n)\s+(?P<p6>[0-9]+[a-z]?)\s*\n))"
+    r"|(?m:^)\s*(?P<p5>[0-9]+[a-z]?)\s"
+)
+# A bare number right after a rewritten heading (the chain's inserted newline makes it a line start).
+_BARE_AFTER_HEADING = re.compile(r"\s*([0-9]+[a-z]?)\s")
+_HEADING_GROUPS = frozenset(("p1", "p2", "p3", "p4"))
+# The unbounded parts of the patterns only run over whitespace, hyphens and digits, and no match
+# (with the bare number after it) reads more than ~12 other characters. A position followed by
+# this many other characters is settled: text appended later cannot change a match starting there.
+_SETTLE_CHARS = 32
+
+
+def _scan(text: str, pos: int, limit: int) -> Tuple[List[Tuple[int, int, str]], int]:
+    """
+    Headings from `pos` on that start before `limit`, and the position to resume scanning from
+    (the end of the last one, or `limit` when no further heading starts before it).
+    """
+    markers = []
+    search = _MARKER.search
+    while True:
+        m = search(text, pos)
+        if m is None or m.start() >= limit:
+            return markers, max(pos, min(limit, len(text)))
+        kind, end = m.lastgroup, m.end()
+        markers.append((m.start(), end, m.group(kind)))
+        if kind in _HEADING_GROUPS:
+            bare = _BARE_AFTER_HEADING.match(text, end)
+            if bare is not None:
+                end = bare.end()
+                markers.append((bare.start(), end, bare.group(1)))
+        pos = end
+
+
+def find_markers(text: str, pos: int = 0) -> List[Tuple[int, int, str]]:
+    """(start, end, question id) of every heading from `pos` on, in text order."""
+    return _scan(text, pos, len(text))[0]
+
+
+def _answers_between(text: str, markers: List[Tuple[int, int, str]]) -> List[Dict]:
+    answers = []
+    for i, (_, end, q_id) in enumerate(markers):
+        stop = markers[i + 1][0] if i + 1 < len(markers) else len(text)
+        answer_text = text[end:stop].strip()
+        if answer_text:
+            answers.append({"question_id": q_id, "answer_text": answer_text})
+    return answers
+
+
+def segment(text: str) -> List[Dict]:
+    markers = find_markers(text)
+    if not markers:
+        raise ValueError("No answer markers found after normalization.")
+    return _answers_between(text, markers)
+
+
+def segment_regex_chain(text: str) -> List[Dict]:
+    # Normalize full labels like "Answer 1", "Q-3", etc.
+    text = re.sub(
+        r"(?i)\b(?:answer|ans|question|ques|q|solution)[\s\-]*([0-9]+[a-z]?)\b[\.\):]?",
+        r"Answer \1\n", text
+    )
+
+    # Normalize sub-question formats like "2a)", "4f)"
+    text = re.sub(
+        r"\b([0-9]+[a-z])\)", r"Answer \1\n", text, flags=re.IGNORECASE
+    )
+
+    # Normalize "1." or "3a." style
+    text = re.sub(r"\b([0-9]+[a-z]?)\.\s", r"Answer \1\n", text)
+    text = re.sub(r"\b([0-9]+[a-z]?)\)\s", r"Answer \1\n", text)
+
+    # ✅ New: Normalize bare numbers at start of line like "3 Context..."
+    text = re.sub(r"(?m)^\s*([0-9]+[a-z]?)\s", r"Answer \1\n", text)
+
+    # Segment answers
+    pattern = re.compile(r"Answer\s+([0-9]+[a-z]?)\s*\n", flags=re.IGNORECASE)
+    matches = list(pattern.finditer(text))
+    if not matches:
+        raise ValueError("No answer markers found after normalization.")
+
+    answers = []
+    for i, m in enumerate(matches):
+        q_id = m.group(1)
+        start = m.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        answer_text = text[start:end].strip()
+        if answer_text:
+            answers.append({"question_id": q_id, "answer_text": answer_text})
+
+    return answers
+
+
+def _settled_until(text: str) -> int:
+    """Position before which the headings found in `text` stay the same when text is appended."""
+    seen = 0
+    for i in range(len(text) - 1, -1, -1):
+        c = text[i]
+        if not (c.isspace() or c == "-" or "0" <= c <= "9"):
+            seen += 1
+            if seen == _SETTLE_CHARS:
+                return i
+    return 0
+
+
+class IncrementalSegmenter:
+    """
+    `segment` fed one page at a time. feed(page_text) returns the answers completed by that page
+    (an answer is complete once the next heading is settled); close() returns the rest. The
+    answers are the same as segment("\n".join(pages)). Only the open answer and a short tail are
+    buffered, so the whole script never has to be held.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0        # scanning resumes here; no heading starts in _buf[:_pos] after _open
+        self._open = None    # (question id, start of its text in _buf)
+        self._pages = 0
+        self._markers = 0
+
+    def feed(self, page_text: str) -> List[Dict]:
+        self._buf += ("\n" if self._pages else "") + page_text
+        self._pages += 1
+        return self._advance(_settled_until(self._buf))
+
+    def close(self) -> List[Dict]:
+        answers = self._advance(len(self._buf))
+        if self._open is not None:
+            answers += _answers_between(self._buf, [(0, self._open[1], self._open[0])])
+        if not self._markers:
+            raise ValueError("No answer markers found after normalization.")
+        return answers
+
+    def _advance(self, limit: int) -> List[Dict]:
+        markers, self._pos = _scan(self._buf, self._pos, limit)
+        answers = []
+        if markers:
+            self._markers += len(markers)
+            if self._open is not None:
+                markers.insert(0, (0, self._open[1], self._open[0]))
+            answers = _answers_between(self._buf[:markers[-1][0]], markers[:-1])
+            self._open = (markers[-1][2], markers[-1][1])
+        # Text before the open answer is done with; keep one character before it (^, \b and the
+        # lookbehinds look at it).
+        cut = max((self._open[1] if self._open is not None else self._pos) - 1, 0)
+        if cut:
+            self._buf = self._buf[cut:]
+            self._pos -= cut
+            if self._open is not None:
+                self._open = (self._open[0], self._open[1] - cut)
+        return answers
+
+
+class BufferedSegmenter:
+    """The IncrementalSegmenter interface for a whole-text segmenter: pages are joined and segmented on close()."""
+
+    def __init__(self, segment_fn=segment_regex_chain):
+        self._segment = segment_fn
+        self._pages: List[str] = []
+
+    def feed(self, page_text: str) -> List[Dict]:
+        self._pages.append(page_text)
+        return []
+
+    def close(self) -> List[Dict]:
+        text, self._pages = "\n".join(self._pages), []
+        return self._segment(text)
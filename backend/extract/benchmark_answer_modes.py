@@ -0,0 +1,143 @@
+"""
+benchmark_answer_modes.py
+
+Compares the two answer-key generation modes of Answer_from_book
+(ANSWER_GENERATION_MODE=separate: three completions per question, =multi: one
+JSON-mode completion) on real professor uploads from Mongo.
+
+For each mode it regenerates the answer key of every selected upload (same
+questions, same book context) and reports wall time, LLM calls, prompt /
+completion tokens and multi-mode fallbacks. It then scores the upload's students
+against each key through the Combined_Results path and reports how far the
+similarities and marks of the multi key are from the separate key.
+
+LLM output varies between runs anyway; --baseline-rerun generates the separate
+key a second time so that run-to-run variation is reported next to the mode
+difference:
+
+    python benchmark_answer_modes.py --subject_code CA712 --uploads 2 --baseline-rerun --output modes.json
+
+The LLM response cache is disabled for the run. Set GROQ_BASE_URL to
+mock_groq_server.py for an offline dry run.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import contextlib
+from typing import Any, Dict, List, Tuple
+
+os.environ["LLM_CACHE_ENABLED"] = "false"  # a cached reply would hide the cost of the mode under test
+
+import Answer_from_book as afb
+import Combined_Results as cr
+import metrics
+from benchmark_embeddings import score_uploads, compare_score_tables
+
+PROJECT_ROOT_DIR = os.path.abspath(os.path.join(afb.SCRIPT_DIR, "..", ".."))
+
+
+def select_uploads(args) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {"processedJSON.0": {"$exists": True}, "bookAnswer": {"$exists": True}}
+    if args.subject_code:
+        query["subjectCode"] = args.subject_code
+    if args.exam_type:
+        query["examType"] = args.exam_type
+    return list(cr.professoruploads_collection.find(query, {"processedJSON": 1, "bookAnswer": 1})
+                .sort("uploadedAt", -1).limit(args.uploads))
+
+
+def generate_key(mode: str, questions: List[Dict[str, Any]], paragraphs: List[str], index) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Answer key for `questions` in `mode`, plus the job's LLM statistics."""
+    afb.ANSWER_GENERATION_MODE = mode
+    key = copy.deepcopy(questions)
+    start = time.perf_counter()
+    with metrics.job(f"answers_{mode}") as job_metrics, contextlib.redirect_stdout(sys.stderr):
+        afb.process_all_questions(key, paragraphs, index)
+    summary = job_metrics.summary()
+    counters = summary["counters"]
+    return key, {
+        "sec": round(time.perf_counter() - start, 3),
+        "llmCalls": summary["stages"].get("llm_call", {}).get("count", 0),
+        "promptTokens": int(counters.get("llm_prompt_tokens", 0)),
+        "completionTokens": int(counters.get("llm_completion_tokens", 0)),
+        "multiFallbacks": int(counters.get("answer_multi_fallbacks", 0)),
+        "retries": int(counters.get("llm_retries", 0)),
+    }
+
+
+def add_totals(total: Dict[str, Any], stats: Dict[str, Any]) -> None:
+    for name, value in stats.items():
+        total[name] = round(total.get(name, 0) + value, 3)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare separate vs single-call (multi) answer-key generation.")
+    parser.add_argument("--subject_code")
+    parser.add_argument("--exam_type")
+    parser.add_argument("--uploads", type=int, default=2, help="Most recent matching professor uploads to use.")
+    parser.add_argument("--max-students", type=int, default=200, help="Students scored per upload.")
+    parser.add_argument("--baseline-rerun", action="store_true", help="Also measure separate-vs-separate variation.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    cr.init_mongo()
+    cr.load_scoring_modules()
+    uploads = select_uploads(args)
+    if not uploads:
+        print("ERROR (AnswerModeBench): No professor uploads with processedJSON and a book match the filters.", file=sys.stderr)
+        return 1
+
+    modes = ["separate", "multi"] + (["separate_rerun"] if args.baseline_rerun else [])
+    keyed_uploads: Dict[str, List[Dict[str, Any]]] = {mode: [] for mode in modes}
+    generation: Dict[str, Dict[str, Any]] = {mode: {} for mode in modes}
+    questions_total = 0
+    for doc in uploads:
+        questions = [{k: v for k, v in q.items() if k != "Answers"} for q in doc["processedJSON"] if isinstance(q, dict)]
+        questions_total += len(questions)
+        book_path = os.path.normpath(os.path.join(PROJECT_ROOT_DIR, doc["bookAnswer"]))
+        with contextlib.redirect_stdout(sys.stderr):
+            paragraphs, index = afb.get_paragraphs_and_faiss_index(
+                book_path, afb.WINDOW_SIZE, afb.STEP_SIZE, afb.MIN_PARAGRAPH_WORDS
+            )
+        if index is None:
+            print(f"WARN (AnswerModeBench): No book index for upload {doc['_id']}; skipping.", file=sys.stderr)
+            continue
+        for mode in modes:
+            print(f"INFO (AnswerModeBench): Upload {doc['_id']}: generating {len(questions)} answers ({mode})...", file=sys.stderr)
+            key, stats = generate_key(mode.replace("_rerun", ""), questions, paragraphs, index)
+            add_totals(generation[mode], stats)
+            keyed_uploads[mode].append({"_id": doc["_id"], "processedJSON": key})
+
+    with contextlib.redirect_stdout(sys.stderr):
+        tables = {mode: score_uploads(docs, args.max_students)["table"] for mode, docs in keyed_uploads.items()}
+    if tables["separate"].empty:
+        print("ERROR (AnswerModeBench): The selected uploads have no scored student answers.", file=sys.stderr)
+        return 1
+
+    report: Dict[str, Any] = {
+        "model": afb.GROQ_MODEL,
+        "uploads": [str(d["_id"]) for d in uploads],
+        "questions": questions_total,
+        "generation": generation,
+        "multiVsSeparate": compare_score_tables(tables["separate"], tables["multi"]),
+    }
+    if args.baseline_rerun:
+        report["separateRerunVsSeparate"] = compare_score_tables(tables["separate"], tables["separate_rerun"])
+    if generation["multi"].get("sec"):
+        report["speedup"] = round(generation["separate"]["sec"] / generation["multi"]["sec"], 2)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
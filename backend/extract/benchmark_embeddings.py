@@ -0,0 +1,153 @@
+"""
+benchmark_embeddings.py
+
+Accuracy-delta and speed report for the embedding backends (embedding_service.py):
+fp32 SentenceTransformer ("torch") against the int8 ONNX Runtime model
+("onnx-int8").
+
+It scores real exam data from Mongo with each backend through the same code
+path as Combined_Results: the reference answers of each selected professor
+upload against the answers of its students. It then compares the per-question
+similarities and the marks they earn under the current SCORE_BANDS:
+
+    python benchmark_embeddings.py --course MCA --subject_code CA712 --uploads 5 --output emb.json
+
+Report (JSON on stdout): similarity delta (mean / p95 / max absolute, Pearson r),
+how many question scores change and by how much, and per backend the embedding
+time and texts/second for the same texts (answer key + student answers).
+"""
+from __future__ import annotations
+
+import sys
+import json
+import time
+import argparse
+import contextlib
+from typing import Any, Dict, List
+
+import numpy as np
+
+import Combined_Results as cr
+import embedding_service
+from grading import SCORE_BANDS
+
+BACKENDS = ("torch", "onnx-int8")
+
+
+def select_uploads(args) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {"processedJSON.0": {"$exists": True}}
+    if args.course:
+        query["course"] = args.course
+    if args.subject_code:
+        query["subjectCode"] = args.subject_code
+    if args.exam_type:
+        query["examType"] = args.exam_type
+    if args.year:
+        query["year"] = args.year
+    return list(cr.professoruploads_collection.find(query, {"processedJSON": 1, "subjectCode": 1, "examType": 1})
+                .sort("uploadedAt", -1).limit(args.uploads))
+
+
+def score_uploads(uploads: List[Dict[str, Any]], max_students: int) -> Dict[str, Any]:
+    """Scores every selected upload with the currently installed cr.embedding_model."""
+    frames, texts = [], 0
+    start = time.perf_counter()
+    for doc in uploads:
+        reference = cr.parse_reference_answers_from_processed_json(doc["processedJSON"])
+        ref_vecs = cr.build_reference_vectors(reference)
+        max_marks_map = {q["question_id"]: q["max_marks"] for q in reference["questions"]}
+        texts += 3 * len(reference["questions"])
+        for i, student in enumerate(cr.iter_students_for_upload(doc["_id"])):
+            if i >= max_students:
+                break
+            df = cr.calculate_similarity_for_student(student, ref_vecs, max_marks_map)
+            if not df.empty:
+                df["upload_id"] = str(doc["_id"])
+                frames.append(df)
+                texts += int((df["student_answer_summary"] != "Not Answered").sum())
+    elapsed = time.perf_counter() - start
+    table = cr.pd.concat(frames, ignore_index=True) if frames else cr.pd.DataFrame()
+    return {"table": table, "sec": elapsed, "texts": texts}
+
+
+def compare_score_tables(base, other) -> Dict[str, Any]:
+    """Similarity / marks differences between two score_uploads tables over the same students."""
+    answered = (base["student_answer_summary"] != "Not Answered").to_numpy()
+    sim_base = base["similarity"].to_numpy(dtype=np.float64)[answered]
+    sim_other = other["similarity"].to_numpy(dtype=np.float64)[answered]
+    delta = np.abs(sim_other - sim_base)
+    score_diff = (other["score"].to_numpy() - base["score"].to_numpy())[answered]
+    return {
+        "answeredQuestions": int(answered.sum()),
+        "similarity": {
+            "meanAbsDelta": round(float(delta.mean()), 5) if delta.size else 0.0,
+            "p95AbsDelta": round(float(np.percentile(delta, 95)), 5) if delta.size else 0.0,
+            "maxAbsDelta": round(float(delta.max()), 5) if delta.size else 0.0,
+            "pearsonR": round(float(np.corrcoef(sim_base, sim_other)[0, 1]), 5) if delta.size > 1 else None,
+        },
+        "scores": {
+            "changed": int((score_diff != 0).sum()),
+            "changedPct": round(100.0 * float((score_diff != 0).mean()), 2) if score_diff.size else 0.0,
+            "maxAbsMarksDiff": int(np.abs(score_diff).max()) if score_diff.size else 0,
+            "netMarksDiff": int(score_diff.sum()),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare similarity scores of the fp32 and int8 ONNX embedding backends.")
+    parser.add_argument("--course")
+    parser.add_argument("--subject_code")
+    parser.add_argument("--exam_type")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--uploads", type=int, default=5, help="Most recent matching professor uploads to score.")
+    parser.add_argument("--max-students", type=int, default=500, help="Per upload.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    cr.init_mongo()
+    cr.load_scoring_modules()
+    uploads = select_uploads(args)
+    if not uploads:
+        print("ERROR (EmbeddingBench): No professor uploads with processedJSON match the filters.", file=sys.stderr)
+        return 1
+
+    runs: Dict[str, Dict[str, Any]] = {}
+    for backend in BACKENDS:
+        print(f"INFO (EmbeddingBench): Scoring {len(uploads)} upload(s) with {backend}...", file=sys.stderr)
+        cr.embedding_model = embedding_service.load_model(cr.EMBEDDING_MODEL_NAME, backend)
+        with contextlib.redirect_stdout(sys.stderr):
+            score_uploads(uploads[:1], max_students=2)  # warm-up (first-call allocation, lazy export)
+            runs[backend] = score_uploads(uploads, args.max_students)
+
+    base, quant = runs["torch"]["table"], runs["onnx-int8"]["table"]
+    if base.empty:
+        print("ERROR (EmbeddingBench): The selected uploads have no scored student answers.", file=sys.stderr)
+        return 1
+    report = {
+        "model": cr.EMBEDDING_MODEL_NAME,
+        "uploads": [str(d["_id"]) for d in uploads],
+        "scoreBands": SCORE_BANDS,
+        **compare_score_tables(base, quant),
+        "speed": {
+            backend: {
+                "sec": round(run["sec"], 3),
+                "texts": run["texts"],
+                "textsPerSec": round(run["texts"] / run["sec"], 1) if run["sec"] else None,
+            }
+            for backend, run in runs.items()
+        },
+    }
+    report["speed"]["speedup"] = (round(runs["torch"]["sec"] / runs["onnx-int8"]["sec"], 2)
+                                  if runs["onnx-int8"]["sec"] else None)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+benchmark_image_prep.py
+
+OCR-accuracy and payload comparison of the vision request images: the previous
+payload (full-colour page, default JPEG) against image_prep.py's prepared pages
+(grayscale, deskewed, downscaled, re-encoded; header crop for roll numbers).
+
+Every page of the given answer-script PDFs is OCR'd with both payloads through
+Student's vision calls. There is no ground truth, so the prepared text is
+scored against the previous text: word error rate (word-level edit distance /
+previous word count) and character similarity. On header pages the roll number
+read from the cropped header is checked against the one read from the full page.
+
+LLM output varies between calls anyway; --baseline-rerun OCRs the previous
+payload a second time so that run-to-run variation is reported next to the
+preparation difference:
+
+    python benchmark_image_prep.py scripts/a.pdf scripts/b.pdf --max-pages 20 --baseline-rerun --output prep.json
+
+The LLM response cache is disabled for the run. Set GROQ_BASE_URL to
+mock_groq_server.py for an offline dry run. The OCR_IMAGE_* settings of the
+environment are the ones measured.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import difflib
+import statistics
+from typing import Any, Dict, List
+
+os.environ["LLM_CACHE_ENABLED"] = "false"  # a cached reply would hide the payload under test
+
+from pdf2image import convert_from_path
+
+import image_prep
+from Answer_Generator import Student
+
+
+def word_errors(reference: str, hypothesis: str) -> int:
+    """Word-level edit distance."""
+    ref, hyp = reference.split(), hypothesis.split()
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, start=1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, start=1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def compare_texts(pairs: List[tuple]) -> Dict[str, Any]:
+    """WER / character similarity of hypothesis vs reference over (reference, hypothesis) pairs."""
+    errors = sum(word_errors(ref, hyp) for ref, hyp in pairs)
+    words = sum(len(ref.split()) for ref, _ in pairs)
+    similarity = [difflib.SequenceMatcher(None, ref, hyp, autojunk=False).ratio() for ref, hyp in pairs]
+    return {
+        "wordErrorRate": round(errors / words, 4) if words else 0.0,
+        "meanCharSimilarity": round(statistics.mean(similarity), 4) if similarity else None,
+        "minCharSimilarity": round(min(similarity), 4) if similarity else None,
+    }
+
+
+def timed_ocr(image_url: str, latencies: List[float]) -> str:
+    start = time.perf_counter()
+    text = Student.ocr_image_url(image_url)
+    latencies.append(time.perf_counter() - start)
+    return text
+
+
+def summarize(sizes: List[int], latencies: List[float]) -> Dict[str, Any]:
+    return {
+        "meanPayloadBytes": round(statistics.mean(sizes)) if sizes else 0,
+        "totalPayloadBytes": sum(sizes),
+        "meanCallSec": round(statistics.mean(latencies), 3) if latencies else None,
+        "p95CallSec": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare OCR on the previous vs prepared vision payloads.")
+    parser.add_argument("pdfs", nargs="+", help="Answer-script PDFs.")
+    parser.add_argument("--max-pages", type=int, default=20, help="Pages OCR'd per PDF.")
+    parser.add_argument("--baseline-rerun", action="store_true", help="Also measure previous-vs-previous variation.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+    if not image_prep.IMAGE_PREP_ENABLED:
+        print("ERROR (ImagePrepBench): OCR_IMAGE_PREP is off; nothing to compare.", file=sys.stderr)
+        return 1
+
+    sizes: Dict[str, List[int]] = {"previous": [], "prepared": [], "previousRoll": [], "preparedRoll": []}
+    latencies: Dict[str, List[float]] = {"previous": [], "prepared": []}
+    prep_sec: List[float] = []
+    prepared_pairs, rerun_pairs = [], []
+    rolls = {"headerPages": 0, "agree": 0, "fullOnly": 0, "cropOnly": 0, "differ": 0}
+
+    for pdf_path in args.pdfs:
+        pages = convert_from_path(pdf_path, first_page=1, last_page=args.max_pages)
+        print(f"INFO (ImagePrepBench): {os.path.basename(pdf_path)}: {len(pages)} page(s)", file=sys.stderr)
+        for img in pages:
+            previous_url = image_prep.legacy_data_url(img)
+            start = time.perf_counter()
+            prepared_url = image_prep.data_url(img)
+            prep_sec.append(time.perf_counter() - start)
+            sizes["previous"].append(len(previous_url))
+            sizes["prepared"].append(len(prepared_url))
+
+            previous_text = timed_ocr(previous_url, latencies["previous"])
+            prepared_pairs.append((previous_text, timed_ocr(prepared_url, latencies["prepared"])))
+            if args.baseline_rerun:
+                rerun_pairs.append((previous_text, timed_ocr(previous_url, [])))
+
+            if Student.is_first_page(previous_text):
+                crop_url = image_prep.data_url(img, header_only=True)
+                sizes["previousRoll"].append(len(previous_url))
+                sizes["preparedRoll"].append(len(crop_url))
+                full_roll = Student.valid_roll_number(Student.read_roll_number(previous_url))
+                crop_roll = Student.valid_roll_number(Student.read_roll_number(crop_url))
+                rolls["headerPages"] += 1
+                if full_roll and full_roll == crop_roll:
+                    rolls["agree"] += 1
+                elif full_roll and not crop_roll:
+                    rolls["fullOnly"] += 1
+                elif crop_roll and not full_roll:
+                    rolls["cropOnly"] += 1
+                elif full_roll or crop_roll:
+                    rolls["differ"] += 1
+
+    if not prepared_pairs:
+        print("ERROR (ImagePrepBench): No pages rendered.", file=sys.stderr)
+        return 1
+
+    report: Dict[str, Any] = {
+        "settings": {
+            "maxSide": image_prep.OCR_IMAGE_MAX_SIDE, "format": image_prep.OCR_IMAGE_FORMAT,
+            "quality": image_prep.OCR_IMAGE_QUALITY, "deskewMaxDegrees": image_prep.OCR_DESKEW_MAX_DEGREES,
+            "rollHeaderCrop": image_prep.ROLL_HEADER_CROP,
+        },
+        "pages": len(prepared_pairs),
+        "previous": summarize(sizes["previous"], latencies["previous"]),
+        "prepared": {**summarize(sizes["prepared"], latencies["prepared"]),
+                     "meanPrepSec": round(statistics.mean(prep_sec), 3)},
+        "preparedVsPrevious": compare_texts(prepared_pairs),
+        "rollNumbers": {**rolls,
+                        "meanPayloadBytesFull": round(statistics.mean(sizes["previousRoll"])) if sizes["previousRoll"] else 0,
+                        "meanPayloadBytesCrop": round(statistics.mean(sizes["preparedRoll"])) if sizes["preparedRoll"] else 0},
+    }
+    if args.baseline_rerun:
+        report["previousRerunVsPrevious"] = compare_texts(rerun_pairs)
+    report["payloadReduction"] = round(1 - sum(sizes["prepared"]) / sum(sizes["previous"]), 3)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""
+benchmark_pipeline.py
+
+End-to-end benchmark of the professor-side pipeline on synthetic data:
+
+    question_parser  →  Answer_from_book  →  ProfessorUploadHandler.run  →  process_combined_exam_results
+
+For every (students, answer pages per student) scenario it generates a question
+paper, a reference book and handwriting-style student scripts with PyMuPDF,
+inserts a `professoruploads` document and runs each stage in-process, timing it.
+The LLM is mock_groq_server.py (started here unless --llm-base-url is given) and
+Mongo is either a local server (--mongo-uri) or mongomock (--mongomock).
+
+The report is JSON (stdout, and --output if given): per-stage wall time,
+throughput (pages/s, students/s), process peak RSS after the stage, and the git
+commit, so runs can be compared across commits:
+
+    python benchmark_pipeline.py --students 5 20 --pages 2 4 --output bench.json
+
+Requires the full pipeline environment (Tesseract, Poppler, pandoc, models).
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import itertools
+import subprocess
+import contextlib
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DB_NAME = "nirikshak_benchmark"
+
+TOPICS = [
+    ("process", "A process is a program in execution with its own address space, program counter, registers and stack."),
+    ("paging", "Paging divides physical memory into fixed size frames and maps logical pages of a process onto them."),
+    ("deadlock", "A deadlock occurs when processes hold resources while waiting for others, with mutual exclusion and circular wait."),
+    ("scheduling", "CPU scheduling selects a ready process to run; round robin gives each process a fixed time quantum."),
+    ("semaphore", "A semaphore is an integer variable accessed through atomic wait and signal operations for synchronization."),
+    ("file system", "A file system organises data into files and directories and keeps metadata such as inodes and allocation tables."),
+    ("virtual memory", "Virtual memory lets a process use more memory than is physically present by paging to secondary storage."),
+    ("thread", "A thread is the unit of CPU utilisation inside a process and shares code, data and open files with its siblings."),
+]
+FILLER_WORDS = ("the system kernel memory resource user program data table queue request device access time state "
+                "operation value control block policy algorithm page frame entry").split()
+
+
+# ───────────────────────── Measurement helpers ───────────────────────── #
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+@contextlib.contextmanager
+def timed_stage(report: Dict[str, Any], name: str, pages: int = 0, students: int = 0):
+    """Times the block and records wall time, throughput and peak RSS under report['stages'][name]."""
+    entry: Dict[str, Any] = {}
+    report["stages"][name] = entry
+    start = time.perf_counter()
+    try:
+        # The pipeline modules log progress to stdout; keep stdout for the JSON report.
+        with contextlib.redirect_stdout(sys.stderr):
+            yield entry
+    finally:
+        elapsed = time.perf_counter() - start
+        entry["wallSec"] = round(elapsed, 3)
+        if pages:
+            entry["pages"] = pages
+            entry["pagesPerSec"] = round(pages / elapsed, 3) if elapsed > 0 else None
+        if students:
+            entry["students"] = students
+            entry["studentsPerSec"] = round(students / elapsed, 3) if elapsed > 0 else None
+        entry["peakRssMb"] = peak_rss_mb()
+        print(f"Python (Benchmark): {name}: {elapsed:.2f}s", file=sys.stderr)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# ───────────────────────── Synthetic documents ───────────────────────── #
+
+def sentence(rng: random.Random, topic_sentence: str, noise: float) -> str:
+    """Topic sentence with a fraction `noise` of its words swapped for filler, so similarities vary."""
+    words = topic_sentence.split()
+    return " ".join(rng.choice(FILLER_WORDS) if rng.random() < noise else w for w in words)
+
+
+def write_question_paper(fitz, path: str, num_questions: int) -> List[Dict[str, Any]]:
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 72
+    page.insert_text((72, y), "NATIONAL INSTITUTE OF TECHNOLOGY - CA712 Operating Systems - CT1", fontsize=12)
+    y += 36
+    questions = []
+    for i in range(num_questions):
+        topic = TOPICS[i % len(TOPICS)][0]
+        text = f"{i + 1}. Explain {topic} with a suitable example. (5 marks)"
+        questions.append({"questionNo": str(i + 1), "topic": i % len(TOPICS)})
+        if y > 760:
+            page, y = doc.new_page(), 72
+        page.insert_text((72, y), text, fontsize=12)
+        y += 28
+    doc.save(path)
+    doc.close()
+    return questions
+
+
+def write_book(fitz, path: str, num_pages: int, rng: random.Random) -> None:
+    doc = fitz.open()
+    for p in range(num_pages):
+        page = doc.new_page()
+        y = 60
+        while y < 780:
+            _, topic_sentence = TOPICS[rng.randrange(len(TOPICS))]
+            page.insert_text((60, y), sentence(rng, topic_sentence, 0.1)[:95], fontsize=10)
+            y += 14
+        page.insert_text((290, 820), str(p + 1), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def add_handwritten_lines(fitz, page, lines: List[str], rng: random.Random) -> None:
+    """Italic text with per-line jitter in position, size and slant, as a stand-in for handwriting."""
+    y = 70
+    for line in lines:
+        if y > 790:
+            break
+        x = 55 + rng.uniform(-6, 6)
+        size = rng.uniform(12, 14.5)
+        point = fitz.Point(x, y + rng.uniform(-2, 2))
+        slant = fitz.Matrix(1, 0, rng.uniform(-0.12, 0.05), 1, 0, 0)
+        page.insert_text(point, line, fontname="tiit", fontsize=size, morph=(point, slant))
+        y += size * 1.9
+
+
+def write_student_pages(fitz, doc, roll_no: str, questions: List[Dict[str, Any]], answer_pages: int, rng: random.Random) -> None:
+    header = doc.new_page()
+    add_handwritten_lines(fitz, header, [
+        f"Roll Number: {roll_no}",
+        "Degree: MCA",
+        "Department: Computer Applications",
+        "Semester: 2",
+        "Course Code: CA712",
+        "Date of Examination: 01-01-2025",
+    ], rng)
+    per_page = max(1, -(-len(questions) // answer_pages))  # ceil
+    for p in range(answer_pages):
+        lines = []
+        for q in questions[p * per_page:(p + 1) * per_page]:
+            _, topic_sentence = TOPICS[q["topic"]]
+            lines.append(f"Answer {q['questionNo']}")
+            words = sentence(rng, topic_sentence, rng.uniform(0.0, 0.6)).split()
+            lines.extend(" ".join(words[i:i + 9]) for i in range(0, len(words), 9))
+        add_handwritten_lines(fitz, doc.new_page(), lines or ["(blank page)"], rng)
+
+
+def write_student_scripts(fitz, out_dir: str, questions, num_students: int, answer_pages: int,
+                          combined: bool, rng: random.Random) -> List[str]:
+    rolls = [f"2051{i + 1:05d}" for i in range(num_students)]
+    if combined:
+        path = os.path.join(out_dir, "combined_scripts.pdf")
+        doc = fitz.open()
+        for roll in rolls:
+            write_student_pages(fitz, doc, roll, questions, answer_pages, rng)
+        doc.save(path)
+        doc.close()
+        return [path]
+    paths = []
+    for roll in rolls:
+        path = os.path.join(out_dir, f"script_{roll}.pdf")
+        doc = fitz.open()
+        write_student_pages(fitz, doc, roll, questions, answer_pages, rng)
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+# ───────────────────────── Environment ───────────────────────── #
+
+def start_mock_llm(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(SCRIPT_DIR, "mock_groq_server.py"),
+        "--port", str(args.mock_port),
+        "--latency-dist", args.mock_latency_dist,
+        "--latency-ms", str(args.mock_latency_ms),
+        "--latency-sd-ms", str(args.mock_latency_sd_ms),
+        "--rpm", str(args.mock_rpm),
+        "--vision-mode", args.mock_vision_mode,
+    ]
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://localhost:{args.mock_port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base_url}/stats", timeout=1)
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("mock_groq_server.py exited during startup.")
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("mock_groq_server.py did not start within 10s.")
+
+
+def llm_stats(base_url: str) -> Dict[str, Any] | None:
+    try:
+        with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as rsp:
+            return json.loads(rsp.read().decode("utf-8"))
+    except OSError:
+        return None
+
+
+def configure_environment(args, llm_base_url: str) -> None:
+    """Must run before the pipeline modules are imported: they read config and connect at import time."""
+    os.environ["GROQ_BASE_URL"] = llm_base_url
+    for key in ("GROQ_API_KEY", "GROQ_API_KEY_OCR", "GROQ_API_KEY_ROLL"):
+        if args.llm_base_url:
+            os.environ.setdefault(key, "benchmark-key")
+        else:
+            # Our own mock ignores keys; never send the real ones from ../.env to it.
+            os.environ[key] = "benchmark-key"
+    os.environ["LLM_CACHE_ENABLED"] = "false"  # every call must reach the (mock) API
+    os.environ["MONGO_DB_NAME"] = args.db_name
+    if args.mongomock:
+        import mongomock
+        import mongomock.gridfs
+        import pymongo
+        mongomock.gridfs.enable_gridfs_integration()
+        shared_client = mongomock.MongoClient()
+        # Every module opens its own MongoClient; they must all see the same in-memory server.
+        pymongo.MongoClient = lambda *a, **kw: shared_client
+    else:
+        os.environ["MONGO_CONNECTION_STRING"] = args.mongo_uri
+
+
+# ───────────────────────── Scenario ───────────────────────── #
+
+def run_scenario(args, modules: Dict[str, Any], num_students: int, answer_pages: int, work_dir: str) -> Dict[str, Any]:
+    import fitz
+    from bson.objectid import ObjectId
+
+    question_parser = modules["question_parser"]
+    answer_from_book = modules["Answer_from_book"]
+    studentScripts = modules["studentScripts"]
+    combined_results = modules["Combined_Results"]
+
+    rng = random.Random(args.seed + num_students * 1000 + answer_pages)
+    scenario_dir = os.path.join(work_dir, f"s{num_students}_p{answer_pages}")
+    os.makedirs(scenario_dir, exist_ok=True)
+    subject_code = f"BENCH{num_students}P{answer_pages}"
+    report: Dict[str, Any] = {
+        "students": num_students, "answerPagesPerStudent": answer_pages,
+        "layout": "combined" if args.combined else "separate", "stages": {},
+    }
+
+    student_pages = num_students * (answer_pages + 1)
+    with timed_stage(report, "synthesize"):
+        paper_path = os.path.join(scenario_dir, "question_paper.pdf")
+        book_path = os.path.join(scenario_dir, "book.pdf")
+        questions = write_question_paper(fitz, paper_path, args.questions)
+        write_book(fitz, book_path, args.book_pages, rng)
+        script_paths = write_student_scripts(fitz, scenario_dir, questions, num_students, answer_pages, args.combined, rng)
+
+    prof_col = answer_from_book.professor_collection_instance
+    upload_id = prof_col.insert_one({
+        "course": "MCA", "subject": "Operating Systems", "subjectCode": subject_code,
+        "examType": "CT1", "year": 2025, "semester": 2, "sectionType": "A",
+        "questionPaperPath": paper_path, "bookAnswerPath": book_path,
+        "studentScriptPaths": script_paths, "uploadedAt": datetime.now(timezone.utc),
+    }).inserted_id
+
+    with timed_stage(report, "question_parser", pages=1) as entry:
+        text = question_parser.pdf_ocr_extract(paper_path)
+        raw_json = question_parser.generate_json_with_groq(os.environ["GROQ_API_KEY"], text, question_parser.JSON_STRUCTURE_PROMPT)
+        parsed_questions = json.loads(raw_json) if raw_json else []
+        entry["questionsParsed"] = len(parsed_questions)
+    if not parsed_questions:
+        report["error"] = "question_parser returned no questions"
+        return report
+
+    with timed_stage(report, "book_index", pages=args.book_pages) as entry:
+        paragraphs, faiss_index = answer_from_book.get_paragraphs_and_faiss_index(
+            book_path, answer_from_book.WINDOW_SIZE, answer_from_book.STEP_SIZE,
+            answer_from_book.MIN_PARAGRAPH_WORDS, force_regenerate=True,
+        )
+        entry["paragraphs"] = len(paragraphs)
+
+    with timed_stage(report, "answer_generation") as entry:
+        answer_from_book.process_all_questions(parsed_questions, paragraphs, faiss_index)
+        answer_from_book.update_professor_record_in_db(str(upload_id), parsed_questions)
+        entry["questions"] = len(parsed_questions)
+
+    with timed_stage(report, "professor_scripts", pages=student_pages, students=num_students) as entry:
+        handler = studentScripts.ProfessorUploadHandler(str(upload_id))
+        handler.run()
+        entry["studentsStored"] = prof_col.find_one({"_id": ObjectId(upload_id)}).get("studentAnswersCount", 0)
+
+    combined_kwargs = dict(
+        course_arg="MCA", subject_code_arg=subject_code, exam_type_arg="CT1",
+        year_arg=2025, semester_arg=2, section_type_arg="A",
+    )
+    with timed_stage(report, "combined_results", students=num_students) as entry:
+        result = combined_results.process_combined_exam_results(**combined_kwargs)
+        entry["status"] = result.get("status")
+        entry["processedStudentCount"] = result.get("processedStudentCount")
+
+    # Second pass with nothing changed: measures the incremental / cached path.
+    with timed_stage(report, "combined_results_rerun", students=num_students) as entry:
+        result = combined_results.process_combined_exam_results(**combined_kwargs)
+        entry["status"] = result.get("status")
+
+    answer_stage = report["stages"]["answer_generation"]
+    if answer_stage["wallSec"] > 0:
+        answer_stage["questionsPerSec"] = round(answer_stage["questions"] / answer_stage["wallSec"], 3)
+    report["totalWallSec"] = round(sum(s["wallSec"] for s in report["stages"].values() ), 3)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark on synthetic answer scripts.")
+    parser.add_argument("--students", type=int, nargs="+", default=[5, 20], help="Student counts to benchmark.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 4], help="Answer pages per student to benchmark.")
+    parser.add_argument("--questions", type=int, default=6)
+    parser.add_argument("--book-pages", type=int, default=20)
+    parser.add_argument("--combined", action=argparse.BooleanOptionalAction, default=True,
+                        help="One combined class PDF (default) or one PDF per student (--no-combined).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock server.")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=BENCH_DB_NAME)
+    parser.add_argument("--llm-base-url", help="Use an already running (mock) LLM server instead of starting one.")
+    parser.add_argument("--mock-port", type=int, default=6100)
+    parser.add_argument("--mock-latency-dist", default="lognormal")
+    parser.add_argument("--mock-latency-ms", type=float, default=0.0)
+    parser.add_argument("--mock-latency-sd-ms", type=float, default=0.0)
+    parser.add_argument("--mock-rpm", type=int, default=0)
+    parser.add_argument("--mock-vision-mode", choices=["tesseract", "canned"], default="tesseract")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated PDFs.")
+    args = parser.parse_args()
+
+    mock_proc = None
+    llm_base_url = args.llm_base_url
+    if not llm_base_url:
+        mock_proc = start_mock_llm(args)
+        llm_base_url = f"http://localhost:{args.mock_port}"
+    configure_environment(args, llm_base_url)
+
+    work_dir = tempfile.mkdtemp(prefix="nirikshak_bench_")
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "mongo": "mongomock" if args.mongomock else args.mongo_uri,
+        "llmBaseUrl": llm_base_url,
+        "stages": {},
+        "scenarios": [],
+    }
+    try:
+        sys.path.insert(0, SCRIPT_DIR)
+        modules: Dict[str, Any] = {}
+        # Import cost (model loading, DB connections) is reported once, as its own stage.
+        for name in ("question_parser", "Answer_from_book", "studentScripts", "Combined_Results"):
+            with timed_stage(report, f"import_{name}"):
+                modules[name] = __import__(name)
+
+        if not args.mongomock:
+            modules["Answer_from_book"].mongo_client.drop_database(args.db_name)
+
+        for num_students, answer_pages in itertools.product(args.students, args.pages):
+            print(f"Python (Benchmark): scenario students={num_students} pages={answer_pages}", file=sys.stderr)
+            try:
+                report["scenarios"].append(run_scenario(args, modules, num_students, answer_pages, work_dir))
+            except Exception as e:
+                report["scenarios"].append({"students": num_students, "answerPagesPerStudent": answer_pages, "error": repr(e)})
+        report["llmCalls"] = llm_stats(llm_base_url)
+        report["peakRssMb"] = peak_rss_mb()
+    finally:
+        if mock_proc is not None:
+            mock_proc.terminate()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            report["workDir"] = work_dir
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0 if all("error" not in s for s in report["scenarios"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+benchmark_segmenter.py
+
+Validates the single-pass answer segmenter (answer_segmenter.segment) and its
+page-by-page form against the original regex chain
+(answer_segmenter.segment_regex_chain), and times them.
+
+Corpus (any combination; each item is the OCR text of one script, as pages):
+  • --texts: .txt files or directories of them (e.g. dumped OCR output)
+  • --checkpoints: page OCR text kept in professorscriptcheckpoints by
+    studentScripts.py (interrupted / in-progress runs), per script in page order
+  • --stored-answers N: scripts rebuilt from the answers of N stored students
+    (professorstudentanswers), each answer under a "Q<id>." heading
+  • --synthetic N: generated scripts with mixed heading styles and OCR noise
+
+Scripts other than checkpoints are cut into pages of --page-lines lines.
+Every script (its pages joined by newlines) is segmented by both; the report
+counts scripts with identical output (including both raising ValueError) and
+lists the first differences. The incremental segmenter
+(answer_segmenter.IncrementalSegmenter, fed page by page) is checked against
+the single-pass one the same way. The corpus is then concatenated into very
+long combined scripts (--long-chars) and each segmenter is timed on them
+(best of --repeat):
+
+    python benchmark_segmenter.py --texts ocr_dump/ --checkpoints --synthetic 500 --long-chars 1000000,5000000 --output seg.json
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from typing import Any, Dict, List, Tuple
+
+import answer_segmenter
+
+SEGMENTERS = {"regex-chain": answer_segmenter.segment_regex_chain, "single-pass": answer_segmenter.segment}
+MAX_REPORTED_DIFFS = 10
+
+_HEADINGS = ["Q{n}", "Q{n}.", "Q-{n}", "Ques {n}:", "Question {n}", "Ans {n})", "Answer {n}", "answer-{n}",
+             "Solution {n}", "{n}.", "{n})", "{n}", "{n}{s})", "Q{n}{s}", "{n}{s}."]
+_WORDS = ("the process scheduler allocates cpu time to each job in round robin order while memory "
+          "pages are swapped out when a fault occurs marks total of data 2 3 4 10 15 20 fig table "
+          "x = y + 1 i.e. e.g. (a) (b) step case note").split()
+
+
+# ───────────────────────── Corpus ───────────────────────── #
+
+def as_pages(text: str, page_lines: int) -> List[str]:
+    lines = text.split("\n")
+    return ["\n".join(lines[i:i + page_lines]) for i in range(0, len(lines), page_lines)]
+
+
+def load_text_files(paths: List[str], page_lines: int) -> List[Tuple[str, List[str]]]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(".txt"))
+        else:
+            files.append(path)
+    scripts = []
+    for path in files:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            scripts.append((f"text:{os.path.basename(path)}", as_pages(f.read(), page_lines)))
+    return scripts
+
+
+def load_checkpoint_scripts() -> List[Tuple[str, List[str]]]:
+    from pymongo import MongoClient
+    from Answer_Generator import MONGO_CONNECTION_STRING, DATABASE_NAME
+    from studentScripts import CHECKPOINTS_COLLECTION_NAME
+
+    pages: Dict[Tuple[str, str], List[Tuple[int, str]]] = {}
+    col = MongoClient(MONGO_CONNECTION_STRING)[DATABASE_NAME][CHECKPOINTS_COLLECTION_NAME]
+    for doc in col.find({"text": {"$type": "string"}}, {"professorUploadId": 1, "script": 1, "page": 1, "text": 1}):
+        pages.setdefault((str(doc["professorUploadId"]), doc["script"]), []).append((doc["page"], doc["text"]))
+    return [(f"checkpoint:{upload}:{os.path.basename(script)}", [t for _, t in sorted(p)])
+            for (upload, script), p in pages.items()]
+
+
+def load_stored_answer_scripts(limit: int, page_lines: int) -> List[Tuple[str, List[str]]]:
+    from pymongo import MongoClient
+    from Answer_Generator import MONGO_CONNECTION_STRING, DATABASE_NAME
+    from studentScripts import STUDENT_ANSWERS_COLLECTION_NAME
+
+    col = MongoClient(MONGO_CONNECTION_STRING)[DATABASE_NAME][STUDENT_ANSWERS_COLLECTION_NAME]
+    scripts = []
+    for doc in col.find({"answers.0": {"$exists": True}}, {"roll_no": 1, "answers": 1}).limit(limit):
+        text = "\n".join(f"Q{a.get('question_no')}. {a.get('answer_text', '')}" for a in doc["answers"])
+        scripts.append((f"stored:{doc.get('roll_no')}", as_pages(text, page_lines)))
+    return scripts
+
+
+def synthetic_script(rng: random.Random) -> str:
+    lines = ["ROLL NUMBER 24MCA0{}  DEGREE MCA  DEPARTMENT CS  SEMESTER II".format(rng.randint(10, 99)),
+             "COURSE CODE CA712  DATE OF EXAMINATION 12/05/2025"]
+    for n in range(1, rng.randint(4, 12)):
+        heading = rng.choice(_HEADINGS).format(n=n, s=rng.choice("abc"))
+        body = []
+        for _ in range(rng.randint(1, 8)):
+            line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 14)))
+            if rng.random() < 0.15:
+                line = f"{rng.randint(1, 5)}{rng.choice(['. ', ') ', ' '])}{line}"  # numbered list inside an answer
+            body.append(line)
+        sep = rng.choice([" ", "\n", "  ", "\n\n"])
+        lines.append(heading + sep + "\n".join(body))
+    return "\n".join(lines)
+
+
+# ───────────────────────── Checks ───────────────────────── #
+
+def run_segmenter(fn, script: Any) -> Any:
+    try:
+        return fn(script)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+def segment_incrementally(pages: List[str]) -> List[Dict]:
+    segmenter = answer_segmenter.IncrementalSegmenter()
+    answers = []
+    for page in pages:
+        answers += segmenter.feed(page)
+    return answers + segmenter.close()
+
+
+def validate(scripts: List[Tuple[str, List[str]]]) -> Dict[str, Any]:
+    agree, answers, no_markers, diffs = 0, 0, 0, []
+    incremental_agree, incremental_diffs = 0, []
+    for name, pages in scripts:
+        text = "\n".join(pages)
+        old = run_segmenter(answer_segmenter.segment_regex_chain, text)
+        new = run_segmenter(answer_segmenter.segment, text)
+        if old == new:
+            agree += 1
+            if isinstance(old, dict):
+                no_markers += 1
+            else:
+                answers += len(old)
+        elif len(diffs) < MAX_REPORTED_DIFFS:
+            diffs.append({"script": name, "regexChain": old, "singlePass": new})
+        incremental = run_segmenter(segment_incrementally, pages)
+        if incremental == new:
+            incremental_agree += 1
+        elif len(incremental_diffs) < MAX_REPORTED_DIFFS:
+            incremental_diffs.append({"script": name, "singlePass": new, "incremental": incremental})
+    return {
+        "scripts": len(scripts),
+        "pages": sum(len(pages) for _, pages in scripts),
+        "identical": agree,
+        "different": len(scripts) - agree,
+        "answersCompared": answers,
+        "noMarkerScripts": no_markers,
+        "differences": diffs,
+        "incrementalIdentical": incremental_agree,
+        "incrementalDifferent": len(scripts) - incremental_agree,
+        "incrementalDifferences": incremental_diffs,
+    }
+
+
+def best_time(fn, script: Any, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_segmenter(fn, script)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def long_script(scripts: List[Tuple[str, List[str]]], chars: int) -> str:
+    parts, size, i = [], 0, 0
+    while size < chars:
+        text = "\n".join(scripts[i % len(scripts)][1])
+        parts.append(text)
+        size += len(text) + 1
+        i += 1
+    return "\n".join(parts)[:chars]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Validate and time the single-pass answer segmenter against the regex chain.")
+    parser.add_argument("--texts", nargs="*", default=[], help="OCR text files or directories of .txt files.")
+    parser.add_argument("--checkpoints", action="store_true", help="Use page OCR text from professorscriptcheckpoints.")
+    parser.add_argument("--stored-answers", type=int, default=0, help="Scripts rebuilt from this many stored students.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generated scripts to add.")
+    parser.add_argument("--page-lines", type=int, default=40, help="Lines per page when a script is cut into pages.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--long-chars", default="100000,1000000,5000000",
+                        help="Comma-separated sizes (characters) of the combined scripts timed.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    scripts = load_text_files(args.texts, args.page_lines)
+    if args.checkpoints:
+        scripts += load_checkpoint_scripts()
+    if args.stored_answers:
+        scripts += load_stored_answer_scripts(args.stored_answers, args.page_lines)
+    rng = random.Random(args.seed)
+    scripts += [(f"synthetic:{i}", as_pages(synthetic_script(rng), args.page_lines)) for i in range(args.synthetic)]
+    if not scripts:
+        print("ERROR (SegmenterBench): Empty corpus; pass --texts, --checkpoints, --stored-answers or --synthetic.", file=sys.stderr)
+        return 1
+    print(f"INFO (SegmenterBench): Validating on {len(scripts)} script(s)...", file=sys.stderr)
+
+    report: Dict[str, Any] = {"validation": validate(scripts), "longScripts": []}
+    for chars in (int(c) for c in args.long_chars.split(",") if c.strip()):
+        text = long_script(scripts, chars)
+        print(f"INFO (SegmenterBench): Timing on a {len(text)}-character script...", file=sys.stderr)
+        outputs = {name: run_segmenter(fn, text) for name, fn in SEGMENTERS.items()}
+        timings = {name: best_time(fn, text, args.repeat) for name, fn in SEGMENTERS.items()}
+        pages = as_pages(text, args.page_lines)
+        timings["incremental"] = best_time(segment_incrementally, pages, args.repeat)
+        report["longScripts"].append({
+            "chars": len(text),
+            "answers": len(outputs["regex-chain"]) if isinstance(outputs["regex-chain"], list) else 0,
+            "identical": outputs["regex-chain"] == outputs["single-pass"],
+            "incrementalIdentical": run_segmenter(segment_incrementally, pages) == outputs["single-pass"],
+            **{f"{name}Sec": round(sec, 4) for name, sec in timings.items()},
+            "speedup": round(timings["regex-chain"] / timings["single-pass"], 2) if timings["single-pass"] else None,
+        })
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    validation = report["validation"]
+    return 0 if validation["different"] == 0 and validation["incrementalDifferent"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+benchmark_startup.py
+
+Startup cost of the Python entry points that Node spawns per request. Each
+command runs in a fresh interpreter (--repeat times); the report is the median
+and min wall time per command, as JSON on stdout, plus the git commit:
+
+    python benchmark_startup.py --repeat 7 --output startup.json
+
+  • import_<module>   `python -c "import <module>"`  (module-level cost only)
+  • help_<module>     `python <module>.py --help`    (argparse, no resources)
+
+Pass --marksheet-args to also time a real Marksheet_Generator call, e.g. for a
+student whose marksheet is already stored (the `success_cached` path):
+
+    python benchmark_startup.py --marksheet-args --roll_no 123456789 --course MCA \\
+        --subject_code CA721 --exam_type CT1 --year 2025
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("Marksheet_Generator", "Combined_Results", "question_parser")
+
+
+def time_command(cmd: List[str], repeat: int) -> Dict[str, Any]:
+    samples, returncode = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        samples.append(time.perf_counter() - start)
+        returncode = proc.returncode
+    entry: Dict[str, Any] = {
+        "medianSec": round(statistics.median(samples), 3),
+        "minSec": round(min(samples), 3),
+        "runs": repeat,
+        "returncode": returncode,
+    }
+    if returncode != 0:
+        entry["stderrTail"] = proc.stderr.strip().splitlines()[-3:]
+    print(f"Python (StartupBench): {' '.join(cmd[1:])[:80]}: median {entry['medianSec']}s", file=sys.stderr)
+    return entry
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure import and CLI startup time of the Python entry points.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh-interpreter runs per command.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--marksheet-args", nargs=argparse.REMAINDER,
+                        help="Arguments for one full Marksheet_Generator.py run (must come last).")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "commands": {},
+    }
+    report["commands"]["python_baseline"] = time_command([sys.executable, "-c", "pass"], args.repeat)
+    for module in MODULES:
+        report["commands"][f"import_{module}"] = time_command([sys.executable, "-c", f"import {module}"], args.repeat)
+        report["commands"][f"help_{module}"] = time_command([sys.executable, f"{module}.py", "--help"], args.repeat)
+    if args.marksheet_args:
+        report["commands"]["marksheet_run"] = time_command(
+            [sys.executable, "Marksheet_Generator.py", *args.marksheet_args], args.repeat
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0 if all(c["returncode"] == 0 for c in report["commands"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+book_chunker.py
+
+Token-aware chunking of reference-book PDFs for the RAG index in Answer_from_book.
+
+Instead of fixed overlapping 15-line windows (each line embedded ~3 times), the
+book is read as PyMuPDF text blocks:
+
+  • page furniture is dropped: page numbers and running headers/footers (the
+    same short line at the top/bottom of many pages)
+  • headings (short blocks set larger or bold than the body text) close the
+    current chunk, and prefix every chunk of their section as context
+  • blocks are split into sentences and packed into chunks of at most
+    RAG_CHUNK_MAX_TOKENS model tokens (all-MiniLM-L6-v2 truncates at 256), closing
+    early at a block boundary once a chunk is mostly full
+  • consecutive chunks of a section share up to RAG_CHUNK_OVERLAP_TOKENS tokens of
+    trailing sentences, so an idea split across chunks is still retrievable
+
+Token counts come from the embedding model's own tokenizer. CHUNKER_VERSION is
+part of the book cache key; bump it whenever the chunk output changes.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import statistics
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+import metrics
+
+CHUNKER_VERSION = "blocks-v1"
+RAG_CHUNK_MAX_TOKENS = int(os.getenv("RAG_CHUNK_MAX_TOKENS", "256"))
+RAG_CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "32"))
+# [CLS] and [SEP] count against the model's limit.
+SPECIAL_TOKENS = 2
+# A chunk this full is closed at the next block boundary rather than mid-block.
+BLOCK_BOUNDARY_FILL = 0.75
+HEADING_MAX_WORDS = 12
+HEADING_SIZE_RATIO = 1.15
+# Fraction of the page height treated as header / footer band.
+MARGIN_BAND = 0.08
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+(?=[\"'(\[A-Z0-9])")
+
+
+# ───────────────────────── Token counting ───────────────────────── #
+
+_token_counters: Dict[str, Callable[[List[str]], List[int]]] = {}
+
+
+def get_token_counter(encoder: Any, model_name: str) -> Callable[[List[str]], List[int]]:
+    """Batch token counter from the encoder's tokenizer (or the model's, loaded by name); cached per model."""
+    if model_name not in _token_counters:
+        _token_counters[model_name] = _make_token_counter(encoder, model_name)
+    return _token_counters[model_name]
+
+
+def _make_token_counter(encoder: Any, model_name: str) -> Callable[[List[str]], List[int]]:
+    tokenizer = getattr(encoder, "tokenizer", None)
+    if tokenizer is None:
+        try:
+            from transformers import AutoTokenizer
+            repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+            tokenizer = AutoTokenizer.from_pretrained(repo)
+        except Exception as e:
+            print(f"Python WARNING (BookChunker): Could not load tokenizer for '{model_name}' ({e}); "
+                  f"estimating tokens from word counts.", file=sys.stderr)
+            return lambda texts: [int(len(t.split()) * 1.4) + 1 for t in texts]
+
+    def count(texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    return count
+
+
+# ───────────────────────── Block extraction ───────────────────────── #
+
+def _clean_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def read_blocks(doc) -> List[Dict[str, Any]]:
+    """Text blocks of every page as {page, text, size, bold, top, bottom}, in reading order."""
+    blocks = []
+    for page in doc:
+        height = page.rect.height or 1.0
+        for block in page.get_text("dict", sort=True)["blocks"]:
+            if block.get("type") != 0:  # images
+                continue
+            lines, sizes, bold_chars, chars = [], [], 0, 0
+            for line in block["lines"]:
+                text = _clean_line("".join(span["text"] for span in line["spans"]))
+                if text:
+                    lines.append(text)
+                for span in line["spans"]:
+                    n = len(span["text"].strip())
+                    sizes.extend([span["size"]] * max(n, 0))
+                    chars += n
+                    if span["flags"] & 16:  # bold
+                        bold_chars += n
+            if not lines:
+                continue
+            # Hyphenated line breaks are rejoined; other line breaks become spaces.
+            text = re.sub(r"(\w)- (\w)", r"\1\2", " ".join(lines))
+            blocks.append({
+                "page": page.number,
+                "text": text,
+                "size": statistics.median(sizes) if sizes else 0.0,
+                "bold": chars > 0 and bold_chars / chars > 0.6,
+                "top": block["bbox"][1] / height,
+                "bottom": block["bbox"][3] / height,
+            })
+    return blocks
+
+
+def drop_page_furniture(blocks: List[Dict[str, Any]], num_pages: int) -> List[Dict[str, Any]]:
+    """Removes page numbers and running headers/footers repeated on many pages."""
+    def margin_key(b: Dict[str, Any]) -> str:
+        return re.sub(r"\d+", "#", b["text"].lower())
+
+    in_margin = [b for b in blocks if b["top"] < MARGIN_BAND or b["bottom"] > 1 - MARGIN_BAND]
+    repeats = Counter(margin_key(b) for b in in_margin)
+    min_repeats = max(3, num_pages // 4)
+    running = {key for key, n in repeats.items() if n >= min_repeats}
+
+    kept = []
+    for b in blocks:
+        words = b["text"].split()
+        if len(words) <= 1 or b["text"].replace(" ", "").isnumeric():
+            continue  # same rule the line-window chunker applied to lines
+        if (b["top"] < MARGIN_BAND or b["bottom"] > 1 - MARGIN_BAND) and margin_key(b) in running:
+            continue
+        kept.append(b)
+    return kept
+
+
+def mark_headings(blocks: List[Dict[str, Any]]) -> None:
+    body_size = statistics.median([b["size"] for b in blocks]) if blocks else 0.0
+    for b in blocks:
+        short = len(b["text"].split()) <= HEADING_MAX_WORDS and not b["text"].endswith((".", ",", ";"))
+        b["heading"] = short and (b["size"] >= body_size * HEADING_SIZE_RATIO or b["bold"])
+
+
+# ───────────────────────── Packing ───────────────────────── #
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def _split_long(sentence: str, budget: int, count_tokens: Callable[[List[str]], List[int]]) -> List[str]:
+    """Splits a sentence longer than the budget into word runs that fit."""
+    words = sentence.split()
+    word_tokens = count_tokens(words)
+    pieces, current, used = [], [], 0
+    for word, n in zip(words, word_tokens):
+        if current and used + n > budget:
+            pieces.append(" ".join(current))
+            current, used = [], 0
+        current.append(word)
+        used += n
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_blocks(blocks: List[Dict[str, Any]], count_tokens: Callable[[List[str]], List[int]],
+                 max_tokens: int, overlap_tokens: int, min_words: int) -> List[str]:
+    budget = max_tokens - SPECIAL_TOKENS
+    # Units are (block index, sentence); headings stay whole.
+    units: List[Tuple[int, str]] = []
+    for i, b in enumerate(blocks):
+        if b["heading"]:
+            units.append((i, b["text"]))
+        else:
+            units.extend((i, s) for s in split_sentences(b["text"]))
+    unit_tokens = count_tokens([text for _, text in units])
+
+    chunks: List[str] = []
+    heading, heading_tokens = "", 0
+    current: List[Tuple[int, str, int]] = []  # (block index, sentence, tokens)
+    used = 0
+    carried = 0  # leading parts of `current` repeated from the previous chunk
+    next_heading: Tuple[str, int] | None = None  # heading of a short section merged into the open chunk
+
+    def render(parts: List[Tuple[int, str, int]]) -> str:
+        body, last_block = "", None
+        for block_idx, text, _ in parts:
+            sep = "" if not body else (" " if block_idx == last_block else "\n")
+            body += sep + text
+            last_block = block_idx
+        return f"{heading}\n{body}" if heading else body
+
+    def flush(keep_overlap: bool) -> None:
+        nonlocal current, used, carried, heading, heading_tokens, next_heading
+        if len(current) > carried:
+            chunks.append(render(current))
+        if next_heading is not None:
+            (heading, heading_tokens), next_heading = next_heading, None
+        tail: List[Tuple[int, str, int]] = []
+        if keep_overlap and overlap_tokens > 0:
+            tail_tokens = 0
+            for part in reversed(current[1:]):  # never carry the whole chunk
+                if tail_tokens + part[2] > overlap_tokens:
+                    break
+                tail.insert(0, part)
+                tail_tokens += part[2]
+        current, used, carried = tail, sum(p[2] for p in tail), len(tail)
+
+    for (block_idx, text), n in zip(units, unit_tokens):
+        if blocks[block_idx]["heading"]:
+            new_words = sum(len(p[1].split()) for p in current[carried:])
+            if new_words == 0 or new_words >= min_words:
+                flush(keep_overlap=False)  # no overlap across sections
+                heading, heading_tokens, next_heading = text, n, None
+            else:
+                # A short section is merged into the next one rather than indexed on its own.
+                current.append((block_idx, text, n))
+                used += n
+                next_heading = (text, n)
+            continue
+
+        room = budget - heading_tokens
+        if n <= room:
+            pieces = [(text, n)]
+        else:
+            split = _split_long(text, room, count_tokens)
+            pieces = list(zip(split, count_tokens(split)))
+        for piece, piece_tokens in pieces:
+            starts_block = not current or current[-1][0] != block_idx
+            if current and (used + piece_tokens > room or (starts_block and used >= room * BLOCK_BOUNDARY_FILL)):
+                flush(keep_overlap=True)
+            current.append((block_idx, piece, piece_tokens))
+            used += piece_tokens
+    flush(keep_overlap=False)
+
+    # Drops scraps such as a lone trailing heading; real short sections were merged forward above.
+    return [c for c in chunks if len(c.split()) >= min(min_words, 12)]
+
+
+def chunk_pdf(pdf_path: str, count_tokens: Callable[[List[str]], List[int]],
+              max_tokens: int = RAG_CHUNK_MAX_TOKENS, overlap_tokens: int = RAG_CHUNK_OVERLAP_TOKENS,
+              min_words: int = 40) -> List[str]:
+    """Chunks a book PDF; returns the chunk texts in reading order."""
+    import fitz  # PyMuPDF
+
+    with metrics.timer("pdf_text_extract"):
+        doc = fitz.open(pdf_path)
+        num_pages = len(doc)
+        blocks = read_blocks(doc)
+        doc.close()
+    metrics.increment("pages_rendered", num_pages)
+
+    with metrics.timer("chunking"):
+        blocks = drop_page_furniture(blocks, num_pages)
+        mark_headings(blocks)
+        chunks = chunk_blocks(blocks, count_tokens, max_tokens, overlap_tokens, min_words)
+    metrics.increment("rag_chunks", len(chunks))
+    return chunks
@@ -0,0 +1,358 @@
+"""
+embedding_service.py
+
+One process per node that holds the sentence-embedding model, so the Flask
+services and the per-request scripts (Combined_Results, Marksheet_Generator)
+stop loading their own copy of all-MiniLM-L6-v2:
+
+    python embedding_service.py            # listens on EMBEDDING_SERVICE_ADDRESS
+
+Callers use `get_encoder(model_name)`. It returns a SharedEncoder (backed by a
+RemoteEncoder) when the service is configured, reachable and serves that model,
+and otherwise falls back to loading the model in-process (the previous
+behaviour). If the service dies or restarts, the SharedEncoder reconnects and,
+failing that, loads the model in-process, so a long-running caller keeps
+working. All of them expose the `encode(...)` /
+`get_sentence_embedding_dimension()` subset the pipeline uses.
+
+EMBEDDING_BACKEND picks how the model runs, in the service and in-process:
+"torch" (SentenceTransformer, the default) or "onnx-int8" (onnx_encoder.py).
+A client only uses a service running the same model on the same backend.
+
+Transport: requests (the texts) go over a multiprocessing.connection socket,
+AF_UNIX for a path or AF_INET for host:port, authenticated with
+EMBEDDING_SERVICE_AUTHKEY. The vectors come back through a shared-memory buffer
+owned by the client: the service writes the float32 matrix straight into it and
+only sends back its shape, so embeddings are never pickled.
+
+Requests themselves are pickled, and unpickling runs code, so the authkey is the
+only thing between a local process and code execution in the service. There is
+no default: the service is off unless both EMBEDDING_SERVICE_ADDRESS and
+EMBEDDING_SERVICE_AUTHKEY are set, and it refuses to start without a key. Prefer
+a Unix socket path; the socket is created with 0600 permissions, so only the
+service's user can connect at all.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import atexit
+import argparse
+import threading
+from multiprocessing import connection, shared_memory
+from typing import Any, Dict, List, Tuple, Union
+
+from dotenv import load_dotenv
+
+import metrics
+
+env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../.env'))
+load_dotenv(dotenv_path=env_path)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+# Unix socket path or host:port; unset / "off" disables the service (always load in-process).
+EMBEDDING_SERVICE_ADDRESS = os.getenv("EMBEDDING_SERVICE_ADDRESS", "").strip()
+# Shared secret for the socket. Required: requests are unpickled, so anyone holding it can run code in the service.
+EMBEDDING_SERVICE_AUTHKEY = os.getenv("EMBEDDING_SERVICE_AUTHKEY", "").strip().encode("utf-8")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_BACKENDS = ("torch", "onnx-int8")
+# Smallest shared buffer a client allocates; it grows (doubling) for larger batches.
+MIN_BUFFER_BYTES = 1 << 20
+
+
+def parse_address(address: str) -> Tuple[Union[str, Tuple[str, int]], str]:
+    """'host:port' -> ((host, port), 'AF_INET'); anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and os.sep not in host:
+        return (host or "127.0.0.1", int(port)), "AF_INET"
+    return address, "AF_UNIX"
+
+
+def load_model(model_name: str, backend: str = EMBEDDING_BACKEND):
+    """Loads `model_name` in this process on the given backend."""
+    if backend == "onnx-int8":
+        from onnx_encoder import OnnxEncoder
+        return OnnxEncoder(model_name)
+    if backend != "torch":
+        print(f"Python WARNING (Embeddings): Unknown EMBEDDING_BACKEND '{backend}'; using torch.", file=sys.stderr)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def encoder_tag(model_name: str) -> str:
+    """Model name plus any non-default backend, for cache keys (int8 vectors differ slightly from fp32)."""
+    return model_name if EMBEDDING_BACKEND == "torch" else f"{model_name}@{EMBEDDING_BACKEND}"
+
+
+def service_enabled() -> bool:
+    """True only when the service is configured explicitly: an address and an authkey."""
+    if EMBEDDING_SERVICE_ADDRESS.lower() in ("", "off", "false", "0", "none"):
+        return False
+    if not EMBEDDING_SERVICE_AUTHKEY:
+        print("Python WARNING (Embeddings): EMBEDDING_SERVICE_ADDRESS is set but EMBEDDING_SERVICE_AUTHKEY is not; "
+              "not using the embedding service.", file=sys.stderr)
+        return False
+    return True
+
+
+# ───────────────────────── Client ───────────────────────── #
+
+class RemoteEncoder:
+    """SentenceTransformer look-alike backed by the embedding service."""
+
+    def __init__(self, conn: connection.Connection, info: Dict[str, Any]):
+        self._conn = conn
+        self._lock = threading.Lock()  # one request in flight per connection / buffer
+        self._shm: Union[shared_memory.SharedMemory, None] = None
+        self.model_name = info["model"]
+        self.dimension = int(info["dim"])
+        atexit.register(self.close)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _ensure_buffer(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._shm.size < nbytes:
+            size = max(nbytes, MIN_BUFFER_BYTES, 2 * self._shm.size if self._shm else 0)
+            self._release_buffer()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        return self._shm
+
+    def _release_buffer(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False, **_ignored: Any):
+        """Same call shape as SentenceTransformer.encode; returns float32 ndarray(s) owned by the caller."""
+        import numpy as np
+
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        with self._lock:
+            shm = self._ensure_buffer(len(texts) * self.dimension * 4)
+            self._conn.send({
+                "op": "encode", "texts": texts, "shm": shm.name,
+                "batch_size": batch_size, "normalize": normalize_embeddings,
+            })
+            reply = self._conn.recv()
+            if not reply.get("ok"):
+                raise RuntimeError(f"Embedding service error: {reply.get('error')}")
+            # One memcpy out of the shared buffer, which the next call reuses.
+            vectors = np.ndarray(tuple(reply["shape"]), dtype=np.float32, buffer=shm.buf).copy()
+        return vectors[0] if single else vectors
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._release_buffer()
+
+
+def connect(model_name: str = DEFAULT_MODEL_NAME) -> Union[RemoteEncoder, None]:
+    """RemoteEncoder for `model_name`, or None if the service is disabled, down or serves another model."""
+    if not service_enabled():
+        return None
+    address, family = parse_address(EMBEDDING_SERVICE_ADDRESS)
+    try:
+        conn = connection.Client(address, family=family, authkey=EMBEDDING_SERVICE_AUTHKEY)
+        conn.send({"op": "info"})
+        info = conn.recv()
+    except Exception as e:
+        print(f"Python (Embeddings): Embedding service not available at {EMBEDDING_SERVICE_ADDRESS} ({e.__class__.__name__}).", file=sys.stderr)
+        return None
+    if info.get("model") != model_name or info.get("backend", "torch") != EMBEDDING_BACKEND:
+        print(f"Python WARNING (Embeddings): Service at {EMBEDDING_SERVICE_ADDRESS} serves '{info.get('model')}' "
+              f"({info.get('backend', 'torch')}), not '{model_name}' ({EMBEDDING_BACKEND}).", file=sys.stderr)
+        conn.close()
+        return None
+    print(f"Python (Embeddings): Using shared embedding service at {EMBEDDING_SERVICE_ADDRESS} (model '{model_name}', {EMBEDDING_BACKEND}, pid {info.get('pid')}).", file=sys.stderr)
+    return RemoteEncoder(conn, info)
+
+
+# A dead / restarted service shows up as these on the connection.
+CONNECTION_ERRORS = (EOFError, OSError)
+
+
+def _load_in_process(model_name: str):
+    print(f"Python (Embeddings): Loading '{model_name}' in-process ({EMBEDDING_BACKEND}).", file=sys.stderr)
+    return load_model(model_name)
+
+
+class SharedEncoder:
+    """
+    The service's RemoteEncoder while it answers. On a connection error the broken connection is
+    dropped and the service is reconnected to once; if that fails too, the model is loaded
+    in-process and used from then on.
+    """
+
+    def __init__(self, model_name: str, remote: RemoteEncoder):
+        self.model_name = model_name
+        self._remote: Union[RemoteEncoder, None] = remote
+        self._local = None
+        self._lock = threading.Lock()
+        self.dimension = remote.dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _replace_remote(self, broken: RemoteEncoder, error: Exception) -> None:
+        with self._lock:
+            if self._remote is not broken:
+                return  # another thread already replaced it
+            print(f"Python WARNING (Embeddings): Lost the embedding service ({error.__class__.__name__}: {error}); reconnecting.", file=sys.stderr)
+            metrics.increment("embedding_service_reconnects")
+            broken.close()
+            self._remote = connect(self.model_name)
+            if self._remote is None and self._local is None:
+                self._local = _load_in_process(self.model_name)
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs: Any):
+        for _ in range(2):  # the current connection, then one fresh one
+            remote = self._remote
+            if remote is None:
+                break
+            try:
+                return remote.encode(sentences, **kwargs)
+            except CONNECTION_ERRORS as e:
+                self._replace_remote(remote, e)
+        with self._lock:
+            if self._local is None:
+                self._local = _load_in_process(self.model_name)
+        return self._local.encode(sentences, **kwargs)
+
+
+_encoders: Dict[str, Any] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL_NAME):
+    """Shared-service encoder if reachable, else the model loaded in-process (cached per model)."""
+    with _encoders_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            remote = connect(model_name)
+            encoder = SharedEncoder(model_name, remote) if remote is not None else _load_in_process(model_name)
+            _encoders[model_name] = encoder
+        return encoder
+
+
+# ───────────────────────── Service ───────────────────────── #
+
+def _attach_buffer(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a client's buffer without letting this process's resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class EmbeddingService:
+    def __init__(self, model_name: str, backend: str = EMBEDDING_BACKEND):
+        import numpy as np
+
+        self.np = np
+        self.model_name = model_name
+        self.backend = backend
+        print(f"Python (EmbeddingService): Loading '{model_name}' ({backend})...", file=sys.stderr)
+        self.model = load_model(model_name, backend)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self._encode_lock = threading.Lock()  # the model runs one batch at a time; torch parallelises inside it
+        print(f"Python (EmbeddingService): Model loaded (dim={self.dimension}).", file=sys.stderr)
+
+    def _encode_into(self, request: Dict[str, Any], shm: shared_memory.SharedMemory) -> Tuple[int, int]:
+        np = self.np
+        texts = request["texts"]
+        shape = (len(texts), self.dimension)
+        if shm.size < shape[0] * shape[1] * 4:
+            raise ValueError(f"shared buffer of {shm.size} bytes is too small for {shape}")
+        with self._encode_lock, metrics.timer("embedding", source="service", backend=self.backend):
+            vectors = self.model.encode(
+                texts, batch_size=int(request.get("batch_size") or 32), convert_to_numpy=True,
+                normalize_embeddings=bool(request.get("normalize")), show_progress_bar=False,
+            )
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[:] = vectors
+        del out  # release the export before the buffer can be closed
+        metrics.increment("embedding_texts", len(texts), source="service")
+        return shape
+
+    def handle(self, conn: connection.Connection) -> None:
+        shm: Union[shared_memory.SharedMemory, None] = None
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+                op = request.get("op")
+                if op == "info":
+                    conn.send({"model": self.model_name, "backend": self.backend, "dim": self.dimension, "pid": os.getpid()})
+                elif op == "encode":
+                    try:
+                        if shm is None or shm.name.lstrip("/") != request["shm"].lstrip("/"):
+                            if shm is not None:
+                                shm.close()
+                            shm = _attach_buffer(request["shm"])
+                        conn.send({"ok": True, "shape": self._encode_into(request, shm)})
+                    except Exception as e:
+                        print(f"Python Error (EmbeddingService): encode failed: {e}", file=sys.stderr)
+                        conn.send({"ok": False, "error": str(e)})
+                else:
+                    conn.send({"ok": False, "error": f"unknown op {op!r}"})
+        finally:
+            if shm is not None:
+                shm.close()
+            conn.close()
+
+    def serve_forever(self, address: str) -> None:
+        listen_address, family = parse_address(address)
+        if family == "AF_UNIX":
+            if os.path.exists(listen_address):
+                os.remove(listen_address)  # stale socket from a previous run
+            old_umask = os.umask(0o177)  # the socket is created 0600: no window where others can connect
+            try:
+                listener = connection.Listener(listen_address, family=family, authkey=EMBEDDING_SERVICE_AUTHKEY)
+            finally:
+                os.umask(old_umask)
+            os.chmod(listen_address, 0o600)
+        else:
+            print(f"Python WARNING (EmbeddingService): Listening on TCP {address}; every local user can reach it, "
+                  "so the authkey must stay secret. A Unix socket path is safer.", file=sys.stderr)
+            listener = connection.Listener(listen_address, family=family, authkey=EMBEDDING_SERVICE_AUTHKEY)
+        with listener:
+            print(f"Python (EmbeddingService): Listening on {address}", file=sys.stderr)
+            while True:
+                try:
+                    conn = listener.accept()
+                except (connection.AuthenticationError, OSError) as e:
+                    print(f"Python WARNING (EmbeddingService): Rejected connection: {e}", file=sys.stderr)
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve one shared sentence-embedding model to the local Python services.")
+    parser.add_argument("--address", default=EMBEDDING_SERVICE_ADDRESS,
+                        help="Unix socket path or host:port (default: EMBEDDING_SERVICE_ADDRESS).")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND,
+                        help="Inference backend (default: EMBEDDING_BACKEND).")
+    cli_args = parser.parse_args()
+    if not EMBEDDING_SERVICE_AUTHKEY:
+        print("Python Error (EmbeddingService): EMBEDDING_SERVICE_AUTHKEY is not set; refusing to start.", file=sys.stderr)
+        sys.exit(1)
+    if cli_args.address.lower() in ("", "off", "false", "0", "none"):
+        print("Python Error (EmbeddingService): No address; set EMBEDDING_SERVICE_ADDRESS or pass --address.", file=sys.stderr)
+        sys.exit(1)
+    EmbeddingService(cli_args.model, cli_args.backend).serve_forever(cli_args.address)
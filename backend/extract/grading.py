@@ -0,0 +1,78 @@
+"""
+grading.py
+
+Table-driven marks allocation shared by Combined_Results.py and Marksheet_Generator.py.
+
+A similarity score is mapped to a fraction of the question's maximum marks by
+threshold bands: the highest band whose threshold is <= similarity wins, and
+anything below the lowest threshold scores 0. The whole lookup is a single
+np.digitize over the similarity column, so a full class frame is graded in one
+array operation.
+
+Bands can be overridden with the SCORE_BANDS environment variable, a JSON list of
+[threshold, fraction] pairs, e.g. SCORE_BANDS='[[0.5, 0.5], [0.8, 1.0]]'.
+"""
+import os
+import sys
+import json
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# (similarity threshold, fraction of max marks awarded), ascending by threshold.
+DEFAULT_SCORE_BANDS: List[Tuple[float, float]] = [
+    (0.45, 0.50),
+    (0.50, 0.60),
+    (0.60, 0.65),
+    (0.70, 0.75),
+    (0.80, 0.90),
+    (0.90, 1.00),
+]
+
+
+def load_score_bands() -> List[Tuple[float, float]]:
+    """Reads SCORE_BANDS from the environment, falling back to DEFAULT_SCORE_BANDS."""
+    raw = os.getenv("SCORE_BANDS")
+    if not raw:
+        return list(DEFAULT_SCORE_BANDS)
+    try:
+        bands = sorted((float(threshold), float(fraction)) for threshold, fraction in json.loads(raw))
+        if not bands:
+            raise ValueError("no bands given")
+        return bands
+    except (ValueError, TypeError) as e:
+        print(f"WARNING (grading): Invalid SCORE_BANDS '{raw}' ({e}). Using default bands.", file=sys.stderr)
+        return list(DEFAULT_SCORE_BANDS)
+
+
+SCORE_BANDS = load_score_bands()
+_BAND_THRESHOLDS = np.array([threshold for threshold, _ in SCORE_BANDS], dtype=np.float64)
+# Index 0 is "below every threshold"; np.digitize returns 1..n for the bands.
+_BAND_FRACTIONS = np.array([0.0] + [fraction for _, fraction in SCORE_BANDS], dtype=np.float64)
+
+
+def grade_scores(similarity, max_marks) -> np.ndarray:
+    """Vectorized score rule: integer marks for arrays of similarities and max marks (any matching shape)."""
+    sim = np.nan_to_num(np.asarray(similarity, dtype=np.float64), nan=0.0)
+    max_m = np.nan_to_num(np.asarray(max_marks, dtype=np.float64), nan=0.0)
+    band_idx = np.digitize(sim, _BAND_THRESHOLDS, right=False)
+    return np.rint(_BAND_FRACTIONS[band_idx] * max_m).astype(np.int64)
+
+
+def grade_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds/overwrites the 'score' column from 'similarity' and 'max_marks' in one pass."""
+    df["score"] = grade_scores(
+        pd.to_numeric(df["similarity"], errors="coerce").to_numpy(),
+        pd.to_numeric(df["max_marks"], errors="coerce").to_numpy(),
+    )
+    return df
+
+
+def percentage_column(score, max_marks) -> np.ndarray:
+    """score / max_marks * 100 rounded to 2 places, 0.0 where max_marks is 0."""
+    score_arr = np.asarray(score, dtype=np.float64)
+    max_arr = np.asarray(max_marks, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(max_arr > 0, score_arr / max_arr * 100, 0.0)
+    return np.round(pct, 2)
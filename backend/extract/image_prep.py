@@ -0,0 +1,135 @@
+"""
+image_prep.py
+
+Prepares rendered PDF pages (pdf2image, 200 DPI: ~1654x2339 for A4) before they
+are sent to the vision model in Answer_Generator.Student:
+
+  • grayscale: answer scripts are ink on paper, colour only adds bytes
+  • deskew: small scan rotations (up to OCR_DESKEW_MAX_DEGREES) are estimated from
+    the row profile of dark pixels and undone
+  • downscale so the long side is at most OCR_IMAGE_MAX_SIDE (never upscaled)
+  • encode as JPEG or WebP at OCR_IMAGE_QUALITY
+  • for the roll-number call, crop to the top ROLL_HEADER_CROP of the page where
+    the roll-number box sits
+
+OCR_IMAGE_PREP=off restores the previous payload (full-colour page, JPEG at
+PIL's default quality). Check the OCR impact of any setting with
+benchmark_image_prep.py.
+"""
+from __future__ import annotations
+
+import io
+import os
+import base64
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+import metrics
+
+env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../.env'))
+load_dotenv(dotenv_path=env_path)
+
+IMAGE_PREP_ENABLED = os.getenv("OCR_IMAGE_PREP", "on").strip().lower() not in ("off", "false", "0", "no")
+# Llama 4 Scout reads images as 336-px tiles; detail beyond a few tiles per side is not used.
+OCR_IMAGE_MAX_SIDE = int(os.getenv("OCR_IMAGE_MAX_SIDE", "1344"))
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "jpeg").strip().lower()  # "jpeg" or "webp"
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "70"))
+OCR_DESKEW_MAX_DEGREES = float(os.getenv("OCR_DESKEW_MAX_DEGREES", "5"))  # 0 disables deskew
+# Fraction of the page height (from the top) sent for roll extraction; 1 sends the whole page.
+ROLL_HEADER_CROP = float(os.getenv("ROLL_HEADER_CROP", "0.35"))
+
+DESKEW_STEP_DEGREES = 0.25
+# Skew is estimated on a copy this wide; full resolution adds nothing to the estimate.
+DESKEW_PROBE_WIDTH = 800
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+# ───────────────────────── Steps ───────────────────────── #
+
+def to_grayscale(img: Image.Image) -> Image.Image:
+    return img if img.mode == "L" else ImageOps.grayscale(img)
+
+
+def estimate_skew(gray: Image.Image, max_degrees: float = OCR_DESKEW_MAX_DEGREES) -> float:
+    """Rotation (degrees, PIL's counter-clockwise sign) that makes the text lines horizontal."""
+    if max_degrees <= 0:
+        return 0.0
+    probe = fit_to_side(gray, DESKEW_PROBE_WIDTH)
+    ink = Image.eval(probe, lambda v: 255 if v < 128 else 0)  # dark pixels -> 255
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_degrees, max_degrees + 1e-9, DESKEW_STEP_DEGREES):
+        rows = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST, fillcolor=0), dtype=np.float64).sum(axis=1)
+        # Aligned text lines give a profile of sharp peaks and gaps.
+        score = float(np.square(np.diff(rows)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(gray: Image.Image, max_degrees: float = OCR_DESKEW_MAX_DEGREES) -> Image.Image:
+    angle = estimate_skew(gray, max_degrees)
+    if abs(angle) < DESKEW_STEP_DEGREES:
+        return gray
+    metrics.increment("pages_deskewed")
+    return gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+
+def fit_to_side(img: Image.Image, max_side: int = OCR_IMAGE_MAX_SIDE) -> Image.Image:
+    """Downscales so that the longer side is at most `max_side`."""
+    scale = max_side / max(img.size)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+
+
+def crop_header(img: Image.Image, fraction: float = ROLL_HEADER_CROP) -> Image.Image:
+    if fraction >= 1:
+        return img
+    return img.crop((0, 0, img.width, max(1, round(img.height * fraction))))
+
+
+def header_crop_enabled() -> bool:
+    return IMAGE_PREP_ENABLED and ROLL_HEADER_CROP < 1
+
+
+# ───────────────────────── Encoding ───────────────────────── #
+
+def prepare(img: Image.Image, header_only: bool = False) -> Image.Image:
+    """Grayscale, deskewed, cropped (header_only) and downscaled copy of a rendered page."""
+    with metrics.timer("image_prep"):
+        out = deskew(to_grayscale(img))
+        if header_only:
+            out = crop_header(out)
+        return fit_to_side(out)
+
+
+def encode(img: Image.Image, fmt: str = OCR_IMAGE_FORMAT, quality: int = OCR_IMAGE_QUALITY) -> Tuple[bytes, str]:
+    """(image bytes, MIME type)."""
+    fmt = fmt if fmt in MIME_TYPES else "jpeg"
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue(), MIME_TYPES[fmt]
+
+
+def legacy_data_url(img: Image.Image) -> str:
+    """The pre-image_prep payload: the full page as JPEG at PIL's default quality."""
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="JPEG")
+    return f"data:image/jpeg;base64,{base64.b64encode(buf.getvalue()).decode()}"
+
+
+def data_url(img: Image.Image, header_only: bool = False) -> str:
+    """data: URL for a vision request; counts the bytes uploaded."""
+    if IMAGE_PREP_ENABLED:
+        data, mime = encode(prepare(img, header_only))
+        url = f"data:{mime};base64,{base64.b64encode(data).decode()}"
+    else:
+        url = legacy_data_url(img)
+    metrics.increment("vision_upload_bytes", len(url))
+    return url
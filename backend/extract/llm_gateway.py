@@ -0,0 +1,272 @@
+"""
+llm_gateway.py
+
+Single entry point for every Groq chat-completion call made by the Python scripts
+(question_parser.py, Answer_from_book.py, Answer_Generator.Student and
+studentScripts.ProfessorUploadHandler).
+
+  • one pooled Groq client (keep-alive HTTP connections) per API key
+  • exponential backoff with jitter on 429 / 5xx / connection errors,
+    honoring the server's `retry-after` header when present
+  • an opt-in SQLite response cache keyed by (model, messages hash, temperature),
+    so an identical deterministic prompt — e.g. re-parsing the same question paper —
+    is served locally instead of hitting the API again. Only calls made with
+    use_cache=True are cached, and never multimodal ones (page images of student
+    scripts) or ones above LLM_CACHE_MAX_TEMPERATURE (sampled answers must stay
+    sampled). Entries expire after LLM_CACHE_TTL_DAYS and the table is capped at
+    LLM_CACHE_MAX_ENTRIES (oldest dropped first)
+  • token accounting: prompt / completion tokens of every call are counted in
+    metrics (llm_prompt_tokens / llm_completion_tokens) and, if the caller passes
+    a `usage_out` dict, returned for that call
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Union
+
+import httpx
+import groq
+from groq import Groq
+
+import metrics
+
+# ───────────────────────── Configuration ───────────────────────── #
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SEC = float(os.getenv("LLM_BACKOFF_BASE_SEC", "1.0"))
+LLM_BACKOFF_MAX_SEC = float(os.getenv("LLM_BACKOFF_MAX_SEC", "60.0"))
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "120.0"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Calls sampled above this temperature are never cached, even with use_cache=True. The default
+# covers the near-deterministic text calls (paper parsing at 0.05, factual answers at 0.1).
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.1"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "7"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Override the API host, e.g. http://localhost:6100 for mock_groq_server.py during load tests.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(SCRIPT_DIR, "cache_llm_responses", "responses.sqlite3"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Expiry and the size cap are enforced on open and then every this many writes.
+CACHE_PRUNE_EVERY = 100
+# ────────────────────────────────────────────────────────────────── #
+
+_clients: Dict[str, Groq] = {}
+_clients_lock = threading.Lock()
+
+_cache_conn: Union[sqlite3.Connection, None] = None
+_cache_lock = threading.Lock()
+_cache_writes = 0
+
+
+# ───────────────────────── Client pool ───────────────────────── #
+
+def get_client(api_key: str) -> Groq:
+    """Returns the shared Groq client for `api_key`, creating it (and its connection pool) once."""
+    if not api_key:
+        raise ValueError("Groq API key is not set.")
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            http_client = httpx.Client(
+                timeout=LLM_TIMEOUT_SEC,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                ),
+            )
+            # Retries are handled here (with retry-after support), not inside the SDK.
+            client = Groq(api_key=api_key, base_url=GROQ_BASE_URL, http_client=http_client, max_retries=0)
+            _clients[api_key] = client
+        return client
+
+
+# ───────────────────────── Response cache ───────────────────────── #
+
+def _get_cache() -> Union[sqlite3.Connection, None]:
+    global _cache_conn
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache_conn is None:
+        try:
+            os.makedirs(os.path.dirname(LLM_CACHE_PATH), exist_ok=True)
+            _cache_conn = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False, timeout=30)
+            _cache_conn.execute("PRAGMA journal_mode=WAL")
+            # The first version of the cache stored every call, including OCR of student scripts; drop it.
+            _cache_conn.execute("DROP TABLE IF EXISTS responses")
+            _cache_conn.execute(
+                "CREATE TABLE IF NOT EXISTS text_responses ("
+                " cache_key TEXT PRIMARY KEY, model TEXT, content TEXT, created_at REAL)"
+            )
+            _cache_conn.execute("CREATE INDEX IF NOT EXISTS text_responses_created_at ON text_responses (created_at)")
+            _cache_conn.commit()
+            _prune_cache(_cache_conn)
+        except sqlite3.Error as e:
+            print(f"Python WARNING (llm_gateway): Response cache disabled, could not open {LLM_CACHE_PATH}: {e}", file=sys.stderr)
+            return None
+    return _cache_conn
+
+
+def _prune_cache(conn: sqlite3.Connection) -> None:
+    """Deletes expired entries and the oldest ones beyond LLM_CACHE_MAX_ENTRIES."""
+    try:
+        conn.execute("DELETE FROM text_responses WHERE created_at < ?", (time.time() - LLM_CACHE_TTL_DAYS * 86400,))
+        conn.execute(
+            "DELETE FROM text_responses WHERE cache_key NOT IN"
+            " (SELECT cache_key FROM text_responses ORDER BY created_at DESC LIMIT ?)",
+            (max(LLM_CACHE_MAX_ENTRIES, 0),),
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Python WARNING (llm_gateway): Could not prune response cache: {e}", file=sys.stderr)
+
+
+def cacheable(messages: List[Dict[str, Any]], temperature: float) -> bool:
+    """Text-only prompts at or below LLM_CACHE_MAX_TEMPERATURE; image parts are never stored."""
+    if temperature > LLM_CACHE_MAX_TEMPERATURE:
+        return False
+    return all(isinstance(m.get("content"), str) for m in messages)
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], temperature: float, **params: Any) -> str:
+    messages_hash = hashlib.sha256(
+        json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    key_material = json.dumps(
+        {"model": model, "messages": messages_hash, "temperature": temperature, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Union[str, None]:
+    with _cache_lock:
+        conn = _get_cache()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT content FROM text_responses WHERE cache_key = ? AND created_at >= ?",
+            (key, time.time() - LLM_CACHE_TTL_DAYS * 86400),
+        ).fetchone()
+        return row[0] if row else None
+
+
+def _cache_put(key: str, model: str, content: str) -> None:
+    global _cache_writes
+    with _cache_lock:
+        conn = _get_cache()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO text_responses (cache_key, model, content, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, content, time.time()),
+            )
+            conn.commit()
+            _cache_writes += 1
+            if _cache_writes % CACHE_PRUNE_EVERY == 0:
+                _prune_cache(conn)
+        except sqlite3.Error as e:
+            print(f"Python WARNING (llm_gateway): Could not write response cache: {e}", file=sys.stderr)
+
+
+# ───────────────────────── Retry helpers ───────────────────────── #
+
+def _retry_after_seconds(error: Exception) -> Union[float, None]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, groq.APIConnectionError): # includes APITimeoutError
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    retry_after = _retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, LLM_BACKOFF_MAX_SEC)
+    delay = LLM_BACKOFF_BASE_SEC * (2 ** attempt)
+    return min(delay, LLM_BACKOFF_MAX_SEC) * random.uniform(0.5, 1.0)
+
+
+# ───────────────────────── Public API ───────────────────────── #
+
+def chat_completion(
+    api_key: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: Union[int, None] = None,
+    use_cache: bool = False,
+    usage_out: Union[Dict[str, Any], None] = None,
+    **params: Any,
+) -> str:
+    """
+    Runs one chat completion and returns the stripped message content.
+    use_cache=True serves / stores the reply in the response cache when the call is cacheable().
+    If `usage_out` is given it is filled with this call's prompt_tokens / completion_tokens / cached.
+    Raises RuntimeError if the API returns no choices, or the last API error once retries are exhausted.
+    """
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+
+    key = cache_key(model, messages, temperature, **params) if use_cache and cacheable(messages, temperature) else None
+    if key:
+        cached = _cache_get(key)
+        if cached is not None:
+            metrics.increment("llm_cache_hits", model=model)
+            if usage_out is not None:
+                usage_out.update(prompt_tokens=0, completion_tokens=0, cached=True)
+            return cached
+
+    client = get_client(api_key)
+    attempt = 0
+    while True:
+        try:
+            with metrics.timer("llm_call", model=model):
+                rsp = client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, **params
+                )
+            break
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt, e)
+            attempt += 1
+            metrics.increment("llm_retries", model=model, reason=getattr(e, "status_code", type(e).__name__))
+            print(f"Python (llm_gateway): {type(e).__name__} from Groq ({model}); retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+    usage = getattr(rsp, "usage", None)
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    metrics.increment("llm_prompt_tokens", prompt_tokens, model=model)
+    metrics.increment("llm_completion_tokens", completion_tokens, model=model)
+    if usage_out is not None:
+        usage_out.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached=False)
+
+    if not rsp.choices:
+        raise RuntimeError(f"Groq ({model}) returned no choices.")
+    content = (rsp.choices[0].message.content or "").strip()
+    if key and content:
+        _cache_put(key, model, content)
+    return content
@@ -0,0 +1,218 @@
+"""
+metrics.py
+
+Lightweight, dependency-free instrumentation shared by the Python services.
+
+  • `timer(stage, **labels)`   context manager: observes wall time of a stage
+                               (pdf_render, ocr, roll_extraction, segmentation,
+                               embedding, faiss_search, llm_call, docx_render,
+                               pandoc_render, gridfs_put) and counts exceptions
+  • `increment(name, ...)`     plain counters (cache hits, retries, pages, ...)
+  • `render_prometheus()`      process-wide totals in Prometheus text format,
+                               served on /metrics by the Flask services
+  • `job(name)`                collects the same observations for one job only;
+                               `save_job_summary` stores its JSON summary on the
+                               job's Mongo document under `processingMetrics.<name>`
+
+Jobs are tracked with a ContextVar, so observations made in worker threads are
+only attributed to a job if the thread runs inside a copy of the job's context
+(`contextvars.copy_context().run`).
+"""
+import sys
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Tuple, Union
+
+METRIC_PREFIX = "nirikshak"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds (seconds) of the stage-duration histogram; covers a 10 ms embed up to a slow LLM call.
+DURATION_BUCKETS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+# (stage, labels) -> {"count", "sum", "max", "errors", "buckets": [...]}
+_timings: Dict[Tuple[str, LabelKey], Dict[str, Any]] = {}
+# (name, labels) -> value
+_counters: Dict[Tuple[str, LabelKey], float] = {}
+
+_current_job: contextvars.ContextVar = contextvars.ContextVar("nirikshak_metrics_job", default=None)
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ───────────────────────── Per-job collection ───────────────────────── #
+
+class JobMetrics:
+    """Per-stage totals for one job (a professor run, a student extraction, a combined result...)."""
+
+    def __init__(self, name: str, parent: Union["JobMetrics", None] = None):
+        self.name = name
+        self.parent = parent
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, stage: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"count": 0, "totalSec": 0.0, "maxSec": 0.0, "errors": 0})
+            entry["count"] += 1
+            entry["totalSec"] += seconds
+            entry["maxSec"] = max(entry["maxSec"], seconds)
+            if error:
+                entry["errors"] += 1
+
+    def _increment(self, name: str, value: float) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": int(v["count"]),
+                    "totalSec": round(v["totalSec"], 3),
+                    "avgSec": round(v["totalSec"] / v["count"], 4) if v["count"] else 0.0,
+                    "maxSec": round(v["maxSec"], 3),
+                    "errors": int(v["errors"]),
+                }
+                for stage, v in sorted(self._stages.items(), key=lambda kv: -kv[1]["totalSec"])
+            }
+            counters = dict(sorted(self._counters.items()))
+        return {
+            "job": self.name,
+            "startedAt": self.started_at,
+            "wallSec": round(time.perf_counter() - self._start, 3),
+            "stages": stages,
+            "counters": counters,
+        }
+
+
+def _active_jobs() -> Iterator[JobMetrics]:
+    job_metrics = _current_job.get()
+    while job_metrics is not None:
+        yield job_metrics
+        job_metrics = job_metrics.parent
+
+
+@contextmanager
+def job(name: str) -> Iterator[JobMetrics]:
+    """Scopes a JobMetrics to the block; nested jobs also feed their parent."""
+    job_metrics = JobMetrics(name, parent=_current_job.get())
+    token = _current_job.set(job_metrics)
+    try:
+        yield job_metrics
+    finally:
+        _current_job.reset(token)
+
+
+# ───────────────────────── Recording ───────────────────────── #
+
+def observe(stage: str, seconds: float, error: bool = False, **labels: Any) -> None:
+    key = (stage, _label_key(labels))
+    with _lock:
+        entry = _timings.get(key)
+        if entry is None:
+            entry = {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0, "buckets": [0] * len(DURATION_BUCKETS)}
+            _timings[key] = entry
+        entry["count"] += 1
+        entry["sum"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+        if error:
+            entry["errors"] += 1
+        for i, upper in enumerate(DURATION_BUCKETS):
+            if seconds <= upper:
+                entry["buckets"][i] += 1
+    for job_metrics in _active_jobs():
+        job_metrics._observe(stage, seconds, error)
+
+
+@contextmanager
+def timer(stage: str, **labels: Any) -> Iterator[None]:
+    """Times the block as one observation of `stage`; an exception counts as an error and is re-raised."""
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, error, **labels)
+
+
+def increment(name: str, value: float = 1, **labels: Any) -> None:
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    for job_metrics in _active_jobs():
+        job_metrics._increment(name, value)
+
+
+# ───────────────────────── Export ───────────────────────── #
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: LabelKey) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Integers exactly; floats with repr (shortest round-trip, all significant digits)."""
+    if isinstance(value, int):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Process-wide totals in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        timings = {k: dict(v, buckets=list(v["buckets"])) for k, v in _timings.items()}
+        counters = dict(_counters)
+
+    seconds_name = f"{METRIC_PREFIX}_stage_duration_seconds"
+    errors_name = f"{METRIC_PREFIX}_stage_errors_total"
+    lines = [
+        f"# HELP {seconds_name} Wall time of instrumented pipeline stages.",
+        f"# TYPE {seconds_name} histogram",
+    ]
+    for (stage, labels), v in sorted(timings.items()):
+        base = (("stage", stage),) + labels
+        for upper, cumulative in zip(DURATION_BUCKETS, v["buckets"]):
+            lines.append(f"{seconds_name}_bucket{_format_labels(base + (('le', repr(upper)),))} {cumulative}")
+        lines.append(f"{seconds_name}_bucket{_format_labels(base + (('le', '+Inf'),))} {v['count']}")
+        lines.append(f"{seconds_name}_sum{_format_labels(base)} {v['sum']:.6f}")
+        lines.append(f"{seconds_name}_count{_format_labels(base)} {v['count']}")
+    lines += [
+        f"# HELP {errors_name} Instrumented stages that raised.",
+        f"# TYPE {errors_name} counter",
+    ]
+    for (stage, labels), v in sorted(timings.items()):
+        lines.append(f"{errors_name}{_format_labels((('stage', stage),) + labels)} {v['errors']}")
+
+    for name in sorted({name for name, _ in counters}):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter"]
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def save_job_summary(collection, query: Dict[str, Any], job_metrics: JobMetrics) -> None:
+    """Stores the job summary on the matching document; never fails the job itself."""
+    try:
+        collection.update_one(query, {"$set": {f"processingMetrics.{job_metrics.name}": job_metrics.summary()}})
+    except Exception as e:
+        print(f"Python WARNING (metrics): Could not store '{job_metrics.name}' metrics summary: {e}", file=sys.stderr)
@@ -0,0 +1,289 @@
+"""
+mock_groq_server.py
+
+Local stand-in for the subset of the Groq chat-completions API used by the
+pipeline, for offline load testing and benchmarks:
+
+  • Student.extract_text_from_image   (vision OCR prompt)
+  • Student.extract_roll_number       (vision roll-number prompt)
+  • Student.extract_header            (vision JSON mode: page text + roll number)
+  • Answer_from_book.get_groq_llm_response / generate_answers_single_call (JSON mode)
+  • question_parser.generate_json_with_groq
+
+Point the scripts at it with  GROQ_BASE_URL=http://localhost:6100  (read by
+llm_gateway.py; any non-empty GROQ_API_KEY* values work). Latency, rate limiting
+(HTTP 429 + retry-after) and outputs are configurable from the command line:
+
+    python mock_groq_server.py --latency-ms 800 --latency-sd-ms 300 --rpm 30
+
+Vision outputs are deterministic: with --vision-mode tesseract (default when
+pytesseract is importable) the page image is OCR'd locally, otherwise canned
+text seeded from the image hash is returned.
+"""
+import re
+import io
+import sys
+import math
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from typing import Any, Dict, List
+
+from flask import Flask, request, jsonify
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+app = Flask(__name__)
+
+# Set from the command line in __main__ (defaults suit CI).
+CONFIG: Dict[str, Any] = {
+    "latency_dist": "lognormal",
+    "latency_ms": 0.0,
+    "latency_sd_ms": 0.0,
+    "rpm": 0,               # 0 = unlimited
+    "error_rate": 0.0,      # probability of a spurious 429
+    "retry_after_sec": 2,
+    "vision_mode": "tesseract" if pytesseract else "canned",
+    "seed": 1234,
+}
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"requests": 0, "rate_limited": 0, "vision": 0, "roll": 0, "json": 0, "answers_json": 0,
+                          "header_json": 0, "text": 0, "prompt_tokens": 0, "completion_tokens": 0}
+_request_times: deque = deque()
+_rng = random.Random(CONFIG["seed"])
+
+CANNED_HEADER_PAGE = (
+    "NATIONAL INSTITUTE OF TECHNOLOGY\nRoll Number: {roll}\nDegree: MCA\nDepartment: Computer Applications\n"
+    "Semester: 2\nCourse Code: CA712\nDate of Examination: 01-01-2025"
+)
+CANNED_ANSWER_PAGE = (
+    "Answer 1\nA process is a program in execution. It has its own address space, registers and stack.\n"
+    "Answer 2\nPaging divides memory into fixed size frames and maps logical pages onto them.\n"
+)
+
+
+# ───────────────────────── helpers ───────────────────────── #
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def sleep_latency() -> None:
+    mean = CONFIG["latency_ms"] / 1000.0
+    sd = CONFIG["latency_sd_ms"] / 1000.0
+    if mean <= 0:
+        return
+    dist = CONFIG["latency_dist"]
+    with _stats_lock:
+        if dist == "fixed" or sd <= 0:
+            delay = mean
+        elif dist == "uniform":
+            delay = _rng.uniform(max(0.0, mean - sd), mean + sd)
+        elif dist == "normal":
+            delay = max(0.0, _rng.gauss(mean, sd))
+        else:  # lognormal with the requested mean / sd
+            sigma2 = math.log(1 + (sd / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            delay = _rng.lognormvariate(mu, sigma2 ** 0.5)
+    time.sleep(delay)
+
+
+def rate_limited() -> bool:
+    """Sliding 60 s window over --rpm, plus random injected 429s at --error-rate."""
+    now = time.time()
+    with _stats_lock:
+        if CONFIG["error_rate"] > 0 and _rng.random() < CONFIG["error_rate"]:
+            return True
+        if CONFIG["rpm"] <= 0:
+            return False
+        while _request_times and now - _request_times[0] >= 60:
+            _request_times.popleft()
+        if len(_request_times) >= CONFIG["rpm"]:
+            return True
+        _request_times.append(now)
+        return False
+
+
+def split_content(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Flattens message contents into prompt text plus any base64 image payloads."""
+    texts, images = [], []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    url = (part.get("image_url") or {}).get("url", "")
+                    if "," in url:
+                        images.append(url.split(",", 1)[1])
+    return {"text": "\n".join(texts), "images": images}
+
+
+def ocr_image(b64: str) -> str:
+    digest = hashlib.sha256(b64.encode()).hexdigest()
+    if CONFIG["vision_mode"] == "tesseract" and pytesseract is not None:
+        try:
+            return pytesseract.image_to_string(Image.open(io.BytesIO(base64.b64decode(b64)))).strip()
+        except Exception as e:
+            print(f"Mock (groq): local OCR failed ({e}); returning canned text.", file=sys.stderr)
+    # canned: one page in four is a header page, deterministically by image hash
+    if int(digest[:2], 16) % 4 == 0:
+        return CANNED_HEADER_PAGE.format(roll=canned_roll(digest))
+    return CANNED_ANSWER_PAGE
+
+
+def canned_roll(digest: str) -> str:
+    return "1" + "".join(str(int(c, 16) % 10) for c in digest[:8])
+
+
+def roll_from_image(b64: str) -> str:
+    text = ocr_image(b64) if CONFIG["vision_mode"] == "tesseract" else ""
+    match = re.search(r"[1-4]\d{8}", text.replace(" ", ""))
+    return match.group(0) if match else canned_roll(hashlib.sha256(b64.encode()).hexdigest())
+
+
+def questions_json_from_text(text: str) -> str:
+    """Deterministic question_parser output: one entry per numbered line of the paper text."""
+    body = text.split("--- TEXT START ---", 1)[-1].split("--- TEXT END ---", 1)[0]
+    questions = []
+    for m in re.finditer(r"(?m)^\s*Q?\s*(\d+[a-z]?)[\.\)]\s*(.+?)\s*(?:\[(\d+)\s*marks?\]|\((\d+)\s*marks?\))?\s*$", body):
+        marks = m.group(3) or m.group(4)
+        questions.append({"questionNo": m.group(1), "questionText": m.group(2), "marks": int(marks) if marks else 5})
+    if not questions:
+        questions = [{"questionNo": str(i), "questionText": f"Synthetic question {i}", "marks": 5} for i in (1, 2, 3)]
+    return json.dumps(questions)
+
+
+def answer_from_prompt(text: str) -> str:
+    """Deterministic answer for Answer_from_book prompts: echoes the question plus leading context."""
+    question = re.search(r"Question:\s*(.+)", text)
+    context = re.search(r"Context[^:]*:\s*(.+?)\nQuestion:", text, flags=re.DOTALL)
+    q = question.group(1).strip() if question else "the question"
+    ctx = context.group(1).strip()[:600] if context else ""
+    return f"{q} {ctx}".strip()
+
+
+def answers_json_from_prompt(text: str) -> str:
+    """Deterministic multi-answer reply: the same echoed answer under each requested style key."""
+    answer = answer_from_prompt(text)
+    return json.dumps({"factual": answer, "balanced": answer, "creative": answer})
+
+
+def header_json_from_image(b64: str) -> str:
+    """Deterministic header-extraction reply: the OCR text, a keyword header check and its roll number."""
+    text = ocr_image(b64)
+    keywords = ("roll number", "degree", "department", "semester", "course code", "date of examination")
+    is_first = sum(k in text.lower() for k in keywords) >= 4
+    return json.dumps({"page_text": text, "is_first_page": is_first, "roll_number": roll_from_image(b64) if is_first else ""})
+
+
+def build_reply(body: Dict[str, Any]) -> Dict[str, str]:
+    parts = split_content(body.get("messages", []))
+    prompt = parts["text"]
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+    if json_mode and '"factual"' in prompt:
+        return {"kind": "answers_json", "content": answers_json_from_prompt(prompt)}
+    if parts["images"]:
+        if json_mode and '"page_text"' in prompt:
+            return {"kind": "header_json", "content": header_json_from_image(parts["images"][0])}
+        if "roll number" in prompt.lower():
+            return {"kind": "roll", "content": roll_from_image(parts["images"][0])}
+        return {"kind": "vision", "content": ocr_image(parts["images"][0])}
+    if "--- TEXT START ---" in prompt:
+        return {"kind": "json", "content": questions_json_from_text(prompt)}
+    return {"kind": "text", "content": answer_from_prompt(prompt)}
+
+
+# ───────────────────────── routes ───────────────────────── #
+
+@app.route("/openai/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    body = request.get_json(force=True, silent=True) or {}
+    with _stats_lock:
+        _stats["requests"] += 1
+
+    if rate_limited():
+        with _stats_lock:
+            _stats["rate_limited"] += 1
+        rsp = jsonify({"error": {"message": "Rate limit reached (mock).", "type": "tokens", "code": "rate_limit_exceeded"}})
+        rsp.status_code = 429
+        rsp.headers["retry-after"] = str(CONFIG["retry_after_sec"])
+        return rsp
+
+    sleep_latency()
+    reply = build_reply(body)
+    prompt_tokens = estimate_tokens(json.dumps(body.get("messages", [])))
+    completion_tokens = estimate_tokens(reply["content"])
+    with _stats_lock:
+        _stats[reply["kind"]] += 1
+        _stats["prompt_tokens"] += prompt_tokens
+        _stats["completion_tokens"] += completion_tokens
+
+    return jsonify({
+        "id": f"chatcmpl-mock-{_stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply["content"]},
+            "logprobs": None,
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    })
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    with _stats_lock:
+        return jsonify(dict(_stats))
+
+
+@app.route("/reset", methods=["POST"])
+def reset():
+    with _stats_lock:
+        for k in _stats:
+            _stats[k] = 0
+        _request_times.clear()
+    return jsonify({"status": "success"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Groq chat-completions API for offline load testing.")
+    parser.add_argument("--port", type=int, default=6100)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default=CONFIG["latency_dist"])
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"], help="Mean added latency per call.")
+    parser.add_argument("--latency-sd-ms", type=float, default=CONFIG["latency_sd_ms"], help="Spread of added latency.")
+    parser.add_argument("--rpm", type=int, default=CONFIG["rpm"], help="Requests per minute before answering 429 (0 = unlimited).")
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="Probability of a random 429.")
+    parser.add_argument("--retry-after", type=int, default=CONFIG["retry_after_sec"], help="retry-after seconds sent with 429s.")
+    parser.add_argument("--vision-mode", choices=["tesseract", "canned"], default=CONFIG["vision_mode"])
+    parser.add_argument("--seed", type=int, default=CONFIG["seed"])
+    cli_args = parser.parse_args()
+
+    CONFIG.update({
+        "latency_dist": cli_args.latency_dist, "latency_ms": cli_args.latency_ms,
+        "latency_sd_ms": cli_args.latency_sd_ms, "rpm": cli_args.rpm, "error_rate": cli_args.error_rate,
+        "retry_after_sec": cli_args.retry_after, "vision_mode": cli_args.vision_mode, "seed": cli_args.seed,
+    })
+    _rng.seed(cli_args.seed)
+    print(f"Mock (groq): Serving chat completions on http://localhost:{cli_args.port} with {CONFIG}", file=sys.stderr)
+    app.run(port=cli_args.port, threaded=True, debug=False)
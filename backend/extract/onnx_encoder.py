@@ -0,0 +1,155 @@
+"""
+onnx_encoder.py
+
+ONNX Runtime backend for the sentence-embedding model, selected with
+EMBEDDING_BACKEND=onnx-int8 (see embedding_service.py).
+
+The first use exports the SentenceTransformer's transformer to ONNX, applies
+int8 dynamic quantization (weights int8, activations quantized at run time)
+and caches the result, with its tokenizer, under cache_onnx_models/<model>/.
+Encoding then needs only onnxruntime and the tokenizer. Pooling and
+normalization reproduce the SentenceTransformer pipeline (mean pooling, plus
+L2 normalization when the model ends with a Normalize module, as
+all-MiniLM-L6-v2 does).
+
+Export ahead of time (e.g. in a deploy step) with:
+
+    python onnx_encoder.py --model all-MiniLM-L6-v2
+
+benchmark_embeddings.py reports the similarity-score delta against fp32.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict, List, Union
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(SCRIPT_DIR, "cache_onnx_models"))
+# 0 lets onnxruntime pick (all physical cores).
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+ONNX_OPSET = 14
+
+FP32_FILENAME = "model_fp32.onnx"
+INT8_FILENAME = "model_int8.onnx"
+CONFIG_FILENAME = "encoder_config.json"
+
+
+def model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "-"))
+
+
+def export_quantized(model_name: str, force: bool = False) -> str:
+    """Exports `model_name` to ONNX and writes its int8-quantized copy; returns the model directory."""
+    out_dir = model_dir(model_name)
+    if not force and os.path.exists(os.path.join(out_dir, INT8_FILENAME)) and os.path.exists(os.path.join(out_dir, CONFIG_FILENAME)):
+        return out_dir
+
+    import torch
+    from sentence_transformers import SentenceTransformer, models as st_models
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"Python (OnnxEncoder): Exporting '{model_name}' to ONNX (int8) in {out_dir}...", file=sys.stderr)
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    pooling = next((m for m in st_model if isinstance(m, st_models.Pooling)), None)
+    if pooling is None or not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"'{model_name}' does not use mean pooling; only mean pooling is supported by the ONNX backend.")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(out_dir, FP32_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, do_constant_folding=True,
+        )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILENAME), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(out_dir)
+
+    config = {
+        "model": model_name,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "maxSeqLength": st_model.max_seq_length,
+        "normalize": any(isinstance(m, st_models.Normalize) for m in st_model),
+        "inputNames": input_names,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"Python (OnnxEncoder): Export done ({config}).", file=sys.stderr)
+    return out_dir
+
+
+class OnnxEncoder:
+    """SentenceTransformer look-alike running the int8 ONNX model on CPU."""
+
+    def __init__(self, model_name: str, quantized: bool = True):
+        import numpy as np
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.np = np
+        self.model_name = model_name
+        directory = export_quantized(model_name)
+        with open(os.path.join(directory, CONFIG_FILENAME), encoding="utf-8") as f:
+            self.config: Dict[str, Any] = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_NUM_THREADS > 0:
+            options.intra_op_num_threads = ONNX_NUM_THREADS
+        model_path = os.path.join(directory, INT8_FILENAME if quantized else FP32_FILENAME)
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        print(f"Python (OnnxEncoder): Loaded {os.path.basename(model_path)} for '{model_name}'.", file=sys.stderr)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.config["dimension"])
+
+    def _encode_batch(self, texts: List[str]):
+        np = self.np
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=int(self.config["maxSeqLength"]), return_tensors="np",
+        )
+        feed = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+        hidden = self.session.run(None, feed)[0]
+        mask = tokens["attention_mask"].astype(np.float32)[:, :, None]
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False, **_ignored: Any):
+        """Same call shape as SentenceTransformer.encode (numpy output only)."""
+        np = self.np
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        dim = self.get_sentence_embedding_dimension()
+        if not texts:
+            return np.empty((0, dim), dtype=np.float32)
+
+        # Longest-first batches keep padding (and so wasted compute) small, as SentenceTransformer does.
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            vectors[idx] = self._encode_batch([texts[i] for i in idx])
+        if self.config.get("normalize") or normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.clip(norms, 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformer model to int8-quantized ONNX.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--force", action="store_true", help="Re-export even if a cached export exists.")
+    cli_args = parser.parse_args()
+    print(export_quantized(cli_args.model, force=cli_args.force))
@@ -4,15 +4,17 @@
 
 # python_api.py
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS # Import Flask-CORS
 import os
 import sys
 import traceback # For detailed error logging
 
-# --- Import Student Class (for /process-student-upload) ---
+import metrics # Stage timers/counters recorded by Student and ProfessorUploadHandler
+
+# --- Import Student Class (for /process-student-upload and /process-student-uploads) ---
 try:
-    from Answer_Generator import Student 
+    from Answer_Generator import Student, process_student_uploads
 except ImportError as e_student:
     print(f"Python Error (python_api): Could not import Student from Answer_Generator.py: {e_student}. Ensure the file exists and is in the Python path.", file=sys.stderr)
     # Define a dummy class if import fails, so the Flask app can still start (though endpoint will fail)
@@ -23,6 +25,9 @@ except ImportError as e_student:
         def process(self):
             print(f"Python (python_api): DUMMY Student.process called for {self.student_upload_id}. Does nothing.", file=sys.stderr)
             return False # Simulate failure
+    def process_student_uploads(student_upload_ids):
+        print(f"Python (python_api): DUMMY process_student_uploads called for {len(student_upload_ids)} ID(s). Does nothing.", file=sys.stderr)
+        return {upload_id: "failed" for upload_id in student_upload_ids} # Simulate failure
 
 # --- Import ProfessorUploadHandler Class (for /process-professor-scripts) ---
 try:
@@ -32,7 +37,7 @@ try:
 except ImportError as e_prof:
     print(f"Python Error (python_api): Could not import ProfessorUploadHandler from studentScripts.py: {e_prof}. Ensure the file exists and is in the Python path.", file=sys.stderr)
     class ProfessorUploadHandler: # Dummy class
-        def __init__(self, professor_upload_id=None): # Match modified signature if you adapted it
+        def __init__(self, professor_upload_id=None, resume=False): # Match modified signature if you adapted it
             self.professor_upload_id = professor_upload_id
             print("Python (python_api): WARNING - Using DUMMY ProfessorUploadHandler class due to import error for /process-professor-scripts.", file=sys.stderr)
         def run(self): # ProfessorUploadHandler has a 'run' method
@@ -92,9 +97,71 @@ def process_student_upload_endpoint():
         traceback.print_exc(file=sys.stderr)
         return jsonify({"status": "error", "message": f"Internal server error in API: {str(e)}"}), 500 
 
+# ==============================================================================
+# Batch endpoint for Student Answer Script Processing (exam-day spikes):
+# many studentUploadIds in one request share the Mongo/Groq clients and one OCR executor.
+# ==============================================================================
+@app.route('/process-student-uploads', methods=['POST'])
+def process_student_uploads_endpoint():
+    print("Python (python_api): Received request for /process-student-uploads", file=sys.stderr)
+    try:
+        data = request.get_json()
+        if not data:
+            print("Python Error (python_api): No JSON data received for /process-student-uploads.", file=sys.stderr)
+            return jsonify({"status": "error", "message": "Request body must be JSON."}), 400
+
+        student_upload_ids = data.get('studentUploadIds')
+
+        if not isinstance(student_upload_ids, list) or not student_upload_ids \
+                or not all(isinstance(i, str) and i for i in student_upload_ids):
+            print("Python Error (python_api): studentUploadIds is missing or invalid in /process-student-uploads request.", file=sys.stderr)
+            return jsonify({"status": "error", "message": "studentUploadIds must be a non-empty list of IDs."}), 400
+
+        # Set CWD for Answer_Generator.py (Student class) if it relies on relative paths from project root
+        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        original_cwd = os.getcwd()
+        os.chdir(project_root)
+        print(f"Python (python_api): CWD for process_student_uploads set to: {os.getcwd()}", file=sys.stderr)
+
+        try:
+            results = process_student_uploads(student_upload_ids)
+        except Exception as e_process:
+            print(f"Python Error (python_api): Error during process_student_uploads() for {len(student_upload_ids)} ID(s): {e_process}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            results = {upload_id: "failed" for upload_id in student_upload_ids}
+        finally:
+            os.chdir(original_cwd)
+            print(f"Python (python_api): CWD for process_student_uploads restored to: {os.getcwd()}", file=sys.stderr)
+
+        ok = sum(status in ("completed", "already_extracted") for status in results.values())
+        message = f"{ok} of {len(results)} student script(s) processed successfully."
+        if ok == len(results):
+            print(f"Python (python_api): Successfully processed {ok} student upload ID(s).")
+            return jsonify({"status": "success", "message": message, "results": results}), 200
+        print(f"Python Error (python_api): {len(results) - ok} of {len(results)} student upload ID(s) failed: {results}", file=sys.stderr)
+        # 200 when some succeeded: the per-ID results say which ones to retry.
+        return jsonify({"status": "partial" if ok else "failed", "message": message, "results": results}), 200 if ok else 500
+
+    except Exception as e: # Catch any other unexpected errors in the endpoint logic
+        print(f"Python CRITICAL Error (python_api): Unexpected error in /process-student-uploads: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({"status": "error", "message": f"Internal server error in API: {str(e)}"}), 500
+
 # ==============================================================================
 # NEW ENDPOINT for Professor-Uploaded Scripts Processing
 # ==============================================================================
+def parse_flag(value):
+    """JSON boolean, or "true"/"1"/"yes" / "false"/"0"/"no" (any case); None for anything else."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("true", "1", "yes"):
+            return True
+        if value in ("false", "0", "no", ""):
+            return False
+    return None
+
 @app.route('/process-professor-scripts', methods=['POST'])
 def process_professor_scripts_endpoint():
     print("Python (python_api): Received request for /process-professor-scripts", file=sys.stderr)
@@ -105,10 +172,14 @@ def process_professor_scripts_endpoint():
             return jsonify({"status": "error", "message": "Request body must be JSON."}), 400
 
         professor_upload_id = data.get('professorUploadId') 
+        resume = parse_flag(data.get('resume', False)) # Keep students/checkpoints of an interrupted run for this ID
 
         if not professor_upload_id:
             print("Python Error (python_api): professorUploadId is missing from /process-professor-scripts request.", file=sys.stderr)
             return jsonify({"status": "error", "message": "professorUploadId is required."}), 400
+        if resume is None:
+            print(f"Python Error (python_api): Invalid 'resume' value {data.get('resume')!r} in /process-professor-scripts request.", file=sys.stderr)
+            return jsonify({"status": "error", "message": "resume must be a boolean (true/false)."}), 400
 
         # Set CWD for studentScripts.py (ProfessorUploadHandler) if it relies on relative paths
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -121,7 +192,7 @@ def process_professor_scripts_endpoint():
         api_call_successful = False
         try:
             # Ensure ProfessorUploadHandler.__init__ is adapted to take professor_upload_id
-            handler = ProfessorUploadHandler(professor_upload_id=professor_upload_id)
+            handler = ProfessorUploadHandler(professor_upload_id=professor_upload_id, resume=resume)
             handler.run() 
             api_call_successful = True # If run() completes without raising an error caught here
             print(f"Python (python_api): ProfessorUploadHandler.run() completed for ID {professor_upload_id}")
@@ -147,6 +218,13 @@ def process_professor_scripts_endpoint():
         traceback.print_exc(file=sys.stderr)
         return jsonify({"status": "error", "message": f"Internal server error in API: {str(e)}"}), 500
 
+# ==============================================================================
+# Prometheus scrape endpoint (timings of OCR, roll extraction, LLM calls, ...)
+# ==============================================================================
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
 # ==============================================================================
 # Main execution block for Flask app
 # ==============================================================================
@@ -1,9 +1,9 @@
-import fitz  # PyMuPDF library for PDF processing
-import pytesseract  # Python wrapper for Google's Tesseract-OCR
-from PIL import Image  # Python Imaging Library for image manipulation
+# PyMuPDF (fitz), pytesseract/PIL and llm_gateway (groq, httpx) are imported where
+# they are first needed, so `--help` and argument errors return without loading them.
 import io  # For handling in-memory binary streams (image data)
 import os  # For interacting with the operating system
-from groq import Groq  # Groq API client
+import argparse  # For the command-line interface
+import metrics  # Stage timers; the summary goes to stderr (this runs as a subprocess)
 from dotenv import load_dotenv
 import json  # For JSON serialization and deserialization
 import sys  # For system-specific parameters and functions
@@ -21,33 +21,41 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # Priority: 1. TESSERACT_CMD_PATH from .env file
 #           2. Platform-specific common paths (add as needed)
 #           3. Hardcoded Windows path (as a last resort for development)
-tesseract_cmd_path_from_env = os.getenv("TESSERACT_CMD_PATH")
-if tesseract_cmd_path_from_env:
-    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path_from_env
-    print(f"Python: Using Tesseract from TESSERACT_CMD_PATH: {tesseract_cmd_path_from_env}", file=sys.stderr)
-else:
-    # Platform-specific configuration (expand as needed)
-    if sys.platform.startswith('win32'):
-        # Common Windows path
-        default_windows_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        if os.path.exists(default_windows_path):
-            pytesseract.pytesseract.tesseract_cmd = default_windows_path
-            print(f"Python: Using Tesseract from default Windows path: {default_windows_path}", file=sys.stderr)
-        else:
-            print("Python WARNING: Tesseract OCR executable path not found at C:\\Program Files\\Tesseract-OCR\\tesseract.exe and TESSERACT_CMD_PATH not set. OCR might fail.", file=sys.stderr)
-    elif sys.platform.startswith('darwin'): # macOS
-        # Example for Homebrew on Apple Silicon
-        # default_mac_path = r'/opt/homebrew/bin/tesseract'
-        # if os.path.exists(default_mac_path):
-        #     pytesseract.pytesseract.tesseract_cmd = default_mac_path
-        pass # Add macOS specific paths if needed
-    elif sys.platform.startswith('linux'):
-        # Example for Linux
-        # default_linux_path = r'/usr/bin/tesseract'
-        # if os.path.exists(default_linux_path):
-        #     pytesseract.pytesseract.tesseract_cmd = default_linux_path
-        pass # Add Linux specific paths if needed
-    # If no specific path is found/set, pytesseract might still find it if it's in system PATH.
+_tesseract_configured = False
+
+def configure_tesseract(pytesseract) -> None:
+    """Points pytesseract at the Tesseract executable (once, on first OCR)."""
+    global _tesseract_configured
+    if _tesseract_configured:
+        return
+    _tesseract_configured = True
+    tesseract_cmd_path_from_env = os.getenv("TESSERACT_CMD_PATH")
+    if tesseract_cmd_path_from_env:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path_from_env
+        print(f"Python: Using Tesseract from TESSERACT_CMD_PATH: {tesseract_cmd_path_from_env}", file=sys.stderr)
+    else:
+        # Platform-specific configuration (expand as needed)
+        if sys.platform.startswith('win32'):
+            # Common Windows path
+            default_windows_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+            if os.path.exists(default_windows_path):
+                pytesseract.pytesseract.tesseract_cmd = default_windows_path
+                print(f"Python: Using Tesseract from default Windows path: {default_windows_path}", file=sys.stderr)
+            else:
+                print("Python WARNING: Tesseract OCR executable path not found at C:\\Program Files\\Tesseract-OCR\\tesseract.exe and TESSERACT_CMD_PATH not set. OCR might fail.", file=sys.stderr)
+        elif sys.platform.startswith('darwin'): # macOS
+            # Example for Homebrew on Apple Silicon
+            # default_mac_path = r'/opt/homebrew/bin/tesseract'
+            # if os.path.exists(default_mac_path):
+            #     pytesseract.pytesseract.tesseract_cmd = default_mac_path
+            pass # Add macOS specific paths if needed
+        elif sys.platform.startswith('linux'):
+            # Example for Linux
+            # default_linux_path = r'/usr/bin/tesseract'
+            # if os.path.exists(default_linux_path):
+            #     pytesseract.pytesseract.tesseract_cmd = default_linux_path
+            pass # Add Linux specific paths if needed
+        # If no specific path is found/set, pytesseract might still find it if it's in system PATH.
 
 # Define the strict JSON structure prompt for the Groq LLM.
 # This guides the LLM to produce output in the desired format.
@@ -115,6 +123,8 @@ def pdf_ocr_extract(pdf_path):
     Returns:
         str: The concatenated text from all pages, or None if an error occurs.
     """
+    import pytesseract  # Python wrapper for Google's Tesseract-OCR (needed by the except clauses below)
+
     all_text = ""
     try:
         # Resolve the absolute path of the PDF for robustness.
@@ -126,17 +136,24 @@ def pdf_ocr_extract(pdf_path):
             print(f"Python Error: PDF file not found at '{absolute_pdf_path}'. Please check the path passed to the script.", file=sys.stderr)
             return None
 
+        import fitz  # PyMuPDF library for PDF processing
+        from PIL import Image  # Python Imaging Library for image manipulation
+        configure_tesseract(pytesseract)
+
+
         doc = fitz.open(absolute_pdf_path)
         for page_num in range(len(doc)):
             print(f"Python: Processing page {page_num + 1}/{len(doc)} of '{os.path.basename(absolute_pdf_path)}'", file=sys.stderr)
-            page = doc.load_page(page_num)
-            # Increase DPI for better OCR quality
-            pix = page.get_pixmap(dpi=300) 
+            with metrics.timer("pdf_render"):
+                page = doc.load_page(page_num)
+                # Increase DPI for better OCR quality
+                pix = page.get_pixmap(dpi=300) 
 
-            img_data = pix.tobytes("ppm") 
-            image = Image.open(io.BytesIO(img_data))
+                img_data = pix.tobytes("ppm") 
+                image = Image.open(io.BytesIO(img_data))
 
-            text_on_page = pytesseract.image_to_string(image)
+            with metrics.timer("ocr", engine="tesseract"):
+                text_on_page = pytesseract.image_to_string(image)
             all_text += f"\n\n--- Page {page_num + 1} ---\n{text_on_page.strip()}"
         doc.close()
         print(f"Python: OCR completed for {absolute_pdf_path}. Total text length: {len(all_text.strip())}", file=sys.stderr)
@@ -177,7 +194,6 @@ def generate_json_with_groq(api_key, text_content, json_prompt_template):
         print("Python Error: Text content for Groq API is missing or empty.", file=sys.stderr)
         return None
 
-    client = Groq(api_key=api_key)
     messages = [
         {
             "role": "system",
@@ -191,12 +207,14 @@ def generate_json_with_groq(api_key, text_content, json_prompt_template):
 
     try:
         print(f"Python: Sending request to Groq API (using key ending with ...{api_key[-4:] if api_key and len(api_key) > 4 else 'N/A'})...", file=sys.stderr)
-        chat_completion = client.chat.completions.create(
+        import llm_gateway  # Shared Groq client pool, retries and response cache
+        generated_content = llm_gateway.chat_completion(
+            api_key,
             messages=messages,
             model="llama3-70b-8192", # Or consider making this configurable
             temperature=0.05, 
+            use_cache=True, # Same paper text -> same parse, served from the response cache
         )
-        generated_content = chat_completion.choices[0].message.content
         print("Python: Received response from Groq API.", file=sys.stderr)
         
         cleaned_content = generated_content.strip()
@@ -275,9 +293,13 @@ def main(pdf_input_path):
         sys.exit(1) 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Python Usage Error: python question_parser.py <path_to_question_paper_pdf>", file=sys.stderr)
-        sys.exit(1)
-    
-    pdf_path_from_caller = sys.argv[1]
-    main(pdf_path_from_caller)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="OCR a question paper PDF and print its questions as JSON on stdout.")
+    parser.add_argument("pdf_path", help="Path to the question paper PDF.")
+    cli_args = parser.parse_args()
+
+    pdf_path_from_caller = cli_args.pdf_path
+    with metrics.job("questionParser") as job_metrics:
+        try:
+            main(pdf_path_from_caller)
+        finally:
+            print(f"Python: Metrics summary: {json.dumps(job_metrics.summary(), default=str)}", file=sys.stderr)
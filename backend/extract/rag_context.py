@@ -0,0 +1,95 @@
+"""
+rag_context.py
+
+Builds the book context for Answer_from_book's LLM prompts from FAISS hits.
+
+Retrieved chunks overlap: neighbouring line windows share most of their lines,
+and book_chunker chunks repeat trailing sentences of the chunk before them.
+`assemble_context` therefore:
+
+  • takes hits best-first and stops at `token_budget` (estimated LLM tokens) or
+    `max_chunks`; a single hit larger than the budget is cut to fit
+  • orders the chosen chunks by position in the book and merges each one into
+    the previous span when the two overlap (a shared run of words at the end of
+    one and the start of the next), so repeated text is sent once
+  • returns the spans joined with the usual separator, plus token statistics
+"""
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import metrics
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Shorter shared runs are treated as coincidence, not overlap.
+MIN_OVERLAP_WORDS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token for English prose)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+def _split_heading(text: str) -> Tuple[str, str]:
+    first, sep, rest = text.partition("\n")
+    return (first, rest) if sep else ("", text)
+
+
+def merge_overlapping(a: str, b: str, min_overlap_words: int = MIN_OVERLAP_WORDS) -> Union[str, None]:
+    """`a` + the part of `b` not already at the end of `a`, or None if they do not overlap."""
+    a_heading, a_body = _split_heading(a)
+    b_heading, b_body = _split_heading(b)
+    if not (a_heading and a_heading == b_heading):
+        # Only identical section headings are skipped; otherwise compare the full texts.
+        a_body, b_body = a, b
+    a_words, b_words = a_body.split(), b_body.split()
+    for k in range(min(len(a_words), len(b_words)), min_overlap_words - 1, -1):
+        if a_words[-k:] == b_words[:k]:
+            remainder = " ".join(b_words[k:])
+            return f"{a} {remainder}" if remainder else a
+    return None
+
+
+def _merge_spans(chunks: List[Tuple[int, str]]) -> List[str]:
+    spans: List[str] = []
+    for _, text in sorted(chunks):
+        merged = merge_overlapping(spans[-1], text) if spans else None
+        if merged is None:
+            spans.append(text)
+        else:
+            spans[-1] = merged
+    return spans
+
+
+def _cut_to_tokens(text: str, token_budget: int) -> str:
+    cut = text[: token_budget * 4]
+    return cut.rsplit(" ", 1)[0] if " " in cut else cut
+
+
+def assemble_context(
+    hits: Sequence[Tuple[int, float]], paragraphs: List[str], token_budget: int, max_chunks: int
+) -> Dict[str, Any]:
+    """
+    hits: (paragraph index, similarity) best-first. Returns
+    {"text", "tokens", "rawTokens", "chunks", "spans"}; text is "" when nothing qualified.
+    """
+    chosen: List[Tuple[int, str]] = []
+    spans: List[str] = []
+    for idx, _score in hits:
+        if len(chosen) >= max_chunks:
+            break
+        if not (0 <= idx < len(paragraphs)) or any(idx == c for c, _ in chosen):
+            continue
+        candidate = chosen + [(int(idx), paragraphs[idx])]
+        candidate_spans = _merge_spans(candidate)
+        if estimate_tokens(CONTEXT_SEPARATOR.join(candidate_spans)) <= token_budget:
+            chosen, spans = candidate, candidate_spans
+        elif not chosen:
+            # The best hit alone is over budget: keep its head rather than send no context.
+            chosen, spans = candidate, [_cut_to_tokens(paragraphs[idx], token_budget)]
+            break
+
+    text = CONTEXT_SEPARATOR.join(spans)
+    tokens = estimate_tokens(text)
+    raw_tokens = sum(estimate_tokens(t) for _, t in chosen)
+    metrics.increment("rag_context_tokens", tokens)
+    metrics.increment("rag_context_tokens_saved", max(0, raw_tokens - tokens))
+    return {"text": text, "tokens": tokens, "rawTokens": raw_tokens, "chunks": len(chosen), "spans": len(spans)}
@@ -1,6 +1,3 @@
-
-
-
 """
 professor_upload_handler.py (now studentScripts.py)
 
@@ -8,23 +5,117 @@ Handles BOTH professor upload modes:
 1. One combined PDF for the whole class.
 2. Multiple PDFs (one per student).
 
-Updates the SAME document in `professoruploads`
-to include a `students` array in the exact schema you requested.
+Each student's extracted answers are written, as soon as that student is
+finished, to the `professorstudentanswers` collection (one document per
+(professorUploadId, roll_no)). A second script or chunk read with the same roll
+number (misread header, duplicate upload) never replaces the first: it is kept
+in that document's `duplicates` list, flagged with `rollCollision`, and counted
+in the upload's `studentRollCollisions`. The `professoruploads` document itself
+only gets a summary (count + processedAt), so it stays small for large classes.
+Page OCR text and roll numbers are checkpointed in `professorscriptcheckpoints`
+while a run is in progress. They are deleted once a run stores every script /
+chunk; a run that fails or skips some keeps them, so a run with resume=True
+(API `"resume": true`, CLI --resume) keeps the students already stored and
+re-OCRs only pages with no checkpoint. Checkpoints nobody resumes expire
+CHECKPOINT_TTL_HOURS after their last write (Mongo TTL index).
+A combined PDF is streamed through render → split → OCR/segment stages
+(threads joined by bounded queues), so the first students are stored while
+later pages are still being rendered.
 Can be initialized with a specific professor_upload_id for targeted processing.
 """
 
 import os
+import queue
+import threading
+import contextvars
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict, Union
+from typing import Iterator, List, Dict, Union
 import time
 import argparse # For CLI argument parsing
 
-from pdf2image import convert_from_path
-from pymongo.errors import PyMongoError
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from bson.objectid import ObjectId # <-- IMPORT THIS
 
 # 👉 Your existing student-side implementation
 from Answer_Generator import Student   # must be import-able
+import image_prep
+import metrics
+
+# One document per (professorUploadId, roll_no); read back by Combined_Results.py
+STUDENT_ANSWERS_COLLECTION_NAME = "professorstudentanswers"
+# One document per (professorUploadId, script, page): page OCR text / roll number, for resumed runs.
+CHECKPOINTS_COLLECTION_NAME = "professorscriptcheckpoints"
+# Checkpoints left by a run whose process died are removed by Mongo this long after their last write.
+CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "72"))
+# How the combined-PDF pipeline finds the first page of each student in a combined PDF:
+# "tesseract" = local OCR of the top band of each page (no API calls); "vision" = Groq OCR of every page.
+SPLIT_CLASSIFIER = os.getenv("SPLIT_CLASSIFIER", "tesseract").strip().lower()
+# Fraction of the page height (from the top) read by the local classifier.
+SPLIT_HEADER_BAND = float(os.getenv("SPLIT_HEADER_BAND", "0.4"))
+
+# Combined-PDF pipeline: pages rendered per pdftoppm call, and pages / student chunks buffered
+# between stages (bounds the rendered images held in memory).
+RENDER_BATCH_PAGES = int(os.getenv("RENDER_BATCH_PAGES", "4"))
+PIPELINE_QUEUE_PAGES = int(os.getenv("PIPELINE_QUEUE_PAGES", "8"))
+PIPELINE_QUEUE_CHUNKS = int(os.getenv("PIPELINE_QUEUE_CHUNKS", "2"))
+# Many per-student PDFs: scripts processed at once, concurrent vision OCR calls shared by all of
+# them (still under the _CALL_LIMIT per _WINDOW_SEC limiter), and pdftoppm processes per PDF.
+SCRIPT_WORKERS = int(os.getenv("SCRIPT_WORKERS", "4"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "4"))
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "2"))
+
+_DONE = object()  # end of stream between pipeline stages
+_QUEUE_POLL_SEC = 0.2
+
+_pytesseract = None  # module once configured; False when Tesseract is unavailable
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up (False) once `stop` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_QUEUE_POLL_SEC)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q: queue.Queue, stop: threading.Event):
+    """Items of `q` until the _DONE marker (or `stop`)."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=_QUEUE_POLL_SEC)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def local_header_text(img) -> Union[str, None]:
+    """Tesseract text of the top SPLIT_HEADER_BAND of a page, or None if Tesseract is unavailable."""
+    global _pytesseract
+    if _pytesseract is None:
+        try:
+            import pytesseract
+            from question_parser import configure_tesseract
+            configure_tesseract(pytesseract)
+            pytesseract.get_tesseract_version()
+            _pytesseract = pytesseract
+        except Exception as e:
+            print(f"Python WARNING (ProfessorUploadHandler): Tesseract not available ({e}); splitting with vision OCR.")
+            _pytesseract = False
+    if _pytesseract is False:
+        return None
+    # No deskew: Tesseract copes with small rotations and the keyword match is forgiving.
+    band = image_prep.crop_header(image_prep.to_grayscale(img), SPLIT_HEADER_BAND)
+    with metrics.timer("ocr", engine="tesseract"):
+        return _pytesseract.image_to_string(band)
 
 def natural_sort_key(s: str) -> List[Union[int, str]]:
     """Helper for sorting strings with numbers in a natural order."""
@@ -43,15 +134,32 @@ class ProfessorUploadHandler(Student):
 
     # ─────────────────────── set-up ─────────────────────── #
 
-    def __init__(self, professor_upload_id: str | None = None): # <-- MODIFIED
+    def __init__(self, professor_upload_id: str | None = None, resume: bool = False): # <-- MODIFIED
         # Initialise Mongo + Groq clients from Student
         # The Student class's initialize_clients() sets up self.db
         self.initialize_clients()
 
         self._window_start = time.time()
         self._call_count = 0
+        self._throttle_lock = threading.Lock()
+        self._ocr_pool: Union[ThreadPoolExecutor, None] = None  # set while many PDFs are processed
+        # resume=True keeps the students and checkpoints of a previous (interrupted) run for this upload.
+        self.resume = resume
+        self._checkpoints: Dict = {}     # (script, page) -> saved {"text", "roll_no", "header_page"}
+        self._done_sources: set = set()  # (script, first page) of students already stored
+        self._skipped_units = 0          # scripts / chunks that failed in this run
+        self._roll_collisions = 0        # scripts / chunks whose roll number was already stored
 
         self.prof_col = self.db["professoruploads"] # self.db comes from Student.initialize_clients
+        self.answers_col = self.db[STUDENT_ANSWERS_COLLECTION_NAME]
+        self.answers_col.create_index(
+            [("professorUploadId", ASCENDING), ("roll_no", ASCENDING)], unique=True
+        )
+        self.checkpoints_col = self.db[CHECKPOINTS_COLLECTION_NAME]
+        self.checkpoints_col.create_index(
+            [("professorUploadId", ASCENDING), ("script", ASCENDING), ("page", ASCENDING)], unique=True
+        )
+        self._ensure_checkpoint_ttl()
 
         if professor_upload_id:
             print(f"Python (ProfessorUploadHandler): Initializing with specific ID: {professor_upload_id}")
@@ -74,7 +182,10 @@ class ProfessorUploadHandler(Student):
 
         # Assuming paths are stored relative to project root, and CWD will be set to project root by API.
         # os.path.abspath() will then resolve them correctly from that CWD.
-        self.script_paths = [os.path.abspath(p.replace("\\", "/")) for p in raw_paths]
+        script_keys = [p.replace("\\", "/") for p in raw_paths]
+        self.script_paths = [os.path.abspath(p) for p in script_keys]
+        # Checkpoints and stored students name their script as stored in the document.
+        self._script_keys = dict(zip(self.script_paths, script_keys))
         if not self.script_paths and isinstance(raw_paths, list): # If raw_paths was an empty list
              print(f"Python (ProfessorUploadHandler): Warning - studentScriptPaths is an empty list for doc {self.prof_doc['_id']}. No scripts to process.")
              # Depending on desired behavior, you might raise an error or allow proceeding
@@ -97,23 +208,55 @@ class ProfessorUploadHandler(Student):
             ]
             raise ValueError(f"Exam metadata incomplete in doc {self.prof_doc['_id']}. Missing: {missing_fields}")
 
+    def _ensure_checkpoint_ttl(self) -> None:
+        """TTL index on checkpoints' updatedAt; a changed CHECKPOINT_TTL_HOURS updates the existing index."""
+        ttl = int(CHECKPOINT_TTL_HOURS * 3600)
+        try:
+            self.checkpoints_col.create_index("updatedAt", expireAfterSeconds=ttl)
+            return
+        except OperationFailure as e:
+            if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict: exists with other options
+                print(f"Python (ProfessorUploadHandler): ⚠ could not create the checkpoint TTL index: {e}")
+                return
+        try:
+            self.db.command("collMod", CHECKPOINTS_COLLECTION_NAME,
+                            index={"keyPattern": {"updatedAt": 1}, "expireAfterSeconds": ttl})
+        except OperationFailure:
+            # collMod cannot turn a plain index into a TTL one on older servers; rebuild it.
+            try:
+                self.checkpoints_col.drop_index("updatedAt_1")
+                self.checkpoints_col.create_index("updatedAt", expireAfterSeconds=ttl)
+            except PyMongoError as e:
+                print(f"Python (ProfessorUploadHandler): ⚠ could not update the checkpoint TTL index: {e}")
+                return
+        print(f"Python (ProfessorUploadHandler): Checkpoint TTL index set to {CHECKPOINT_TTL_HOURS:g}h.")
+
     # ─────────────────────── helpers ─────────────────────── #
 
-    def extract_text_from_image(self, img, *args, **kwargs): # Content is identical to original
-        now = time.time()
-        if now - self._window_start >= self._WINDOW_SEC:
-            self._window_start = now
-            self._call_count   = 0
-        if self._call_count >= self._CALL_LIMIT:
-            wait = self._WINDOW_SEC - (now - self._window_start)
-            if wait > 0:
-                print(f"Groq API limit reached — sleeping {wait:.1f}s")
-                time.sleep(wait)
-            self._window_start = time.time()
-            self._call_count   = 0
-        self._call_count += 1
+    def _throttle(self) -> None:
+        """Client-side limit of _CALL_LIMIT vision calls per _WINDOW_SEC (shared by the pipeline threads)."""
+        with self._throttle_lock:
+            now = time.time()
+            if now - self._window_start >= self._WINDOW_SEC:
+                self._window_start = now
+                self._call_count   = 0
+            if self._call_count >= self._CALL_LIMIT:
+                wait = self._WINDOW_SEC - (now - self._window_start)
+                if wait > 0:
+                    print(f"Groq API limit reached — sleeping {wait:.1f}s")
+                    time.sleep(wait)
+                self._window_start = time.time()
+                self._call_count   = 0
+            self._call_count += 1
+
+    def extract_text_from_image(self, img, *args, **kwargs):
+        self._throttle()
         return super().extract_text_from_image(img, *args, **kwargs)
 
+    def extract_header(self, img, *args, **kwargs):
+        self._throttle()
+        return super().extract_header(img, *args, **kwargs)
+
     def _answers_schema(self, answers_raw: List[Dict]) -> List[Dict]: # Content is identical to original
         """Map Student.segment_answers → requested keys."""
         return [
@@ -124,21 +267,173 @@ class ProfessorUploadHandler(Student):
             for a in answers_raw
         ]
 
-    def _split_chunks(self, images: List) -> List[List]: # Content is identical to original
-        """Split combined script into per-student page lists."""
-        chunks, cur = [], []
-        for img_idx, img in enumerate(images): # Added index for logging
-            print(f"Python (ProfessorUploadHandler): Splitting chunks, processing image {img_idx + 1}/{len(images)}")
-            txt = self.extract_text_from_image(img)
-            if self.is_first_page(txt):
-                if cur:
-                    chunks.append(cur)
-                cur = [img]
-            else:
-                cur.append(img)
-        if cur:
-            chunks.append(cur)
-        return chunks
+    def _persist_student(self, student_data: Dict) -> bool:
+        """
+        Stores one student's answers in the per-student answers collection. Returns False when the
+        roll number already belongs to another script / chunk of this upload: the earlier student is
+        kept, and this one is added to its `duplicates` with `rollCollision` set, for manual review.
+        """
+        answers = student_data.get("answers") or []
+        answers.sort(key=lambda x: natural_sort_key(x.get("question_no", "0")))
+        source = student_data.get("source")  # {script, firstPage, pages}: what a resumed run skips
+        key = {"professorUploadId": self.prof_doc["_id"], "roll_no": student_data["roll_no"]}
+        fields = {"answers": answers, "answerCount": len(answers), "source": source, "updatedAt": datetime.utcnow()}
+        try:
+            self.answers_col.insert_one({**key, **fields})
+            return True
+        except DuplicateKeyError:
+            existing = self.answers_col.find_one(key, {"source": 1}) or {}
+        if source is not None and existing.get("source") == source:
+            # The same script / chunk again (e.g. retried): replacing it loses nothing.
+            self.answers_col.update_one(key, {"$set": fields})
+            return True
+        fields["detectedAt"] = fields.pop("updatedAt")
+        self.answers_col.update_one(key, {"$set": {"rollCollision": True}, "$push": {"duplicates": fields}})
+        self._roll_collisions += 1
+        metrics.increment("roll_collisions")
+        first = existing.get("source") or {}
+        print(f"Python (ProfessorUploadHandler):   ⚠ roll number {student_data['roll_no']} already stored from "
+              f"{os.path.basename(str(first.get('script')))} (page {first.get('firstPage')}); kept both, the new one "
+              f"({os.path.basename(str((source or {}).get('script')))}, page {(source or {}).get('firstPage')}) under 'duplicates'.")
+        return False
+
+    # ─────────────────────── checkpoints ─────────────────────── #
+
+    def _script_key(self, pdf_path: str) -> str:
+        return self._script_keys.get(pdf_path, pdf_path)
+
+    def _load_checkpoints(self) -> None:
+        """On resume: the students already stored and the page checkpoints of the previous run."""
+        upload_id = self.prof_doc["_id"]
+        for doc in self.checkpoints_col.find({"professorUploadId": upload_id}):
+            self._checkpoints[(doc["script"], doc["page"])] = doc
+        for doc in self.answers_col.find({"professorUploadId": upload_id}, {"source": 1, "duplicates.source": 1}):
+            for source in [doc.get("source")] + [d.get("source") for d in doc.get("duplicates", [])]:
+                if source:
+                    self._done_sources.add((source["script"], source["firstPage"]))
+        print(f"Python (ProfessorUploadHandler): Resuming doc {upload_id}: {len(self._done_sources)} students already stored, "
+              f"{len(self._checkpoints)} page checkpoints.")
+
+    def _save_checkpoint(self, pdf_path: str, page_no: int, **fields) -> None:
+        try:
+            self.checkpoints_col.update_one(
+                {"professorUploadId": self.prof_doc["_id"], "script": self._script_key(pdf_path), "page": page_no},
+                {"$set": {**fields, "updatedAt": datetime.utcnow()}},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            # A lost checkpoint only means this page is OCR'd again on resume.
+            print(f"Python (ProfessorUploadHandler): ⚠ checkpoint write failed for page {page_no} of {os.path.basename(pdf_path)}: {e}")
+
+    def _saved(self, pdf_path: str, page_no: int, field: str):
+        value = self._checkpoints.get((self._script_key(pdf_path), page_no), {}).get(field)
+        if value is not None:
+            metrics.increment("checkpoint_reused", field=field)
+        return value
+
+    def _checkpointed_ocr(self, pdf_path: str, page_no: int, img) -> str:
+        text = self._saved(pdf_path, page_no, "text")
+        if text is None:
+            text = self.extract_text_from_image(img)
+            self._save_checkpoint(pdf_path, page_no, text=text)
+        return text
+
+    def _checkpointed_roll(self, pdf_path: str, page_no: int, img, header: Union[Dict, None] = None) -> str:
+        roll_no = self._saved(pdf_path, page_no, "roll_no")
+        if roll_no is None:
+            roll_no = self.roll_number_for_page(img, header)
+            self._save_checkpoint(pdf_path, page_no, roll_no=roll_no)
+        return roll_no
+
+    def _classify_page(self, pdf_path: str, page_no: int, img, use_local: bool, first_in_pdf: bool):
+        """
+        (is first page, vision text or None, use_local for the following pages).
+        The local classifier is dropped for the rest of the PDF when Tesseract is missing or it does
+        not recognise the PDF's first page, which a combined PDF always starts with.
+        """
+        if use_local:
+            band_text = local_header_text(img)
+            if band_text is not None and (self.is_first_page(band_text) or not first_in_pdf):
+                metrics.increment("split_pages_local")
+                return self.is_first_page(band_text), None, True
+            if band_text is not None:
+                print("Python (ProfessorUploadHandler): Local classifier did not recognise page 1 as a first page; classifying with vision OCR.")
+        text = self._checkpointed_ocr(pdf_path, page_no, img)
+        return self.is_first_page(text), text, False
+
+    # ─────────────────────── combined-PDF pipeline stages ─────────────────────── #
+
+    def _render_stage(self, pdf_path: str, out_q: queue.Queue, stop: threading.Event) -> None:
+        """Renders the PDF RENDER_BATCH_PAGES at a time; emits (page number, image)."""
+        total = int(pdfinfo_from_path(pdf_path)["Pages"])
+        if not total:
+            raise RuntimeError(f"PDF-to-image failed: {pdf_path}")
+        print(f"Python (ProfessorUploadHandler): Combined PDF has {total} pages.")
+        for first in range(1, total + 1, RENDER_BATCH_PAGES):
+            last = min(first + RENDER_BATCH_PAGES - 1, total)
+            with metrics.timer("pdf_render"):
+                pages = convert_from_path(pdf_path, first_page=first, last_page=last)
+            metrics.increment("pages_rendered", len(pages))
+            for offset, img in enumerate(pages):
+                if not _put(out_q, (first + offset, img), stop):
+                    return
+
+    def _boundary_stage(self, pdf_path: str, in_q: queue.Queue, out_q: queue.Queue, stop: threading.Event, errors: List) -> None:
+        """Classifies pages; emits each student's [(page number, image, text or None)] when the next one starts."""
+        use_local = SPLIT_CLASSIFIER == "tesseract"
+        cur: List = []
+        seen_pages = 0
+        for page_no, img in _drain(in_q, stop):
+            is_first, text, use_local = self._classify_page(pdf_path, page_no, img, use_local, first_in_pdf=seen_pages == 0)
+            seen_pages += 1
+            if is_first and cur:
+                if not _put(out_q, cur, stop):
+                    return
+                cur = []
+            cur.append((page_no, img, text))
+        if cur and errors:
+            # Rendering stopped early: the open chunk may be missing pages.
+            print(f"Python (ProfessorUploadHandler):   ⚠ dropped the last chunk (pages {cur[0][0]}-{cur[-1][0]}) after an upstream error")
+        elif cur:
+            _put(out_q, cur, stop)
+
+    def _student_stage(self, pdf_path: str, in_q: queue.Queue, out_q: queue.Queue, stop: threading.Event) -> None:
+        """Roll number + OCR + segmentation per chunk; emits {roll_no, answers, pages, source}, {error, pages} or {skipped, pages}."""
+        for chunk in _drain(in_q, stop):
+            first_page, pages = chunk[0][0], f"{chunk[0][0]}-{chunk[-1][0]}"
+            if (self._script_key(pdf_path), first_page) in self._done_sources:
+                if not _put(out_q, {"skipped": True, "pages": pages}, stop):
+                    return
+                continue
+            try:
+                roll_no = self._checkpointed_roll(pdf_path, first_page, chunk[0][1])
+                if len(chunk) > 1:
+                    # Pages the vision classifier already read are not OCR'd again; each page is
+                    # segmented as soon as it is read.
+                    page_texts = (
+                        text if text is not None else self._checkpointed_ocr(pdf_path, page_no, img)
+                        for page_no, img, text in chunk[1:]
+                    )
+                    answers = self._answers_schema(self.segment_pages(page_texts)) # This might raise ValueError
+                else:
+                    answers = []
+                result = {"roll_no": roll_no, "answers": answers, "pages": pages,
+                          "source": {"script": self._script_key(pdf_path), "firstPage": first_page, "pages": pages}}
+            except ValueError as ve: # Catch specific errors from segment_answers or roll_number
+                result = {"error": f"ValueError: {ve}", "pages": pages}
+            except Exception as e:
+                result = {"error": f"unexpected error: {e}", "pages": pages}
+            if not _put(out_q, result, stop):
+                return
+
+    def _run_stage(self, name: str, fn, args: tuple, out_q: queue.Queue, stop: threading.Event, errors: List) -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Python (ProfessorUploadHandler): ⛔ {name} stage failed: {e}")
+            errors.append(e)
+        finally:
+            _put(out_q, _DONE, stop)  # downstream stages finish what they already have
 
     # ─────────────────────── processing paths ─────────────────────── #
 
@@ -148,122 +443,215 @@ class ProfessorUploadHandler(Student):
         # Ensure Poppler is configured if convert_from_path needs it explicitly on your system
         # poppler_path = r"C:\path\to\poppler\bin" # Example, if needed
         # images = convert_from_path(pdf_path, poppler_path=poppler_path)
-        images = convert_from_path(pdf_path)
+        with metrics.timer("pdf_render"):
+            images = convert_from_path(pdf_path, thread_count=RENDER_PROCESSES)
+        metrics.increment("pages_rendered", len(images))
         if not images:
             raise RuntimeError(f"PDF-to-image failed: {pdf_path}")
 
-        txt_first = self.extract_text_from_image(images[0])
-        if self.is_first_page(txt_first):
-            roll_no = self.extract_roll_number(images[0])
-            answer_pages = images[1:] if len(images) > 1 else []
-        else:
-            roll_no = self.extract_roll_number(images[0])
-            answer_pages = images
+        txt_first, is_header = self._saved(pdf_path, 1, "text"), self._saved(pdf_path, 1, "header_page")
+        header = None
+        if txt_first is None or is_header is None:
+            txt_first, header = self.read_page(images[0], want_header=True)
+            is_header = self.is_header_page(txt_first, header)
+            self._save_checkpoint(pdf_path, 1, text=txt_first, header_page=is_header)
+        roll_no = self._checkpointed_roll(pdf_path, 1, images[0], header)
+        numbered = list(enumerate(images, start=1))
+        answer_pages = numbered[1:] if is_header else numbered
 
         if not answer_pages: # Handle case where only a header page exists
              print(f"Python (ProfessorUploadHandler): Warning - No answer pages found for {roll_no} in {pdf_path} (only header or empty).")
              answers = []
         else:
-            combined = "\n".join(self.extract_text_from_image(p) for p in answer_pages)
-            answers_raw = self.segment_answers(combined) # This might raise ValueError if no markers
+            texts = self._ocr_pages(pdf_path, [(n, img) for n, img in answer_pages if n != 1])
+            if not is_header:
+                texts = itertools.chain([txt_first], texts)  # page 1 is an answer page and was already read
+            answers_raw = self.segment_pages(texts) # This might raise ValueError if no markers
             answers     = self._answers_schema(answers_raw)
 
-        return {"roll_no": roll_no, "answers": answers}
-
-    def _process_combined_pdf(self, pdf_path: str) -> List[Dict]: # Content is mostly identical
-        """Split combined script & return students list."""
+        return {"roll_no": roll_no, "answers": answers,
+                "source": {"script": self._script_key(pdf_path), "firstPage": 1, "pages": f"1-{len(images)}"}}
+
+    def _ocr_pages(self, pdf_path: str, pages: List) -> Iterator[str]:
+        """
+        Checkpointed vision OCR of (page number, image) pairs, yielded in order as soon as each is
+        read; on the shared OCR executor (all pages submitted at once) when one is running.
+        """
+        if self._ocr_pool is None:
+            for n, img in pages:
+                yield self._checkpointed_ocr(pdf_path, n, img)
+            return
+        futures = [self._ocr_pool.submit(contextvars.copy_context().run, self._checkpointed_ocr, pdf_path, n, img)
+                   for n, img in pages]
+        for f in futures:
+            yield f.result()
+
+    def _process_many_pdfs(self, pdf_paths: List[str]) -> int:
+        """
+        Processes up to SCRIPT_WORKERS per-student PDFs at once; their answer pages share one OCR
+        executor of OCR_WORKERS threads behind the handler's rate limiter. Each student is stored as
+        soon as their script is done; a failing script is skipped as before. Returns the count stored.
+        """
+        stored = 0
+        pending = [p for p in pdf_paths if (self._script_key(p), 1) not in self._done_sources]
+        if len(pending) < len(pdf_paths):
+            print(f"Python (ProfessorUploadHandler): {len(pdf_paths) - len(pending)} script(s) already stored (resume).")
+            metrics.increment("students_resumed", len(pdf_paths) - len(pending))
+        self._ocr_pool = ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix="ocr")
+        scripts = ThreadPoolExecutor(max_workers=max(1, SCRIPT_WORKERS), thread_name_prefix="script")
+        try:
+            futures = {
+                # A copied context per task keeps the metrics on the current job.
+                scripts.submit(contextvars.copy_context().run, self._process_single_pdf, path): (idx, path)
+                for idx, path in enumerate(pdf_paths) if path in pending
+            }
+            for future in as_completed(futures):
+                idx, path = futures[future]
+                try:
+                    student_data = future.result()
+                except Exception as e:
+                    print(f"Python (ProfessorUploadHandler):   ⚠ skipped {os.path.basename(path)}: {e}")
+                    self._skipped_units += 1
+                    continue
+                if not self._persist_student(student_data):  # PyMongoError propagates to the API
+                    continue
+                stored += 1
+                print(f"Python (ProfessorUploadHandler):   ✔ PDF {idx+1}/{len(pdf_paths)} ({os.path.basename(path)}): "
+                      f"{student_data['roll_no']} | answers: {len(student_data['answers'])} [{stored} stored]")
+        finally:
+            # On a failed write, scripts not yet started are cancelled; running ones finish.
+            scripts.shutdown(wait=True, cancel_futures=True)
+            self._ocr_pool.shutdown(wait=True)
+            self._ocr_pool = None
+        return stored
+
+    def _process_combined_pdf(self, pdf_path: str) -> int:
+        """
+        Streams the combined script through render → classify/split → OCR + segment stages (one
+        thread each, bounded queues) and persists every student as soon as their chunk is done.
+        Returns the count stored; students stored before a failure stay stored.
+        """
         print(f"Python (ProfessorUploadHandler): Processing combined PDF: {pdf_path}")
-        # Ensure Poppler is configured if convert_from_path needs it explicitly on your system
-        # poppler_path = r"C:\path\to\poppler\bin" # Example, if needed
-        # images = convert_from_path(pdf_path, poppler_path=poppler_path)
-        images = convert_from_path(pdf_path)
-        if not images:
-            raise RuntimeError(f"PDF-to-image failed: {pdf_path}")
+        stop, errors = threading.Event(), []
+        pages_q = queue.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+        chunks_q = queue.Queue(maxsize=PIPELINE_QUEUE_CHUNKS)
+        results_q = queue.Queue(maxsize=PIPELINE_QUEUE_CHUNKS)
+        stages = [
+            ("render", self._render_stage, (pdf_path, pages_q, stop), pages_q),
+            ("split", self._boundary_stage, (pdf_path, pages_q, chunks_q, stop, errors), chunks_q),
+            ("students", self._student_stage, (pdf_path, chunks_q, results_q, stop), results_q),
+        ]
+        threads = [
+            # Each thread runs in a copy of this context so its metrics count towards the current job.
+            threading.Thread(target=contextvars.copy_context().run, name=f"combined-{name}",
+                             args=(self._run_stage, name, fn, args, out_q, stop, errors), daemon=True)
+            for name, fn, args, out_q in stages
+        ]
+        for t in threads:
+            t.start()
 
-        students = []
-        chunks = self._split_chunks(images)
-        if not chunks:
+        stored = 0
+        try:
+            for result in _drain(results_q, stop):
+                if result.get("skipped"):
+                    print(f"Python (ProfessorUploadHandler): • pages {result['pages']} already stored (resume)")
+                    metrics.increment("students_resumed")
+                    continue
+                if "error" in result:
+                    print(f"Python (ProfessorUploadHandler):   ⚠ skipped chunk (pages {result['pages']}) due to {result['error']}")
+                    self._skipped_units += 1
+                    continue
+                if not self._persist_student(result):  # PyMongoError propagates to the API
+                    continue
+                stored += 1
+                print(f"Python (ProfessorUploadHandler): • {result['roll_no']} | pages: {result['pages']} | answers: {len(result['answers'])}")
+        finally:
+            stop.set()  # unblocks the stages if persisting failed
+            for t in threads:
+                t.join()
+
+        if errors:
+            raise errors[0]
+        if not stored:
             print(f"Python (ProfessorUploadHandler): Warning - No student chunks identified in combined PDF: {pdf_path}")
-            return []
+        return stored
 
-        for i, chunk in enumerate(chunks):
-            print(f"Python (ProfessorUploadHandler): Processing chunk {i+1}/{len(chunks)}")
+    # ─────────────────────── public entry point ─────────────────────── #
+
+    def run(self) -> None:
+        """Main driver — decides mode, stores each student as it finishes & updates the summary."""
+        with metrics.job("professorScripts") as job_metrics:
             try:
-                if not chunk: # Should not happen if _split_chunks is correct
-                    print(f"Python (ProfessorUploadHandler):   ⚠ skipped empty chunk")
-                    continue
-                roll_no = self.extract_roll_number(chunk[0])
-                
-                answer_content_pages = chunk[1:]
-                if not answer_content_pages:
-                    print(f"Python (ProfessorUploadHandler): • {roll_no} | pages: {len(chunk)} | answers: 0 (no content pages after header)")
-                    answers = []
-                else:
-                    combined = "\n".join(
-                        self.extract_text_from_image(p) for p in answer_content_pages
-                    )
-                    answers_raw = self.segment_answers(combined) # This might raise ValueError
-                    answers = self._answers_schema(answers_raw)
-                
-                students.append({"roll_no": roll_no, "answers": answers})
-                print(f"Python (ProfessorUploadHandler): • {roll_no} | pages: {len(chunk)} | answers: {len(answers)}")
-            except ValueError as ve: # Catch specific errors from segment_answers or roll_number
-                 print(f"Python (ProfessorUploadHandler):   ⚠ skipped chunk due to ValueError: {ve}")
-            except Exception as e:
-                print(f"Python (ProfessorUploadHandler):   ⚠ skipped chunk due to unexpected error: {e}")
-                # import traceback # For more detailed debugging if needed
-                # traceback.print_exc()
-        return students
+                self._run(job_metrics)
+            except Exception:
+                metrics.save_job_summary(self.prof_col, {"_id": self.prof_doc["_id"]}, job_metrics)
+                raise  # checkpoints are kept for a resumed run (or the TTL index)
 
-    # ─────────────────────── public entry point ─────────────────────── #
+    def _clear_checkpoints(self) -> None:
+        """Called after a complete run: nothing is left to resume, so the page OCR text goes."""
+        try:
+            self.checkpoints_col.delete_many({"professorUploadId": self.prof_doc["_id"]})
+        except PyMongoError as e:
+            print(f"Python (ProfessorUploadHandler): ⚠ could not delete page checkpoints for doc {self.prof_doc['_id']} "
+                  f"(they expire after {CHECKPOINT_TTL_HOURS:g}h): {e}")
+
+    def _run(self, job_metrics: metrics.JobMetrics) -> None:
+        upload_filter = {"professorUploadId": self.prof_doc["_id"]}
+        try:
+            if self.resume:
+                # A resumed run keeps what the interrupted one stored and OCR'd.
+                self._load_checkpoints()
+            else:
+                # A fresh run replaces whatever a previous run stored for this upload.
+                self.answers_col.delete_many(upload_filter)
+                self.checkpoints_col.delete_many(upload_filter)
+        except PyMongoError as e:
+            print(f"Python (ProfessorUploadHandler): ⛔ Could not {'load' if self.resume else 'clear'} previous answers for doc {self.prof_doc['_id']}: {e}")
+            raise
 
-    def run(self) -> None: # Content is identical to original, but now uses the targeted self.prof_doc
-        """Main driver — decides mode & updates DB."""
         if not self.script_paths: # Check if script_paths ended up empty
             print(f"Python (ProfessorUploadHandler): No student script paths found or resolved for doc {self.prof_doc['_id']}. Aborting run.")
-            students_payload = []
+            stored_count = 0
         elif len(self.script_paths) == 1:
             print(f"Python (ProfessorUploadHandler): 📝 Found 1 script path. Treating as ONE combined PDF for doc {self.prof_doc['_id']}.")
-            students_payload = self._process_combined_pdf(self.script_paths[0])
+            stored_count = self._process_combined_pdf(self.script_paths[0])
         else:
             print(f"Python (ProfessorUploadHandler): 📝 Found {len(self.script_paths)} script paths. Treating as MANY PDFs for doc {self.prof_doc['_id']}.")
-            students_payload = []
-            for path_idx, path_val in enumerate(self.script_paths):
-                print(f"Python (ProfessorUploadHandler):   → Processing PDF {path_idx+1}/{len(self.script_paths)}: {os.path.basename(path_val)}")
-                try:
-                    students_payload.append(self._process_single_pdf(path_val))
-                except Exception as e:
-                    print(f"Python (ProfessorUploadHandler):   ⚠ skipped {os.path.basename(path_val)}: {e}")
-
-        if students_payload:
-            print(f"Python (ProfessorUploadHandler): Sorting extracted answers for all students before DB update.")
-            for student_data in students_payload:
-                if student_data.get("answers"):
-                    # Sort the 'answers' list in-place based on the 'question_no' field
-                    student_data["answers"].sort(key=lambda x: natural_sort_key(x.get("question_no", "0")))
-        
-        if not students_payload:
-            print(f"Python (ProfessorUploadHandler): No student data extracted for doc {self.prof_doc['_id']}. Aborting DB update for 'students' field.")
-            print(f"Python (ProfessorUploadHandler): No student data extracted. Proceeding to update doc {self.prof_doc['_id']} with empty students list.")
+            stored_count = self._process_many_pdfs(self.script_paths)
+
+        if self.resume:
+            stored_count = self.answers_col.count_documents(upload_filter)  # this run's + the previous run's
+            self._roll_collisions = sum(len(d.get("duplicates", [])) for d in self.answers_col.find(
+                {**upload_filter, "rollCollision": True}, {"duplicates.source": 1}))
+        if not stored_count:
+            print(f"Python (ProfessorUploadHandler): No student data extracted. Proceeding to update doc {self.prof_doc['_id']} with an empty student count.")
 
         try:
             update_fields = {
-                "students": students_payload,
-                "processedAt": datetime.utcnow()
+                "studentAnswersCollection": STUDENT_ANSWERS_COLLECTION_NAME,
+                "studentAnswersCount": stored_count,
+                "studentRollCollisions": self._roll_collisions,
+                "studentScriptsSkipped": self._skipped_units,  # failed scripts / chunks; re-run to retry them
+                "processedAt": datetime.utcnow(),
+                f"processingMetrics.{job_metrics.name}": job_metrics.summary(),
             }
-            if not students_payload:
+            if not stored_count:
                 update_fields["status"] = "student_scripts_processed_nodata" # Example status
 
+            # The per-student answers now live in their own collection; drop the legacy embedded array.
             result = self.prof_col.update_one(
                 {"_id": self.prof_doc["_id"]},
-                {"$set": update_fields},
+                {"$set": update_fields, "$unset": {"students": ""}},
             )
             if result.matched_count == 0:
                  print(f"Python (ProfessorUploadHandler): ⛔ MongoDB update failed: Document with ID {self.prof_doc['_id']} not found for update.")
-            elif result.modified_count == 0 and result.matched_count == 1:
-                 print(f"Python (ProfessorUploadHandler): 🤔 MongoDB: Document {self.prof_doc['_id']} found but not modified (data might be the same, or empty payload resulted in no change). Storing {len(students_payload)} students.")
             else:
-                 print(f"Python (ProfessorUploadHandler): ✅ MongoDB updated for doc {self.prof_doc['_id']}: {len(students_payload)} students stored.")
+                 print(f"Python (ProfessorUploadHandler): ✅ MongoDB updated for doc {self.prof_doc['_id']}: {stored_count} students stored in '{STUDENT_ANSWERS_COLLECTION_NAME}'.")
+            if self._skipped_units:
+                print(f"Python (ProfessorUploadHandler): {self._skipped_units} script(s) / chunk(s) skipped; page checkpoints kept "
+                      f"for a resumed run (expire after {CHECKPOINT_TTL_HOURS:g}h).")
+            else:
+                self._clear_checkpoints()
 
         except PyMongoError as e:
             # For an API, raising RuntimeError might be too harsh. Log it.
@@ -278,12 +666,14 @@ if __name__ == "__main__":
     # For CLI execution, allow passing an ID or default to latest.
     parser = argparse.ArgumentParser(description="Process professor-uploaded student scripts.")
     parser.add_argument("--id", help="MongoDB ObjectId of the professor upload document to process.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep the students and page checkpoints of a previous run; process only what is missing.")
     cli_args = parser.parse_args()
 
     print(f"Python (studentScripts.py CLI): Running with ID: {cli_args.id if cli_args.id else 'Latest (default)'}")
     
     try:
-        handler = ProfessorUploadHandler(professor_upload_id=cli_args.id)
+        handler = ProfessorUploadHandler(professor_upload_id=cli_args.id, resume=cli_args.resume)
         handler.run()
         print("Python (studentScripts.py CLI): Processing finished.")
     except Exception as e_main:
@@ -0,0 +1,9 @@
+"""
+The extract scripts import each other as top-level modules (they run with
+backend/extract as the working directory), so the tests put that directory on
+sys.path the same way.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
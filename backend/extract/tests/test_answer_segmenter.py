@@ -0,0 +1,72 @@
+"""
+answer_segmenter.segment and IncrementalSegmenter must give exactly what the
+original regex chain (segment_regex_chain) gives: the answers they cut are
+what gets graded. Seeded synthetic scripts (benchmark_segmenter's generator)
+plus the edge cases that once differed.
+"""
+import random
+
+import pytest
+
+import answer_segmenter
+from benchmark_segmenter import as_pages, run_segmenter, segment_incrementally, synthetic_script
+
+SEEDS = range(20)
+SCRIPTS_PER_SEED = 25
+
+EDGE_CASES = [
+    "Q1. first\n2 bare number after text\nQ3) third",
+    "Answer 1 text\nQ2a) sub\n2b. next\n3) last",
+    "Q1\n4 bare right after a heading\nmore",
+    "textanswer 7\nglued heading\nnext line",
+    "textanswer\n7\nnewline in the gap",
+    "textanswer 7B\nuppercase id letter",
+    "textanswer 7b \nlowercase id letter",
+    "Ques 5: \u212a and \u017folution 6 unicode folds",
+    "\u017folution 2 long s\nSolution 3 plain",
+    "no headings at all here",
+    "",
+    "1. one\n1. repeated id\n10) ten",
+]
+
+
+def _corpus():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        for i in range(SCRIPTS_PER_SEED):
+            yield f"seed{seed}-{i}", synthetic_script(rng)
+    for i, text in enumerate(EDGE_CASES):
+        yield f"edge{i}", text
+
+
+CORPUS = list(_corpus())
+
+
+@pytest.mark.parametrize("name,text", CORPUS, ids=[name for name, _ in CORPUS])
+def test_single_pass_matches_regex_chain(name, text):
+    assert run_segmenter(answer_segmenter.segment, text) == run_segmenter(answer_segmenter.segment_regex_chain, text)
+
+
+@pytest.mark.parametrize("page_lines", [1, 3, 40])
+def test_incremental_matches_single_pass(page_lines):
+    for name, text in CORPUS:
+        pages = as_pages(text, page_lines)
+        expected = run_segmenter(answer_segmenter.segment, "\n".join(pages))
+        assert run_segmenter(segment_incrementally, pages) == expected, name
+
+
+def test_buffered_matches_regex_chain():
+    for name, text in CORPUS:
+        segmenter = answer_segmenter.BufferedSegmenter()
+        for page in as_pages(text, 3):
+            assert segmenter.feed(page) == []
+        assert run_segmenter(lambda _: segmenter.close(), None) == run_segmenter(answer_segmenter.segment_regex_chain, text), name
+
+
+def test_no_markers_raises():
+    with pytest.raises(ValueError):
+        answer_segmenter.segment("plain prose without any question heading")
+    segmenter = answer_segmenter.IncrementalSegmenter()
+    segmenter.feed("plain prose")
+    with pytest.raises(ValueError):
+        segmenter.close()
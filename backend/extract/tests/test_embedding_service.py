@@ -0,0 +1,95 @@
+"""
+A long-running caller keeps its encoder from get_encoder() for the life of the
+process; it must survive the embedding service being restarted or killed
+between calls. The service runs in a separate (spawned) process with a stub model.
+"""
+import multiprocessing
+import os
+import secrets
+import time
+
+import numpy as np
+import pytest
+
+import embedding_service
+
+MODEL = embedding_service.DEFAULT_MODEL_NAME
+DIM = 4
+
+
+class StubModel:
+    def __init__(self, fill):
+        self.fill = fill
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, sentences, **_kwargs):
+        single = isinstance(sentences, str)
+        vectors = np.full((1 if single else len(sentences), DIM), self.fill, dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+def _serve(address, authkey, fill):
+    embedding_service.EMBEDDING_SERVICE_AUTHKEY = authkey
+    embedding_service.load_model = lambda *_args, **_kwargs: StubModel(fill)
+    embedding_service.EmbeddingService(MODEL, "torch").serve_forever(address)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    address = str(tmp_path / "embeddings.sock")
+    monkeypatch.setattr(embedding_service, "EMBEDDING_SERVICE_ADDRESS", address)
+    monkeypatch.setattr(embedding_service, "EMBEDDING_SERVICE_AUTHKEY", secrets.token_hex(16).encode())
+    monkeypatch.setattr(embedding_service, "EMBEDDING_BACKEND", "torch")
+    monkeypatch.setattr(embedding_service, "_encoders", {})
+    # The in-process fallback: a different fill value tells it apart from the service.
+    monkeypatch.setattr(embedding_service, "load_model", lambda *_args, **_kwargs: StubModel(-1.0))
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+
+    def start(fill):
+        if os.path.exists(address):
+            os.remove(address)
+        process = ctx.Process(target=_serve, args=(address, embedding_service.EMBEDDING_SERVICE_AUTHKEY, fill), daemon=True)
+        process.start()
+        processes.append(process)
+        deadline = time.time() + 10
+        while not os.path.exists(address):
+            assert time.time() < deadline, "embedding service did not start"
+            time.sleep(0.02)
+        return process
+
+    def kill(process):
+        process.kill()
+        process.join(5)
+
+    yield start, kill
+    for process in processes:
+        if process.is_alive():
+            kill(process)
+
+
+def test_falls_back_in_process_when_service_is_killed(service):
+    start, kill = service
+    kill_me = start(1.0)
+    encoder = embedding_service.get_encoder(MODEL)
+    assert isinstance(encoder, embedding_service.SharedEncoder)
+    assert encoder.encode(["a", "b"]).tolist() == [[1.0] * DIM] * 2
+
+    kill(kill_me)
+    assert encoder.encode(["a", "b"]).tolist() == [[-1.0] * DIM] * 2
+    assert encoder.encode("c").tolist() == [-1.0] * DIM
+    assert embedding_service.get_encoder(MODEL) is encoder
+
+
+def test_reconnects_when_service_restarts(service):
+    start, kill = service
+    first = start(1.0)
+    encoder = embedding_service.get_encoder(MODEL)
+    assert encoder.encode(["a"]).tolist() == [[1.0] * DIM]
+
+    kill(first)
+    start(2.0)
+    assert encoder.encode(["a"]).tolist() == [[2.0] * DIM]
+    assert encoder.encode(["b", "c"]).tolist() == [[2.0] * DIM] * 2
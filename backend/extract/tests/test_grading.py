@@ -0,0 +1,58 @@
+"""
+grading.grade_scores must award exactly what the original per-row score_rule
+of Combined_Results / Marksheet_Generator did with the default bands, and
+grade_dataframe / percentage_column must handle the columns the same way.
+"""
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import grading
+
+pytestmark = pytest.mark.skipif(bool(os.getenv("SCORE_BANDS")), reason="SCORE_BANDS overrides the default bands")
+
+
+def score_rule(sim, max_m):
+    """The scalar rule grading.py replaced, verbatim."""
+    sim = float(sim) if sim is not None else 0.0
+    max_m = int(max_m) if max_m is not None else 0
+    if sim >= 0.90: pct = 1.00
+    elif sim >= 0.80: pct = 0.90
+    elif sim >= 0.70: pct = 0.75
+    elif sim >= 0.60: pct = 0.65
+    elif sim >= 0.50: pct = 0.60
+    elif sim >= 0.45: pct = 0.50
+    else: pct = 0.0
+    return int(round(pct * max_m))
+
+
+def test_default_bands_in_use():
+    assert grading.SCORE_BANDS == grading.DEFAULT_SCORE_BANDS
+
+
+def test_grade_scores_matches_score_rule():
+    rng = random.Random(0)
+    thresholds = [t for t, _ in grading.DEFAULT_SCORE_BANDS]
+    # Random similarities plus every threshold and its float neighbours.
+    sims = [rng.uniform(-0.2, 1.2) for _ in range(5000)]
+    sims += [v for t in thresholds for v in (np.nextafter(t, -1), t, np.nextafter(t, 2))]
+    sims += [0.0, 1.0, -1.0]
+    max_marks = [rng.choice([0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 16, 20, 25]) for _ in sims]
+    expected = [score_rule(s, m) for s, m in zip(sims, max_marks)]
+    assert grading.grade_scores(sims, max_marks).tolist() == expected
+
+
+def test_missing_values_score_zero():
+    assert grading.grade_scores([np.nan, 0.95], [10, np.nan]).tolist() == [0, 0]
+
+
+def test_grade_dataframe_coerces_columns():
+    df = pd.DataFrame({"similarity": [0.91, "0.55", None, "bad"], "max_marks": [10, "4", 5, 5]})
+    assert grading.grade_dataframe(df)["score"].tolist() == [10, 2, 0, 0]
+
+
+def test_percentage_column():
+    assert grading.percentage_column([5, 7, 3], [10, 9, 0]).tolist() == [50.0, 77.78, 0.0]
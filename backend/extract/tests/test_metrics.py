@@ -0,0 +1,19 @@
+"""render_prometheus must export counter totals without losing digits."""
+import metrics
+
+
+def _sample(text, metric):
+    return next(line.split(" ", 1)[1] for line in text.splitlines() if line.startswith(metric + "{") or line.startswith(metric + " "))
+
+
+def test_counters_keep_every_digit(monkeypatch):
+    monkeypatch.setattr(metrics, "_counters", {})
+    metrics.increment("llm_prompt_tokens", 12345678, model="m")
+    metrics.increment("vision_upload_bytes", 9876543210)
+    metrics.increment("rag_context_tokens", 0.1)
+    metrics.increment("rag_context_tokens", 0.2)
+    text = metrics.render_prometheus()
+    prefix = metrics.METRIC_PREFIX
+    assert _sample(text, f"{prefix}_llm_prompt_tokens_total") == "12345678"
+    assert _sample(text, f"{prefix}_vision_upload_bytes_total") == "9876543210"
+    assert float(_sample(text, f"{prefix}_rag_context_tokens_total")) == 0.1 + 0.2
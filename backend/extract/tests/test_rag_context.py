@@ -0,0 +1,84 @@
+"""
+rag_context.assemble_context may drop repeated text but never other text: the
+spans it sends must be exactly the book lines covered by the chosen hits, in
+book order, within the token budget. Checked against a line-range reference on
+sliding line windows (the "lines" chunking of Answer_from_book).
+"""
+import random
+
+import rag_context
+
+WINDOW_LINES = 15
+STEP_LINES = 5
+BOOK_LINES = 400
+
+
+def _book():
+    lines = [f"l{i}a l{i}b l{i}c" for i in range(BOOK_LINES)]  # unique words: any repeat is a merge bug
+    windows = ["\n".join(lines[s:s + WINDOW_LINES]) for s in range(0, BOOK_LINES - WINDOW_LINES + 1, STEP_LINES)]
+    return lines, windows
+
+
+def _words(text):
+    return text.split()
+
+
+def _expected_spans(lines, indices):
+    """Windows sharing lines (index gap <= 2 at 15/5) form one span covering their line range."""
+    groups = []
+    for idx in sorted(indices):
+        if groups and idx - groups[-1][-1] <= (WINDOW_LINES - 1) // STEP_LINES:
+            groups[-1].append(idx)
+        else:
+            groups.append([idx])
+    return [_words(" ".join(lines[g[0] * STEP_LINES:g[-1] * STEP_LINES + WINDOW_LINES])) for g in groups]
+
+
+def test_merged_spans_cover_exactly_the_hit_lines():
+    lines, windows = _book()
+    rng = random.Random(0)
+    for _ in range(200):
+        indices = rng.sample(range(len(windows)), rng.randint(1, 8))
+        hits = [(i, rng.random()) for i in indices]
+        context = rag_context.assemble_context(hits, windows, token_budget=10**6, max_chunks=len(hits))
+        spans = context["text"].split(rag_context.CONTEXT_SEPARATOR)
+        assert [_words(s) for s in spans] == _expected_spans(lines, indices)
+        assert context["chunks"] == len(indices) and context["spans"] == len(spans)
+        assert context["tokens"] == rag_context.estimate_tokens(context["text"])
+
+
+def test_short_shared_run_is_not_merged():
+    shared = " ".join(f"s{i}" for i in range(rag_context.MIN_OVERLAP_WORDS - 1))
+    a, b = f"alpha beta {shared}", f"{shared} gamma delta"
+    assert rag_context.merge_overlapping(a, b) is None
+    context = rag_context.assemble_context([(0, 0.9), (1, 0.8)], [a, b], 10**6, 5)
+    assert context["text"] == a + rag_context.CONTEXT_SEPARATOR + b
+
+
+def test_repeated_heading_is_sent_once():
+    body = " ".join(f"w{i}" for i in range(30))
+    a = "Chapter 2 Scheduling\n" + body
+    b = "Chapter 2 Scheduling\n" + " ".join(body.split()[10:]) + " tail1 tail2"
+    assert rag_context.merge_overlapping(a, b) == a + " tail1 tail2"
+
+
+def test_budget_keeps_best_hits_and_cuts_an_oversized_one():
+    _, windows = _book()
+    one = max(rag_context.estimate_tokens(w) for w in windows)
+    hits = [(30, 0.9), (5, 0.8), (50, 0.7)]
+    budget = 2 * one + rag_context.estimate_tokens(rag_context.CONTEXT_SEPARATOR)
+    context = rag_context.assemble_context(hits, windows, token_budget=budget, max_chunks=5)
+    assert context["chunks"] == 2 and context["tokens"] <= budget
+    assert context["text"] == windows[5] + rag_context.CONTEXT_SEPARATOR + windows[30]  # best two, in book order
+
+    context = rag_context.assemble_context([(7, 0.9)], windows, token_budget=one // 2, max_chunks=5)
+    assert windows[7].startswith(context["text"]) and 0 < context["tokens"] <= one // 2
+
+
+def test_max_chunks_and_invalid_hits():
+    _, windows = _book()
+    hits = [(-1, 1.0), (len(windows), 1.0), (3, 0.9), (3, 0.8), (40, 0.7), (60, 0.6)]
+    context = rag_context.assemble_context(hits, windows, token_budget=10**6, max_chunks=2)
+    assert context["chunks"] == 2
+    assert context["text"] == windows[3] + rag_context.CONTEXT_SEPARATOR + windows[40]
+    assert rag_context.assemble_context([], windows, 100, 5)["text"] == ""
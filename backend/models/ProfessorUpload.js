@@ -79,6 +79,8 @@ const professorUploadSchema = new mongoose.Schema({
         type: Object,
         default: {}
     },
+    // Legacy: per-student answers are now stored in the 'professorstudentanswers'
+    // collection (one document per professorUploadId + roll_no) by studentScripts.py.
     students: {
         type: [{ // Defines an array of student data objects
             roll_no: {
@@ -102,6 +104,15 @@ const professorUploadSchema = new mongoose.Schema({
         }],
         default: [] // The main students array defaults to empty; populated by your Python script
     },
+    // Summary written by studentScripts.py once all student scripts are processed
+    studentAnswersCount: {
+        type: Number
+    },
+    // Per-job stage timings written by the Python scripts (see backend/extract/metrics.py),
+    // e.g. processingMetrics.professorScripts.stages.ocr.totalSec
+    processingMetrics: {
+        type: Object
+    },
     // Timestamp when the record was created/uploaded
     uploadedAt: {
         type: Date,
@@ -295,7 +295,7 @@ router.get('/combined-class-status/:profUploadId', authenticateToken, authorizeR
         }
 
         const profUpload = await ProfessorUpload.findById(profUploadId)
-            .select('combinedResultGenerationStatus combinedClassResultPdfGridFsId combinedClassResultCsvGridFsId combinedResultErrorMessage combinedResultStudentProcessedCount combinedResultStudentFailedOrSkippedCount uploadedAt subject examType') // Added some more fields for context
+            .select('combinedResultGenerationStatus combinedClassResultPdfGridFsId combinedClassResultCsvGridFsId combinedResultErrorMessage combinedResultStudentProcessedCount combinedResultStudentFailedOrSkippedCount combinedResultUngradedDuplicateCount combinedResultUngradedDuplicateRollNos uploadedAt subject examType') // Added some more fields for context
             .lean(); 
 
         if (!profUpload) {
@@ -308,6 +308,9 @@ router.get('/combined-class-status/:profUploadId', authenticateToken, authorizeR
             csvId: profUpload.combinedClassResultCsvGridFsId,
             studentsProcessed: profUpload.combinedResultStudentProcessedCount,
             studentsFailed: profUpload.combinedResultStudentFailedOrSkippedCount,
+            // Scripts read with a roll number another script already had: stored for review, not graded.
+            duplicateRollScriptsNotGraded: profUpload.combinedResultUngradedDuplicateCount || 0,
+            duplicateRollNos: profUpload.combinedResultUngradedDuplicateRollNos || [],
             examDetails: { // Provide some context back to the frontend
                 subject: profUpload.subject,
                 examType: profUpload.examType,
@@ -356,10 +359,12 @@ router.get('/download/:fileId', async (req, res) => {
         console.log(`Node.js (Download): Found file ${fileInfo.filename} (ID: ${fileIdString}) in bucket '${fileSourceBucketName}'.`);
 
 
-        const cleanFilename = path.basename(fileInfo.filename || `file-${fileIdString}.${fileInfo.contentType === 'text/csv' ? 'csv' : 'pdf'}`).replace(/[^a-zA-Z0-9._-]/g, '_');
+        // Python writes contentType into metadata (GridFSBucket uploads); older files have it top-level.
+        const contentType = fileInfo.contentType || (fileInfo.metadata && fileInfo.metadata.contentType);
+        const cleanFilename = path.basename(fileInfo.filename || `file-${fileIdString}.${contentType === 'text/csv' ? 'csv' : 'pdf'}`).replace(/[^a-zA-Z0-9._-]/g, '_');
 
         res.set({
-            'Content-Type': fileInfo.contentType || 'application/octet-stream', 
+            'Content-Type': contentType || 'application/octet-stream', 
             'Content-Disposition': `inline; filename="${cleanFilename}"`, 
         });
         const downloadStream = targetBucket.openDownloadStream(fileId);